@@ -1,5 +1,3 @@
 """Remotepixel tiler."""
 
-import pkg_resources
-
-version = pkg_resources.get_distribution(__package__).version
+version = "5.0.1"
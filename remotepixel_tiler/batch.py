@@ -0,0 +1,107 @@
+"""remotepixel_tiler.batch: render many tiles in one request."""
+
+from typing import Callable, List, Tuple
+
+import os
+import json
+import struct
+import logging
+from concurrent import futures
+
+logger = logging.getLogger(__name__)
+
+BATCH_THREADS = int(os.environ.get("BATCH_THREADS", 8))
+BATCH_MAX_TILES = int(os.environ.get("BATCH_MAX_TILES", 256))
+
+# Each tile of a batch response is a big-endian (z, x, y, length) header
+# followed by `length` bytes of image. A length of 0 marks a failed tile.
+RECORD_HEADER = struct.Struct(">BIII")
+
+
+class BatchError(Exception):
+    """Invalid batch request."""
+
+
+def parse_tiles(body: str) -> List[Tuple[int, int, int]]:
+    """
+    Parse a batch request body.
+
+    The body is a JSON list of tiles, as `[z, x, y]` lists or "z/x/y" strings,
+    or an object with such a list under "tiles".
+
+    """
+    try:
+        tiles = json.loads(body or "[]")
+    except ValueError:
+        raise BatchError("Batch body must be JSON")
+
+    if isinstance(tiles, dict):
+        tiles = tiles.get("tiles", [])
+
+    try:
+        tiles = [
+            tuple(int(v) for v in (t.split("/") if isinstance(t, str) else t))
+            for t in tiles
+        ]
+    except (TypeError, ValueError):
+        raise BatchError("Tiles must be [z, x, y] lists or 'z/x/y' strings")
+
+    if not tiles or any(len(t) != 3 for t in tiles):
+        raise BatchError("Batch body must list [z, x, y] tiles")
+
+    if len(tiles) > BATCH_MAX_TILES:
+        raise BatchError(f"Batch is limited to {BATCH_MAX_TILES} tiles")
+
+    # z, x and y must fit the uint8/uint32 record header
+    for z, x, y in tiles:
+        size = 2 ** min(max(z, 0), 32)
+        if not (0 <= z <= 255 and 0 <= x < size and 0 <= y < size):
+            raise BatchError(f"Invalid tile {z}/{x}/{y}")
+
+    return tiles
+
+
+def pack_tiles(tiles: List[Tuple[Tuple[int, int, int], bytes]]) -> bytes:
+    """Return the length-prefixed batch payload of ((z, x, y), content) tiles."""
+    return b"".join(
+        RECORD_HEADER.pack(z, x, y, len(content)) + content
+        for (z, x, y), content in tiles
+    )
+
+
+def unpack_tiles(payload: bytes) -> List[Tuple[Tuple[int, int, int], bytes]]:
+    """Parse a batch payload written by `pack_tiles`."""
+    tiles = []
+    offset = 0
+    while offset < len(payload):
+        z, x, y, length = RECORD_HEADER.unpack_from(payload, offset)
+        offset += RECORD_HEADER.size
+        tiles.append(((z, x, y), payload[offset:offset + length]))
+        offset += length
+    return tiles
+
+
+def render_batch(handler: Callable, body: str, **params) -> bytes:
+    """
+    Render the tiles listed in `body` with a tile route handler.
+
+    Tiles are rendered in parallel by `handler(z=z, x=x, y=y, **params)`, so
+    they share the handler caches and the pool of open datasets.
+
+    """
+    tiles = parse_tiles(body)
+
+    def _render(tile: Tuple[int, int, int]) -> bytes:
+        z, x, y = tile
+        try:
+            status, _, content = handler(z=z, x=x, y=y, **params)
+        except Exception as err:
+            logger.warning(f"Batch tile {z}/{x}/{y} failed: {err}")
+            return b""
+
+        return content if status == "OK" else b""
+
+    with futures.ThreadPoolExecutor(max_workers=BATCH_THREADS) as executor:
+        contents = list(executor.map(_render, tiles))
+
+    return pack_tiles(list(zip(tiles, contents)))
@@ -0,0 +1,655 @@
+"""remotepixel_tiler.cache: rendered tiles and metadata response caches."""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import os
+import time
+import socket
+import inspect
+import hashlib
+import logging
+import tempfile
+import threading
+from functools import partial, wraps
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+Response = Tuple[str, str, Any]
+
+
+def cache_key(route: str, **params: Any) -> str:
+    """Return a normalized cache key for a route and its parameters."""
+    query = "&".join(
+        f"{k}={v}" for k, v in sorted(params.items()) if v is not None and v != ""
+    )
+    return hashlib.sha1(f"{route}?{query}".encode()).hexdigest()
+
+
+def _dumps(value: Response) -> bytes:
+    """Serialize a response as its content type, a newline and the body."""
+    _, content_type, body = value
+    if isinstance(body, str):
+        body = body.encode()
+    return content_type.encode() + b"\n" + body
+
+
+def _loads(content: bytes) -> Response:
+    """Deserialize a response written by `_dumps`."""
+    content_type, body = content.split(b"\n", 1)
+    content_type = content_type.decode()
+    if content_type.startswith(("application/json", "text/")):
+        body = body.decode()
+    return ("OK", content_type, body)
+
+
+class BaseCache(object):
+    """
+    Cache backend interface.
+
+    Backends store successful `(status, content_type, body)` handler responses
+    by key and must never raise on `get` or `set`: a failing cache is a miss.
+
+    """
+
+    def __init__(self):
+        """Initialize cache."""
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Response]:
+        """Return a cached response."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Response) -> None:
+        """Cache a response."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        """Return cache statistics."""
+        return dict(hits=self.hits, misses=self.misses)
+
+
+class MemoryCache(BaseCache):
+    """Thread-safe in-memory LRU cache of responses, bounded in bytes."""
+
+    def __init__(self, max_size: int = 0):
+        """Initialize cache."""
+        super().__init__()
+        self.max_size = max_size
+        self.size = 0
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached responses."""
+        return len(self._items)
+
+    def get(self, key: str) -> Optional[Response]:
+        """Return a cached response."""
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Response) -> None:
+        """Cache a response, evicting least recently used ones over budget."""
+        nbytes = len(value[2])
+        if nbytes > self.max_size:
+            return
+
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[2])
+
+            self._items[key] = value
+            self.size += nbytes
+            while self.size > self.max_size:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted[2])
+
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def stats(self) -> Dict:
+        """Return cache statistics."""
+        stats = super().stats()
+        stats.update(count=len(self._items), size=self.size, max_size=self.max_size)
+        return stats
+
+
+class DiskCache(BaseCache):
+    """
+    Content-addressed on-disk LRU cache of responses, bounded in bytes.
+
+    Each response is stored in `{directory}/{key[:2]}/{key}`. Files are written
+    to a temporary file and renamed so concurrent readers never see partial
+    content.
+
+    The directory can be shared by several processes (e.g. `--workers`): on
+    writes, the index is rebuilt from the directory every `rescan_interval`
+    seconds before evicting, so `max_size` bounds the files of all processes,
+    give or take the writes of the other processes since the last scan.
+
+    """
+
+    def __init__(self, directory: str, max_size: int = 0, rescan_interval: float = 10):
+        """Initialize cache."""
+        super().__init__()
+        self.directory = directory
+        self.max_size = max_size
+        self.rescan_interval = rescan_interval
+        self.size = 0
+        self._items: Optional[OrderedDict] = None
+        self._scanned = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached responses."""
+        with self._lock:
+            return len(self._index())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _index(self) -> OrderedDict:
+        """Return the key -> size index, scanning the directory on first use."""
+        if self._items is None:
+            entries = []
+            top = os.path.normpath(self.directory)
+            for root, _, files in os.walk(top):
+                # Only `{key[:2]}` shards hold responses
+                if os.path.dirname(root) != top:
+                    continue
+                shard = os.path.basename(root)
+                for name in files:
+                    if name.startswith(".") or not name.startswith(shard):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, name, stat.st_size))
+
+            self._items = OrderedDict((name, size) for _, name, size in sorted(entries))
+            self.size = sum(self._items.values())
+            self._scanned = time.monotonic()
+
+        return self._items
+
+    def _evict(self) -> None:
+        """Remove least recently used files until the cache fits its budget."""
+        if time.monotonic() - self._scanned >= self.rescan_interval:
+            # Count (and order) the files written by other processes
+            self._items = None
+
+        items = self._index()
+        while self.size > self.max_size and items:
+            key, nbytes = items.popitem(last=False)
+            self.size -= nbytes
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> Optional[Response]:
+        """Return a cached response."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                response = _loads(f.read())
+        except (OSError, ValueError) as err:
+            if not isinstance(err, FileNotFoundError):
+                # Unreadable or corrupt file, drop it
+                logger.warning(f"Could not read cache file: {err}")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+            with self._lock:
+                self.misses += 1
+                nbytes = self._index().pop(key, None)
+                if nbytes is not None:
+                    self.size -= nbytes
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+            items = self._index()
+            if key in items:
+                items.move_to_end(key)
+
+        return response
+
+    def set(self, key: str, value: Response) -> None:
+        """Cache a response, evicting least recently used ones over budget."""
+        content = _dumps(value)
+        if len(content) > self.max_size:
+            return
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+        except OSError as err:
+            logger.warning(f"Could not write cache file: {err}")
+            return
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            logger.warning(f"Could not write cache file: {err}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            items = self._index()
+            previous = items.pop(key, None)
+            if previous is not None:
+                self.size -= previous
+
+            items[key] = len(content)
+            self.size += len(content)
+            self._evict()
+
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        with self._lock:
+            for key in list(self._index()):
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            self._items.clear()
+            self.size = 0
+
+    def stats(self) -> Dict:
+        """Return cache statistics."""
+        with self._lock:
+            count = len(self._index())
+
+        stats = super().stats()
+        stats.update(count=count, size=self.size, max_size=self.max_size)
+        return stats
+
+
+class MemcachedCache(BaseCache):
+    """
+    Shared cache speaking the memcached text protocol.
+
+    Keys are spread over the servers by hash. Each thread keeps its own
+    connections; any network or protocol error drops the connection and is
+    treated as a cache miss. A failing server is then skipped (its keys being
+    misses) for `retry_interval` seconds, so a dead server doesn't add its
+    `timeout` to every request.
+
+    """
+
+    def __init__(
+        self,
+        servers: Sequence[str],
+        ttl: int = 3600,
+        timeout: float = 0.5,
+        max_item_size: int = 1024 * 1024,
+        retry_interval: float = 30,
+    ):
+        """Initialize cache."""
+        super().__init__()
+        self.servers = []
+        for server in servers:
+            host, _, port = server.strip().rpartition(":")
+            self.servers.append((host, int(port)))
+
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_item_size = max_item_size
+        self.retry_interval = retry_interval
+        self.errors = 0
+        self._down: Dict[Tuple[str, int], float] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _server(self, key: str) -> Tuple[str, int]:
+        return self.servers[int(key[:8], 16) % len(self.servers)]
+
+    def _available(self, server: Tuple[str, int]) -> bool:
+        """Check if a server is not marked down."""
+        with self._lock:
+            return self._down.get(server, 0) <= time.monotonic()
+
+    def _failed(self, server: Tuple[str, int], command: str, err: Exception) -> None:
+        """Drop the connection to a failing server and mark it down."""
+        logger.warning(f"Memcached {command} failed on {server}: {err}")
+        self._close(server)
+        with self._lock:
+            self.errors += 1
+            self._down[server] = time.monotonic() + self.retry_interval
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _connection(self, server: Tuple[str, int]):
+        """Return a (socket, file) connection to a server for this thread."""
+        connections = self._local.__dict__.setdefault("connections", {})
+        if server not in connections:
+            sock = socket.create_connection(server, timeout=self.timeout)
+            connections[server] = (sock, sock.makefile("rb"))
+        return connections[server]
+
+    def _close(self, server: Tuple[str, int]) -> None:
+        connections = self._local.__dict__.get("connections", {})
+        sock, rfile = connections.pop(server, (None, None))
+        if sock is not None:
+            rfile.close()
+            sock.close()
+
+    def get(self, key: str) -> Optional[Response]:
+        """Return a cached response."""
+        server = self._server(key)
+        if not self._available(server):
+            self._count(hit=False)
+            return None
+
+        try:
+            sock, rfile = self._connection(server)
+            sock.sendall(f"get {key}\r\n".encode())
+            line = rfile.readline()
+            if line == b"END\r\n":
+                self._count(hit=False)
+                return None
+
+            header = line.split()
+            if len(header) != 4 or header[0] != b"VALUE":
+                raise ValueError(f"Unexpected memcached response: {line!r}")
+
+            content = rfile.read(int(header[3]) + 2)[:-2]
+            if rfile.readline() != b"END\r\n":
+                raise ValueError("Unexpected memcached response")
+
+        except (OSError, ValueError) as err:
+            self._failed(server, "get", err)
+            self._count(hit=False)
+            return None
+
+        self._count(hit=True)
+        return _loads(content)
+
+    def set(self, key: str, value: Response) -> None:
+        """Cache a response."""
+        content = _dumps(value)
+        if len(content) > self.max_item_size:
+            return
+
+        server = self._server(key)
+        if not self._available(server):
+            return
+
+        try:
+            sock, rfile = self._connection(server)
+            command = f"set {key} 0 {self.ttl} {len(content)}\r\n".encode()
+            sock.sendall(command + content + b"\r\n")
+            line = rfile.readline()
+            if line not in (b"STORED\r\n", b"NOT_STORED\r\n"):
+                raise ValueError(f"Unexpected memcached response: {line!r}")
+
+        except (OSError, ValueError) as err:
+            self._failed(server, "set", err)
+
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        for server in self.servers:
+            try:
+                sock, rfile = self._connection(server)
+                sock.sendall(b"flush_all\r\n")
+                rfile.readline()
+            except OSError as err:
+                self._failed(server, "flush", err)
+
+    def stats(self) -> Dict:
+        """Return cache statistics."""
+        with self._lock:
+            now = time.monotonic()
+            down = sum(until > now for until in self._down.values())
+            return dict(hits=self.hits, misses=self.misses, errors=self.errors, down=down)
+
+
+def get_caches() -> List[BaseCache]:
+    """
+    Create the cache backends configured in the environment, fastest first.
+
+    TILE_CACHE_MAX_SIZE: in-memory cache size in bytes.
+    TILE_CACHE_DIR, TILE_CACHE_DISK_MAX_SIZE: on-disk cache directory and size.
+    MEMCACHED_SERVERS, MEMCACHED_TTL: comma separated host:port list and TTL.
+    MEMCACHED_RETRY_INTERVAL: seconds a failing memcached server is skipped.
+
+    """
+    caches: List[BaseCache] = []
+
+    max_size = int(os.environ.get("TILE_CACHE_MAX_SIZE", 0))
+    if max_size:
+        caches.append(MemoryCache(max_size=max_size))
+
+    directory = os.environ.get("TILE_CACHE_DIR")
+    max_size = int(os.environ.get("TILE_CACHE_DISK_MAX_SIZE", 0))
+    if directory and max_size:
+        caches.append(DiskCache(directory, max_size=max_size))
+
+    servers = os.environ.get("MEMCACHED_SERVERS")
+    if servers:
+        ttl = int(os.environ.get("MEMCACHED_TTL", 3600))
+        retry_interval = float(os.environ.get("MEMCACHED_RETRY_INTERVAL", 30))
+        caches.append(
+            MemcachedCache(servers.split(","), ttl=ttl, retry_interval=retry_interval)
+        )
+
+    return caches
+
+
+CACHES = get_caches()
+
+
+class _Flight(object):
+    """In-flight call shared by concurrent callers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(object):
+    """
+    Coalesce concurrent identical calls.
+
+    The first caller for a key runs the call, later callers wait up to
+    `timeout` seconds for its result (or exception) instead of repeating it.
+    Callers giving up waiting run the call themselves. A `timeout` of 0
+    disables coalescing.
+
+    """
+
+    def __init__(self, timeout: float = 10):
+        """Initialize coalescer."""
+        self.timeout = timeout
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of calls in flight."""
+        return len(self._flights)
+
+    def do(self, key: str, func: Callable, *args, **kwargs) -> Any:
+        """Return `func(*args, **kwargs)`, shared with concurrent calls for `key`."""
+        if self.timeout <= 0:
+            return func(*args, **kwargs)
+
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                self.calls += 1
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if leader:
+            try:
+                flight.result = func(*args, **kwargs)
+                return flight.result
+            except BaseException as err:
+                flight.error = err
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+
+        if not flight.done.wait(self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            logger.warning(f"Coalesced call {key} timed out, running it again")
+            return func(*args, **kwargs)
+
+        if flight.error is not None:
+            raise flight.error
+
+        return flight.result
+
+    def stats(self) -> Dict:
+        """Return coalescing statistics."""
+        return dict(
+            calls=self.calls,
+            coalesced=self.coalesced,
+            timeouts=self.timeouts,
+            in_flight=len(self._flights),
+        )
+
+
+FLIGHTS = SingleFlight(timeout=float(os.environ.get("TILE_COALESCE_TIMEOUT", 10)))
+
+
+_CALLS = threading.local()
+
+
+def cache_sibling(response: Response, **params: Any) -> None:
+    """
+    Cache a response of the `cached` handler being called, for other arguments.
+
+    `params` override the arguments of the current call, e.g. a tile handler
+    can cache the neighbouring tiles it rendered with `x=..., y=...`. Does
+    nothing outside of a `cached` handler call.
+
+    """
+    call = getattr(_CALLS, "current", None)
+    if call is None or response[0] != "OK":
+        return
+
+    route, arguments = call
+    key = cache_key(route, **dict(arguments, **params))
+    for backend in CACHES:
+        backend.set(key, response)
+
+
+def _lookup(key: str) -> Optional[Response]:
+    """Return a cached response, copying hits in slower backends to faster ones."""
+    for idx, backend in enumerate(CACHES):
+        response = backend.get(key)
+        if response is not None:
+            for faster in CACHES[:idx]:
+                faster.set(key, response)
+            return response
+    return None
+
+
+def cached(func: Callable = None, coalesce: Callable = None) -> Callable:
+    """
+    Decorator: serve a handler response from the configured caches.
+
+    The key is built from the handler name and all its arguments (defaults
+    included). A hit in a slower backend is copied to the faster ones, only
+    successful responses are cached. On a miss, concurrent calls with the
+    same key share a single handler call (see `SingleFlight`).
+
+    `coalesce(arguments)` can return the arguments of a call rendering many
+    responses (e.g. a metatile): concurrent calls coalesced on them wait for
+    it, then look for their own response in the caches.
+
+    """
+    if func is None:
+        return partial(cached, coalesce=coalesce)
+
+    route = f"{func.__module__}.{func.__name__}"
+    signature = inspect.signature(func)
+
+    def render(key: str, arguments: Dict, *args, **kwargs) -> Response:
+        _CALLS.current = (route, arguments)
+        try:
+            response = func(*args, **kwargs)
+        finally:
+            _CALLS.current = None
+
+        if response[0] == "OK":
+            for backend in CACHES:
+                backend.set(key, response)
+
+        return response
+
+    def render_group(key: str, *args, **kwargs) -> Tuple[str, Response]:
+        # A previous call of the group may have cached the response meanwhile
+        return key, _lookup(key) or render(key, *args, **kwargs)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs) -> Response:
+        params = signature.bind(*args, **kwargs)
+        params.apply_defaults()
+        key = cache_key(route, **params.arguments)
+
+        response = _lookup(key)
+        if response is not None:
+            return response
+
+        group = key
+        if coalesce is not None:
+            group = cache_key(route, **coalesce(params.arguments))
+
+        if group != key:
+            owner, response = FLIGHTS.do(
+                group, render_group, key, params.arguments, *args, **kwargs
+            )
+            response = response if owner == key else _lookup(key)
+            if response is not None:
+                return response
+
+        return FLIGHTS.do(key, render, key, params.arguments, *args, **kwargs)
+
+    return wrapper
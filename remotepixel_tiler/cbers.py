@@ -1,19 +1,44 @@
 """app.cbers: handle request for CBERS-tiler."""
 
-from typing import BinaryIO, Tuple, Union
+from typing import BinaryIO, Dict, Iterator, Tuple, Union
 
 import json
+from functools import partial
 
-from rio_tiler import cbers
-from rio_tiler.profiles import img_profiles
-from rio_tiler.utils import array_to_image, get_colormap, expression
-from aws_sat_api.search import cbers as cbers_search
+from remotepixel_tiler.utils import (
+    RAW_FORMATS,
+    _postprocess,
+    _empty_response,
+    _get_colormap,
+    _negotiate_webp,
+)
+from remotepixel_tiler.batch import BatchError, render_batch
+from remotepixel_tiler.cache import cached
+from remotepixel_tiler.metatile import (
+    metatile_params,
+    metatile_size,
+    read_metatile,
+    render_metatile,
+)
+from remotepixel_tiler.reader import expression, cbers_tile, cbers_metadata
+from remotepixel_tiler.stats import get_metadata
+from remotepixel_tiler.footprint import FOOTPRINTS
 
-from remotepixel_tiler.utils import _postprocess
+from remotepixel_tiler.proxy import API
+from remotepixel_tiler.warmup import lambda_handler, warmup
+from remotepixel_tiler.lazy import lazy_import
 
-from lambda_proxy.proxy import API
+cbers = lazy_import("rio_tiler.cbers")
+errors = lazy_import("rio_tiler.errors")
+aws_search = lazy_import("aws_sat_api.search")
 
 APP = API(name="cbers-tiler")
+WARMUP_OPTIONS = dict(expressions=("(b8-b7)/(b8+b7)",), dtype="uint8")
+
+
+def cbers_search(path: str, row: str) -> Iterator[Dict]:
+    """Search CBERS scenes, see `aws_sat_api.search.cbers`."""
+    return aws_search.cbers(path, row)
 
 
 class CbersTilerError(Exception):
@@ -50,9 +75,15 @@ def search(path: str, row: str) -> Tuple[str, str, str]:
     ttl=3600,
     tag=["metadata"],
 )
+@cached
 def bounds(scene: str) -> Tuple[str, str, str]:
     """Handle bounds requests."""
-    return ("OK", "application/json", json.dumps(cbers.bounds(scene)))
+    footprint = FOOTPRINTS.get(scene)
+    if footprint is None:
+        footprint = FOOTPRINTS.set(scene, cbers.bounds(scene)["bounds"])
+
+    info = {"sceneid": scene, "bounds": list(footprint.bounds)}
+    return ("OK", "application/json", json.dumps(info))
 
 
 @APP.route(
@@ -65,13 +96,23 @@ def bounds(scene: str) -> Tuple[str, str, str]:
     ttl=3600,
     tag=["metadata"],
 )
+@cached
 def metadata(
-    scene: str, pmin: Union[str, float] = 2., pmax: Union[str, float] = 98.
+    scene: str,
+    pmin: Union[str, float] = 2.,
+    pmax: Union[str, float] = 98.,
+    approx: Union[str, bool] = False,
+    max_size: Union[str, int] = None,
 ) -> Tuple[str, str, str]:
     """Handle metadata requests."""
     pmin = float(pmin) if isinstance(pmin, str) else pmin
     pmax = float(pmax) if isinstance(pmax, str) else pmax
-    info = cbers.metadata(scene, pmin, pmax)
+    approx = approx in ("true", "1") if isinstance(approx, str) else approx
+    if approx or max_size is not None:
+        max_size = int(max_size) if max_size is not None else 1024
+        info = get_metadata(cbers_metadata, scene, pmin, pmax, max_size=max_size)
+    else:
+        info = get_metadata(cbers.metadata, scene, pmin, pmax)
     return ("OK", "application/json", json.dumps(info))
 
 
@@ -95,6 +136,9 @@ def metadata(
     ttl=3600,
     tag=["tiles"],
 )
+@APP.pass_event
+@_negotiate_webp
+@cached(coalesce=metatile_params)
 def tile(
     scene: str,
     z: int,
@@ -107,40 +151,111 @@ def tile(
     rescale: str = None,
     color_formula: str = None,
     color_map: str = None,
+    compress: str = None,
+    webp: Union[str, bool] = False,
 ) -> Tuple[str, str, BinaryIO]:
     """Handle tile requests."""
     driver = "jpeg" if ext == "jpg" else ext
+    webp = webp in ("true", "1") if isinstance(webp, str) else webp
 
     if bands and expr:
         raise CbersTilerError("Cannot pass bands and expression")
 
     tilesize = scale * 256
 
-    if expr is not None:
-        tile, mask = expression(scene, x, y, z, expr=expr, tilesize=tilesize)
-    elif bands is not None:
-        tile, mask = cbers.tile(
-            scene, x, y, z, bands=tuple(bands.split(",")), tilesize=tilesize
+    if not FOOTPRINTS.intersects(scene, z, x, y):
+        return _empty_response(tilesize, ext, webp)
+
+    try:
+        if expr is not None:
+            read = partial(expression, scene, expr=expr)
+        elif bands is not None:
+            read = partial(cbers_tile, scene, bands=tuple(bands.split(",")))
+        else:
+            raise CbersTilerError("No bands nor expression given")
+
+        metatile, tile, mask = read_metatile(
+            read, x, y, z, tilesize, metatile_size(z, tilesize)
+        )
+    except errors.TileOutsideBounds:
+        return _empty_response(tilesize, ext, webp)
+
+    if not mask.any():
+        return _empty_response(tilesize, ext, webp)
+
+    if driver in RAW_FORMATS:
+        return render_metatile(
+            metatile, tile, mask, x, y, tilesize, ext, compress=compress
         )
-    else:
-        raise CbersTilerError("No bands nor expression given")
 
     rtile, rmask = _postprocess(
         tile, mask, rescale=rescale, color_formula=color_formula
     )
 
     if color_map:
-        color_map = get_colormap(color_map, format="gdal")
+        color_map = _get_colormap(color_map)
 
-    options = img_profiles.get(driver, {})
-    return (
-        "OK",
-        f"image/{ext}",
-        array_to_image(rtile, rmask, img_format=driver, color_map=color_map, **options),
+    return render_metatile(
+        metatile, rtile, rmask, x, y, tilesize, ext, color_map, webp
     )
 
 
+@APP.route(
+    "/tiles/<scene>/batch.<ext>",
+    methods=["POST"],
+    cors=True,
+    token=True,
+    binary_b64encode=True,
+    tag=["tiles"],
+)
+@APP.pass_event
+@_negotiate_webp
+def tiles_batch(
+    scene: str,
+    ext: str = "png",
+    body: str = None,
+    scale: Union[str, int] = 1,
+    bands: str = None,
+    expr: str = None,
+    rescale: str = None,
+    color_formula: str = None,
+    color_map: str = None,
+    compress: str = None,
+    webp: Union[str, bool] = False,
+) -> Tuple[str, str, bytes]:
+    """Handle batch tile requests, see `remotepixel_tiler.batch`."""
+    try:
+        content = render_batch(
+            tile,
+            body,
+            scene=scene,
+            scale=int(scale),
+            ext=ext,
+            bands=bands,
+            expr=expr,
+            rescale=rescale,
+            color_formula=color_formula,
+            color_map=color_map,
+            compress=compress,
+            webp=webp,
+        )
+    except BatchError as err:
+        return ("NOK", "application/json", json.dumps({"errorMessage": str(err)}))
+
+    return ("OK", "application/octet-stream", content)
+
+
+@APP.route("/warmup", methods=["GET"], cors=True, tag=["other"])
+def warmup_handler() -> Tuple[str, str, str]:
+    """Initialize GDAL, PROJ, colormaps and expressions, return timings."""
+    return ("OK", "application/json", json.dumps(warmup(**WARMUP_OPTIONS)))
+
+
 @APP.route("/favicon.ico", methods=["GET"], cors=True, tag=["other"])
 def favicon() -> Tuple[str, str, str]:
     """Favicon."""
     return ("EMPTY", "text/plain", "")
+
+
+# Lambda handler, warming the container up on scheduled events
+handler = lambda_handler(APP, **WARMUP_OPTIONS)
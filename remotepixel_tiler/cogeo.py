@@ -6,22 +6,38 @@ import os
 import re
 import json
 import urllib
+from functools import partial
 
 import numpy
 
-from rio_tiler import main
-
-import rasterio
-from rasterio import warp
+from remotepixel_tiler.batch import BatchError, render_batch
+from remotepixel_tiler.cache import cached
+from remotepixel_tiler.metatile import (
+    metatile_params,
+    metatile_size,
+    read_metatile,
+    render_metatile,
+)
+from remotepixel_tiler.reader import expression, main_tile, main_metadata
+from remotepixel_tiler.stats import get_metadata
+from remotepixel_tiler.footprint import FOOTPRINTS, dataset_footprint
+from remotepixel_tiler.utils import (
+    RAW_FORMATS,
+    _postprocess,
+    _empty_response,
+    _get_colormap,
+    _negotiate_webp,
+)
+from remotepixel_tiler.proxy import API
+from remotepixel_tiler.warmup import lambda_handler, warmup
+from remotepixel_tiler.lazy import lazy_import
 
-from rio_tiler.profiles import img_profiles
-from rio_tiler.mercator import get_zooms
-from rio_tiler.utils import array_to_image, get_colormap, expression
-from remotepixel_tiler.utils import _postprocess
-from lambda_proxy.proxy import API
+main = lazy_import("rio_tiler.main")
+errors = lazy_import("rio_tiler.errors")
 
 
 APP = API(name="cogeo-tiler")
+WARMUP_OPTIONS = dict(expressions=("(b2-b1)/(b2+b1)",), dtype="uint16")
 
 
 class TilerError(Exception):
@@ -47,18 +63,15 @@ def tilejson_handler(
     if qs:
         tile_url += f"?{qs}"
 
-    with rasterio.open(url) as src_dst:
-        bounds = warp.transform_bounds(
-            src_dst.crs, "epsg:4326", *src_dst.bounds, densify_pts=21
-        )
-        minzoom, maxzoom = get_zooms(src_dst)
-        center = [(bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2, minzoom]
+    footprint = FOOTPRINTS.get(url)
+    if footprint is None or footprint.minzoom is None:
+        footprint = FOOTPRINTS.set(url, *dataset_footprint(url))
 
     meta = dict(
-        bounds=bounds,
-        center=center,
-        minzoom=minzoom,
-        maxzoom=maxzoom,
+        bounds=footprint.bounds,
+        center=footprint.center,
+        minzoom=footprint.minzoom,
+        maxzoom=footprint.maxzoom,
         name=os.path.basename(url),
         tilejson="2.1.0",
         tiles=[tile_url],
@@ -75,9 +88,14 @@ def tilejson_handler(
     ttl=3600,
     tag=["metadata"],
 )
+@cached
 def bounds(url: str) -> Tuple[str, str, str]:
     """Handle bounds requests."""
-    info = main.bounds(url)
+    footprint = FOOTPRINTS.get(url)
+    if footprint is None:
+        footprint = FOOTPRINTS.set(url, main.bounds(url)["bounds"])
+
+    info = {"url": url, "bounds": list(footprint.bounds)}
     return ("OK", "application/json", json.dumps(info))
 
 
@@ -90,13 +108,23 @@ def bounds(url: str) -> Tuple[str, str, str]:
     ttl=3600,
     tag=["metadata"],
 )
+@cached
 def metadata(
-    url: str, pmin: Union[str, float] = 2., pmax: Union[str, float] = 98.
+    url: str,
+    pmin: Union[str, float] = 2.,
+    pmax: Union[str, float] = 98.,
+    approx: Union[str, bool] = False,
+    max_size: Union[str, int] = None,
 ) -> Tuple[str, str, str]:
     """Handle bounds requests."""
     pmin = float(pmin) if isinstance(pmin, str) else pmin
     pmax = float(pmax) if isinstance(pmax, str) else pmax
-    info = main.metadata(url, pmin=pmin, pmax=pmax)
+    approx = approx in ("true", "1") if isinstance(approx, str) else approx
+    if approx or max_size is not None:
+        max_size = int(max_size) if max_size is not None else 1024
+        info = get_metadata(main_metadata, url, pmin=pmin, pmax=pmax, max_size=max_size)
+    else:
+        info = get_metadata(main.metadata, url, pmin=pmin, pmax=pmax)
     return ("OK", "application/json", json.dumps(info))
 
 
@@ -118,6 +146,9 @@ def metadata(
     ttl=3600,
     tag=["tiles"],
 )
+@APP.pass_event
+@_negotiate_webp
+@cached(coalesce=metatile_params)
 def tile(
     z: int,
     x: int,
@@ -131,9 +162,12 @@ def tile(
     rescale: str = None,
     color_formula: str = None,
     color_map: str = None,
+    compress: str = None,
+    webp: Union[str, bool] = False,
 ) -> Tuple[str, str, BinaryIO]:
     """Handle tile requests."""
     driver = "jpeg" if ext == "jpg" else ext
+    webp = webp in ("true", "1") if isinstance(webp, str) else webp
 
     if indexes and expr:
         raise TilerError("Cannot pass indexes and expression")
@@ -149,13 +183,26 @@ def tile(
 
     tilesize = scale * 256
 
-    if expr is not None:
-        tile, mask = expression(
-            url, x, y, z, expr=expr, tilesize=tilesize, nodata=nodata
+    if not FOOTPRINTS.intersects(url, z, x, y):
+        return _empty_response(tilesize, ext, webp)
+
+    try:
+        if expr is not None:
+            read = partial(expression, url, expr=expr, nodata=nodata)
+        else:
+            read = partial(main_tile, url, indexes=indexes, nodata=nodata)
+        metatile, tile, mask = read_metatile(
+            read, x, y, z, tilesize, metatile_size(z, tilesize)
         )
-    else:
-        tile, mask = main.tile(
-            url, x, y, z, indexes=indexes, tilesize=tilesize, nodata=nodata
+    except errors.TileOutsideBounds:
+        return _empty_response(tilesize, ext, webp)
+
+    if not mask.any():
+        return _empty_response(tilesize, ext, webp)
+
+    if driver in RAW_FORMATS:
+        return render_metatile(
+            metatile, tile, mask, x, y, tilesize, ext, compress=compress, nodata=nodata
         )
 
     rtile, rmask = _postprocess(
@@ -163,17 +210,73 @@ def tile(
     )
 
     if color_map:
-        color_map = get_colormap(color_map, format="gdal")
+        color_map = _get_colormap(color_map)
 
-    options = img_profiles.get(driver, {})
-    return (
-        "OK",
-        f"image/{ext}",
-        array_to_image(rtile, rmask, img_format=driver, color_map=color_map, **options),
+    return render_metatile(
+        metatile, rtile, rmask, x, y, tilesize, ext, color_map, webp
     )
 
 
+@APP.route(
+    "/tiles/batch.<ext>",
+    methods=["POST"],
+    cors=True,
+    binary_b64encode=True,
+    tag=["tiles"],
+)
+@APP.pass_event
+@_negotiate_webp
+def tiles_batch(
+    ext: str = None,
+    body: str = None,
+    scale: Union[str, int] = 1,
+    url: str = None,
+    indexes: str = None,
+    expr: str = None,
+    nodata: str = None,
+    rescale: str = None,
+    color_formula: str = None,
+    color_map: str = None,
+    compress: str = None,
+    webp: Union[str, bool] = False,
+) -> Tuple[str, str, bytes]:
+    """Handle batch tile requests, see `remotepixel_tiler.batch`."""
+    if not url:
+        raise TilerError("Missing 'url' parameter")
+
+    try:
+        content = render_batch(
+            tile,
+            body,
+            scale=int(scale),
+            ext=ext,
+            url=url,
+            indexes=indexes,
+            expr=expr,
+            nodata=nodata,
+            rescale=rescale,
+            color_formula=color_formula,
+            color_map=color_map,
+            compress=compress,
+            webp=webp,
+        )
+    except BatchError as err:
+        return ("NOK", "application/json", json.dumps({"errorMessage": str(err)}))
+
+    return ("OK", "application/octet-stream", content)
+
+
+@APP.route("/warmup", methods=["GET"], cors=True, tag=["other"])
+def warmup_handler() -> Tuple[str, str, str]:
+    """Initialize GDAL, PROJ, colormaps and expressions, return timings."""
+    return ("OK", "application/json", json.dumps(warmup(**WARMUP_OPTIONS)))
+
+
 @APP.route("/favicon.ico", methods=["GET"], cors=True, tag=["other"])
 def favicon() -> Tuple[str, str, str]:
     """Favicon."""
     return ("EMPTY", "text/plain", "")
+
+
+# Lambda handler, warming the container up on scheduled events
+handler = lambda_handler(APP, **WARMUP_OPTIONS)
@@ -0,0 +1,32 @@
+"""remotepixel_tiler.combined: Landsat, Sentinel, CBERS and COGEO tilers in one app."""
+
+from remotepixel_tiler import landsat, sentinel, cogeo
+from remotepixel_tiler.proxy import MultiAPI
+from remotepixel_tiler.warmup import lambda_handler
+from remotepixel_tiler.landsat import APP as landsat_app
+from remotepixel_tiler.sentinel import APP as sentinel_app
+from remotepixel_tiler.cbers import APP as cbers_app
+from remotepixel_tiler.cogeo import APP as cogeo_app
+
+# Routes of each tiler are served under its prefix (e.g. /landsat/tiles/...,
+# /sentinel/s2/tiles/...), all sharing the process GDAL cache, dataset pool,
+# footprints, statistics and tile caches.
+APP = MultiAPI(
+    name="remotepixel-tiler",
+    mounts={
+        "/landsat": landsat_app,
+        "/sentinel": sentinel_app,
+        "/cbers": cbers_app,
+        "/cogeo": cogeo_app,
+    },
+)
+
+# Lambda handler, warming the container up on scheduled events (16-bit sensors
+# expressions only, CBERS 8-bit bands are compiled on first use).
+handler = lambda_handler(
+    APP,
+    expressions=sum(
+        (m.WARMUP_OPTIONS["expressions"] for m in (landsat, sentinel, cogeo)), ()
+    ),
+    dtype="uint16",
+)
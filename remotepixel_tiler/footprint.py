@@ -0,0 +1,243 @@
+"""remotepixel_tiler.footprint: scene geometry registry."""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import os
+import json
+import time
+import fcntl
+import atexit
+import tempfile
+import logging
+import threading
+from collections import OrderedDict
+
+from remotepixel_tiler.lazy import lazy_import
+
+rasterio = lazy_import("rasterio")
+warp = lazy_import("rasterio.warp")
+mercator = lazy_import("rio_tiler.mercator")
+tiler_utils = lazy_import("rio_tiler.utils")
+
+logger = logging.getLogger(__name__)
+
+
+class Footprint(NamedTuple):
+    """Scene geographic bounds, zoom range and native CRS."""
+
+    bounds: Sequence[float]
+    minzoom: Optional[int] = None
+    maxzoom: Optional[int] = None
+    crs: Optional[str] = None
+
+    @property
+    def center(self) -> List[float]:
+        """Return TileJSON center."""
+        return [
+            (self.bounds[0] + self.bounds[2]) / 2,
+            (self.bounds[1] + self.bounds[3]) / 2,
+            self.minzoom,
+        ]
+
+
+def dataset_footprint(address: str) -> Footprint:
+    """Open a dataset and return its footprint."""
+    with rasterio.open(address) as src_dst:
+        bounds = warp.transform_bounds(
+            src_dst.crs, "epsg:4326", *src_dst.bounds, densify_pts=21
+        )
+        minzoom, maxzoom = mercator.get_zooms(src_dst)
+        return Footprint(bounds, minzoom, maxzoom, src_dst.crs.to_string())
+
+
+class FootprintCache(object):
+    """
+    Thread-safe LRU registry of scene footprints.
+
+    Footprints are recorded by the tilejson and bounds handlers, and checked by
+    the tile handlers so requests outside a known scene can be answered without
+    opening any dataset. Entries expire after `ttl` seconds and, if `path` is
+    set, are persisted to a JSON file shared by later processes.
+
+    Writes are batched: footprints recorded within `save_interval` seconds are
+    merged into the file by a background timer (or `flush()`, also called at
+    exit), keeping the entries other processes wrote meanwhile. Failed writes
+    are retried on the next flush.
+
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: int = None,
+        path: str = None,
+        save_interval: float = 5,
+    ):
+        """Initialize cache."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.save_interval = save_interval
+        self._items: Optional[OrderedDict] = None
+        self._dirty: Dict[str, Tuple[Optional[float], Footprint]] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        if path:
+            atexit.register(self.flush)
+
+    def _read(self) -> Dict:
+        """Return the unexpired entries of the registry file."""
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        now = time.time()
+        return {
+            key: entry
+            for key, entry in entries.items()
+            if entry["expires"] is None or entry["expires"] >= now
+        }
+
+    def _index(self) -> OrderedDict:
+        """Return the key -> (expires, footprint) index, loading it on first use."""
+        if self._items is None:
+            self._items = OrderedDict()
+            if self.path:
+                for key, entry in self._read().items():
+                    footprint = Footprint(**entry["footprint"])
+                    self._items[key] = (entry["expires"], footprint)
+
+        return self._items
+
+    def _write(self, updates: Dict, replace: bool = False) -> bool:
+        """Merge entries into `path`, under an exclusive lock of `path`.lock."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(f"{self.path}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                entries = {} if replace else self._read()
+                for key, (expires, footprint) in updates.items():
+                    entries.pop(key, None)
+                    entries[key] = dict(expires=expires, footprint=footprint._asdict())
+
+                for key in list(entries)[: max(len(entries) - self.maxsize, 0)]:
+                    del entries[key]
+
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+        except OSError as err:
+            logger.warning(f"Could not write footprint registry: {err}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        return True
+
+    def _schedule_save(self) -> None:
+        """Start the timer writing recorded footprints, if not running."""
+        if self._timer is None:
+            self._timer = threading.Timer(self.save_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Write the footprints recorded since the last write to `path`."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            updates, self._dirty = self._dirty, {}
+
+        if updates and not self._write(updates):
+            # Keep them for the next flush, after the ones recorded meanwhile
+            with self._lock:
+                self._dirty = dict(updates, **self._dirty)
+
+    def set(
+        self,
+        key: str,
+        bounds: Sequence[float],
+        minzoom: Optional[int] = None,
+        maxzoom: Optional[int] = None,
+        crs: Optional[str] = None,
+    ) -> Footprint:
+        """Record a scene footprint, keeping already known zooms and CRS."""
+        with self._lock:
+            items = self._index()
+            _, previous = items.pop(key, (None, None))
+            if previous is not None:
+                minzoom = previous.minzoom if minzoom is None else minzoom
+                maxzoom = previous.maxzoom if maxzoom is None else maxzoom
+                crs = previous.crs if crs is None else crs
+
+            footprint = Footprint(list(bounds), minzoom, maxzoom, crs)
+            expires = time.time() + self.ttl if self.ttl else None
+            items[key] = (expires, footprint)
+            while len(items) > self.maxsize:
+                items.popitem(last=False)
+
+            if self.path:
+                self._dirty[key] = items[key]
+                if self.save_interval > 0:
+                    self._schedule_save()
+
+        if self.path and self.save_interval <= 0:
+            self.flush()
+
+        return footprint
+
+    def get(self, key: str) -> Optional[Footprint]:
+        """Return a scene footprint if known."""
+        with self._lock:
+            items = self._index()
+            expires, footprint = items.get(key, (None, None))
+            if footprint is None:
+                return None
+
+            if expires is not None and expires < time.time():
+                del items[key]
+                return None
+
+            items.move_to_end(key)
+            return footprint
+
+    def clear(self) -> None:
+        """Remove all footprints."""
+        with self._lock:
+            self._index().clear()
+            self._dirty.clear()
+
+        if self.path:
+            self._write({}, replace=True)
+
+    def intersects(self, key: str, z: int, x: int, y: int) -> bool:
+        """
+        Check if a mercator tile may contain data for a scene.
+
+        Unknown scenes always return True, the tile has to be read to know.
+
+        """
+        footprint = self.get(key)
+        if footprint is None:
+            return True
+
+        if footprint.minzoom is not None and z < footprint.minzoom:
+            return False
+
+        if footprint.maxzoom is not None and z > footprint.maxzoom:
+            return False
+
+        return tiler_utils.tile_exists(footprint.bounds, z, x, y)
+
+
+FOOTPRINTS = FootprintCache(
+    ttl=int(os.environ.get("FOOTPRINT_CACHE_TTL", 86400)),
+    path=os.environ.get("FOOTPRINT_CACHE_PATH"),
+    save_interval=float(os.environ.get("FOOTPRINT_CACHE_SAVE_INTERVAL", 5)),
+)
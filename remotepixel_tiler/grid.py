@@ -0,0 +1,161 @@
+"""remotepixel_tiler.grid: offline Landsat WRS-2 and Sentinel-2 MGRS footprints."""
+
+from typing import Sequence, Tuple
+
+import math
+from functools import lru_cache
+
+import numpy
+
+from remotepixel_tiler.lazy import lazy_import
+from remotepixel_tiler.footprint import Footprint
+
+warp = lazy_import("rasterio.warp")
+landsat8 = lazy_import("rio_tiler.landsat8")
+sentinel2 = lazy_import("rio_tiler.sentinel2")
+mercator = lazy_import("rio_tiler.mercator")
+
+# WRS-2: 233 paths per 16 days cycle, 248 rows per orbit, row 60 being the
+# descending node. Path 1 crosses the equator at 64.6W.
+WRS2_PATHS = 233
+WRS2_ROWS = 248
+WRS2_EQUATOR_ROW = 60
+WRS2_PATH1_LONGITUDE = -64.6
+WRS2_INCLINATION = 98.2
+WRS2_PERIOD = 16 * 1440 / WRS2_PATHS
+
+# WGS84 first eccentricity squared, WRS-2 latitudes being geodetic.
+WGS84_E2 = 0.00669438
+
+# Half diagonal of a 185x180km Landsat scene, with a margin for the orbit model.
+WRS2_SCENE_RADIUS = 160000
+
+MGRS_COLUMNS = ("ABCDEFGH", "JKLMNPQR", "STUVWXYZ")
+MGRS_ROWS = "ABCDEFGHJKLMNPQRSTUV"
+MGRS_BANDS = "CDEFGHJKLMNPQRSTUVWX"
+
+# Sentinel-2 tiles are 109.8km squares starting at the 100km MGRS square
+# upper left corner.
+S2_TILE_SIZE = 109800
+S2_TILE_MARGIN = 100
+
+EARTH_RADIUS = 6378137
+
+
+@lru_cache(maxsize=1)
+def _wrs2_centers() -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Return the (path, row) WRS-2 scene centers longitude and latitude tables."""
+    paths = numpy.arange(WRS2_PATHS).reshape(-1, 1)
+    rows = numpy.arange(1, WRS2_ROWS + 1).reshape(1, -1)
+
+    # Argument of latitude, 180 being the descending node
+    u = numpy.radians(180.0 + (rows - WRS2_EQUATOR_ROW) * 360.0 / WRS2_ROWS)
+    inclination = math.radians(WRS2_INCLINATION)
+
+    # Geocentric latitude of the ground track, converted to geodetic
+    lat = numpy.arcsin(math.sin(inclination) * numpy.sin(u))
+    lat = numpy.degrees(numpy.arctan2(numpy.sin(lat), numpy.cos(lat) * (1 - WGS84_E2)))
+    along_track = numpy.degrees(
+        numpy.arctan2(math.cos(inclination) * numpy.sin(u), numpy.cos(u))
+    )
+    earth_rotation = (numpy.degrees(u) - 180.0) / 360.0 * WRS2_PERIOD * 0.25
+
+    lon = WRS2_PATH1_LONGITUDE - paths * 360.0 / WRS2_PATHS
+    lon = lon + along_track - 180.0 - earth_rotation
+    lon = (lon + 180.0) % 360.0 - 180.0
+
+    lat = numpy.broadcast_to(lat, lon.shape)
+    return lon.astype(numpy.float32), lat.astype(numpy.float32)
+
+
+def _zooms(bounds: Sequence[float], resolution: float) -> Tuple[int, int]:
+    """Return min/max mercator zooms, as `rio_tiler.mercator.get_zooms` would."""
+    west, south, east, north = bounds
+    lat = math.radians((south + north) / 2)
+    max_zoom = mercator.zoom_for_pixelsize(resolution / math.cos(lat))
+
+    width = EARTH_RADIUS * math.radians(east - west)
+    height = EARTH_RADIUS * (
+        math.log(math.tan(math.pi / 4 + math.radians(north) / 2))
+        - math.log(math.tan(math.pi / 4 + math.radians(south) / 2))
+    )
+    min_zoom = mercator.zoom_for_pixelsize(max(width, height) / 256)
+
+    return min_zoom, max_zoom
+
+
+def wrs2_footprint(path: int, row: int) -> Footprint:
+    """
+    Return an approximate footprint for a Landsat WRS-2 path/row.
+
+    Bounds are a conservative envelope (they contain the scene) built from the
+    scene center given by the WRS-2 orbit model.
+
+    """
+    if not (1 <= path <= WRS2_PATHS and 1 <= row <= WRS2_ROWS):
+        raise ValueError(f"Invalid WRS-2 path/row: {path}/{row}")
+
+    lons, lats = _wrs2_centers()
+    lon, lat = float(lons[path - 1, row - 1]), float(lats[path - 1, row - 1])
+
+    dlat = math.degrees(WRS2_SCENE_RADIUS / EARTH_RADIUS)
+    south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+
+    cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+    dlon = dlat / cos_lat if cos_lat > 0 else 180.0
+    west, east = lon - dlon, lon + dlon
+    if west < -180.0 or east > 180.0:
+        west, east = -180.0, 180.0
+
+    bounds = [west, south, east, north]
+    return Footprint(bounds, *_zooms(bounds, 30))
+
+
+def mgrs_footprint(utm: int, band: str, square: str) -> Footprint:
+    """Return the footprint of a Sentinel-2 MGRS tile (e.g. 16, "S", "DG")."""
+    if not 1 <= utm <= 60 or band not in MGRS_BANDS:
+        raise ValueError(f"Invalid MGRS grid zone: {utm}{band}")
+
+    column, row = square
+    columns = MGRS_COLUMNS[(utm - 1) % 3]
+    if column not in columns or row not in MGRS_ROWS:
+        raise ValueError(f"Invalid MGRS square: {utm}{band}{square}")
+
+    crs = f"EPSG:{32600 + utm if band >= 'N' else 32700 + utm}"
+    easting = (columns.index(column) + 1) * 100000
+    northing = ((MGRS_ROWS.index(row) - (0 if utm % 2 else 5)) % 20) * 100000
+
+    # The row letters repeat every 2000km, pick the square closest to the
+    # latitude band center.
+    band_lat = -76 + MGRS_BANDS.index(band) * 8
+    central_meridian = utm * 6 - 183
+    _, (band_northing,) = warp.transform(
+        "EPSG:4326", crs, [central_meridian], [band_lat]
+    )
+    northing += round((band_northing - northing - 50000) / 2000000) * 2000000
+
+    top = northing + 100000
+    bounds = warp.transform_bounds(
+        crs,
+        "EPSG:4326",
+        easting - S2_TILE_MARGIN,
+        top - S2_TILE_SIZE - S2_TILE_MARGIN,
+        easting + S2_TILE_SIZE + S2_TILE_MARGIN,
+        top + S2_TILE_MARGIN,
+        densify_pts=21,
+    )
+    return Footprint(list(bounds), *_zooms(bounds, 10), crs)
+
+
+def landsat_footprint(sceneid: str) -> Footprint:
+    """Return the approximate footprint of a Landsat-8 scene, without any I/O."""
+    scene_params = landsat8._landsat_parse_scene_id(sceneid)
+    return wrs2_footprint(int(scene_params["path"]), int(scene_params["row"]))
+
+
+def sentinel2_footprint(sceneid: str) -> Footprint:
+    """Return the footprint of a Sentinel-2 scene, without any I/O."""
+    scene_params = sentinel2._sentinel_parse_scene_id(sceneid)
+    return mgrs_footprint(
+        int(scene_params["utm"]), scene_params["lat"], scene_params["sq"]
+    )
@@ -5,19 +5,39 @@ from typing.io import BinaryIO
 
 import json
 import urllib
+from functools import partial
 
-import rasterio
-from rasterio import warp
-from rio_tiler import landsat8
-from rio_tiler.mercator import get_zooms
-from rio_tiler.profiles import img_profiles
-from rio_tiler.utils import array_to_image, get_colormap, expression
+from remotepixel_tiler.utils import (
+    RAW_FORMATS,
+    _postprocess,
+    _empty_response,
+    _get_colormap,
+    _negotiate_webp,
+)
+from remotepixel_tiler.batch import BatchError, render_batch
+from remotepixel_tiler.cache import cached
+from remotepixel_tiler.metatile import (
+    metatile_params,
+    metatile_size,
+    read_metatile,
+    render_metatile,
+)
+from remotepixel_tiler.reader import expression, landsat8_tile, landsat8_metadata
+from remotepixel_tiler.stats import get_metadata
+from remotepixel_tiler.footprint import FOOTPRINTS, dataset_footprint
+from remotepixel_tiler.grid import landsat_footprint
 
-from remotepixel_tiler.utils import _postprocess
+from remotepixel_tiler.proxy import API
+from remotepixel_tiler.warmup import lambda_handler, warmup
+from remotepixel_tiler.lazy import lazy_import
 
-from lambda_proxy.proxy import API
+landsat8 = lazy_import("rio_tiler.landsat8")
+errors = lazy_import("rio_tiler.errors")
 
 APP = API(name="landsat-tiler")
+WARMUP_OPTIONS = dict(
+    expressions=("(b5-b4)/(b5+b4)", "(b3-b6)/(b3+b6)"), dtype="uint16"
+)
 LANDSAT_BUCKET = "s3://landsat-pds"
 
 
@@ -49,9 +69,12 @@ def tilejson_handler(
     sceneid: str,
     tile_format: str = "png",
     tile_scale: int = 1,
+    precise: Union[str, bool] = False,
     **kwargs: Any,
 ) -> Tuple[str, str, str]:
     """Handle /tilejson.json requests."""
+    precise = precise in ("true", "1") if isinstance(precise, str) else precise
+
     # HACK
     token = event["multiValueQueryStringParameters"].get("access_token")
     if token:
@@ -62,20 +85,20 @@ def tilejson_handler(
         f"{APP.host}/tiles/{sceneid}/{{z}}/{{x}}/{{y}}@{tile_scale}x.{tile_format}?{qs}"
     )
 
-    scene_params = landsat8._landsat_parse_scene_id(sceneid)
-    landsat_address = f"{LANDSAT_BUCKET}/{scene_params['key']}_BQA.TIF"
-    with rasterio.open(landsat_address) as src_dst:
-        bounds = warp.transform_bounds(
-            src_dst.crs, "epsg:4326", *src_dst.bounds, densify_pts=21
-        )
-        minzoom, maxzoom = get_zooms(src_dst)
-        center = [(bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2, minzoom]
+    if precise:
+        scene_params = landsat8._landsat_parse_scene_id(sceneid)
+        landsat_address = f"{LANDSAT_BUCKET}/{scene_params['key']}_BQA.TIF"
+        footprint = FOOTPRINTS.set(sceneid, *dataset_footprint(landsat_address))
+    else:
+        footprint = FOOTPRINTS.get(sceneid)
+        if footprint is None or footprint.minzoom is None:
+            footprint = FOOTPRINTS.set(sceneid, *landsat_footprint(sceneid))
 
     meta = dict(
-        bounds=bounds,
-        center=center,
-        minzoom=minzoom,
-        maxzoom=maxzoom,
+        bounds=footprint.bounds,
+        center=footprint.center,
+        minzoom=footprint.minzoom,
+        maxzoom=footprint.maxzoom,
         name=sceneid,
         tilejson="2.1.0",
         tiles=[tile_url],
@@ -93,9 +116,20 @@ def tilejson_handler(
     ttl=3600,
     tag=["metadata"],
 )
-def bounds(scene: str) -> Tuple[str, str, str]:
+@cached
+def bounds(scene: str, precise: Union[str, bool] = False) -> Tuple[str, str, str]:
     """Handle bounds requests."""
-    return ("OK", "application/json", json.dumps(landsat8.bounds(scene)))
+    precise = precise in ("true", "1") if isinstance(precise, str) else precise
+
+    if precise:
+        footprint = FOOTPRINTS.set(scene, landsat8.bounds(scene)["bounds"])
+    else:
+        footprint = FOOTPRINTS.get(scene)
+        if footprint is None:
+            footprint = FOOTPRINTS.set(scene, *landsat_footprint(scene))
+
+    info = {"sceneid": scene, "bounds": list(footprint.bounds)}
+    return ("OK", "application/json", json.dumps(info))
 
 
 @APP.route(
@@ -108,13 +142,23 @@ def bounds(scene: str) -> Tuple[str, str, str]:
     ttl=3600,
     tag=["metadata"],
 )
+@cached
 def metadata(
-    scene: str, pmin: Union[str, float] = 2., pmax: Union[str, float] = 98.
+    scene: str,
+    pmin: Union[str, float] = 2.,
+    pmax: Union[str, float] = 98.,
+    approx: Union[str, bool] = False,
+    max_size: Union[str, int] = None,
 ) -> Tuple[str, str, str]:
     """Handle metadata requests."""
     pmin = float(pmin) if isinstance(pmin, str) else pmin
     pmax = float(pmax) if isinstance(pmax, str) else pmax
-    info = landsat8.metadata(scene, pmin, pmax)
+    approx = approx in ("true", "1") if isinstance(approx, str) else approx
+    if approx or max_size is not None:
+        max_size = int(max_size) if max_size is not None else 1024
+        info = get_metadata(landsat8_metadata, scene, pmin, pmax, max_size=max_size)
+    else:
+        info = get_metadata(landsat8.metadata, scene, pmin, pmax)
     return ("OK", "application/json", json.dumps(info))
 
 
@@ -138,6 +182,9 @@ def metadata(
     ttl=3600,
     tag=["tiles"],
 )
+@APP.pass_event
+@_negotiate_webp
+@cached(coalesce=metatile_params)
 def tiles(
     scene: str,
     z: int,
@@ -151,42 +198,115 @@ def tiles(
     color_formula: str = None,
     color_map: str = None,
     pan: bool = False,
+    compress: str = None,
+    webp: Union[str, bool] = False,
 ) -> Tuple[str, str, BinaryIO]:
     """Handle tile requests."""
     driver = "jpeg" if ext == "jpg" else ext
+    webp = webp in ("true", "1") if isinstance(webp, str) else webp
 
     if bands and expr:
         raise LandsatTilerError("Cannot pass bands and expression")
 
     tilesize = scale * 256
 
+    if not FOOTPRINTS.intersects(scene, z, x, y):
+        return _empty_response(tilesize, ext, webp)
+
     pan = True if pan else False
-    if expr is not None:
-        tile, mask = expression(scene, x, y, z, expr=expr, tilesize=tilesize, pan=pan)
+    try:
+        if expr is not None:
+            read = partial(expression, scene, expr=expr, pan=pan)
 
-    elif bands is not None:
-        tile, mask = landsat8.tile(
-            scene, x, y, z, bands=tuple(bands.split(",")), tilesize=tilesize, pan=pan
+        elif bands is not None:
+            read = partial(landsat8_tile, scene, bands=tuple(bands.split(",")), pan=pan)
+        else:
+            raise LandsatTilerError("No bands nor expression given")
+
+        metatile, tile, mask = read_metatile(
+            read, x, y, z, tilesize, metatile_size(z, tilesize)
+        )
+    except errors.TileOutsideBounds:
+        return _empty_response(tilesize, ext, webp)
+
+    if not mask.any():
+        return _empty_response(tilesize, ext, webp)
+
+    if driver in RAW_FORMATS:
+        return render_metatile(
+            metatile, tile, mask, x, y, tilesize, ext, compress=compress
         )
-    else:
-        raise LandsatTilerError("No bands nor expression given")
 
     rtile, rmask = _postprocess(
         tile, mask, rescale=rescale, color_formula=color_formula
     )
 
     if color_map:
-        color_map = get_colormap(color_map, format="gdal")
+        color_map = _get_colormap(color_map)
 
-    options = img_profiles.get(driver, {})
-    return (
-        "OK",
-        f"image/{ext}",
-        array_to_image(rtile, rmask, img_format=driver, color_map=color_map, **options),
+    return render_metatile(
+        metatile, rtile, rmask, x, y, tilesize, ext, color_map, webp
     )
 
 
+@APP.route(
+    "/tiles/<scene>/batch.<ext>",
+    methods=["POST"],
+    cors=True,
+    token=True,
+    binary_b64encode=True,
+    tag=["tiles"],
+)
+@APP.pass_event
+@_negotiate_webp
+def tiles_batch(
+    scene: str,
+    ext: str = "png",
+    body: str = None,
+    scale: Union[str, int] = 1,
+    bands: str = None,
+    expr: str = None,
+    rescale: str = None,
+    color_formula: str = None,
+    color_map: str = None,
+    pan: bool = False,
+    compress: str = None,
+    webp: Union[str, bool] = False,
+) -> Tuple[str, str, bytes]:
+    """Handle batch tile requests, see `remotepixel_tiler.batch`."""
+    try:
+        content = render_batch(
+            tiles,
+            body,
+            scene=scene,
+            scale=int(scale),
+            ext=ext,
+            bands=bands,
+            expr=expr,
+            rescale=rescale,
+            color_formula=color_formula,
+            color_map=color_map,
+            pan=pan,
+            compress=compress,
+            webp=webp,
+        )
+    except BatchError as err:
+        return ("NOK", "application/json", json.dumps({"errorMessage": str(err)}))
+
+    return ("OK", "application/octet-stream", content)
+
+
+@APP.route("/warmup", methods=["GET"], cors=True, tag=["other"])
+def warmup_handler() -> Tuple[str, str, str]:
+    """Initialize GDAL, PROJ, colormaps and expressions, return timings."""
+    return ("OK", "application/json", json.dumps(warmup(**WARMUP_OPTIONS)))
+
+
 @APP.route("/favicon.ico", methods=["GET"], cors=True, tag=["other"])
 def favicon() -> Tuple[str, str, str]:
     """Favicon."""
     return ("EMPTY", "text/plain", "")
+
+
+# Lambda handler, warming the container up on scheduled events
+handler = lambda_handler(APP, **WARMUP_OPTIONS)
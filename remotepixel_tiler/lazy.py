@@ -0,0 +1,38 @@
+"""remotepixel_tiler.lazy: defer heavy imports to their first use."""
+
+from typing import Any
+
+import importlib
+
+
+class LazyModule(object):
+    """
+    Module imported on first attribute access.
+
+    Importing rasterio, rio-tiler (through pkg_resources) or boto3 takes
+    hundreds of milliseconds; routes which don't need them (e.g. `/favicon.ico`
+    or grid based `/bounds`) shouldn't pay for it on a cold start.
+
+    """
+
+    def __init__(self, name: str):
+        """Initialize proxy."""
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attr: str) -> Any:
+        """Import the module and return its attribute."""
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__["_module"] = module
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        """Return module representation."""
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_import(name: str) -> Any:
+    """Return a `LazyModule` proxy for `name`."""
+    return LazyModule(name)
@@ -0,0 +1,156 @@
+"""remotepixel_tiler.metatile: render blocks of neighbouring tiles in one read."""
+
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+import os
+import math
+
+import numpy
+import mercantile
+
+from remotepixel_tiler import cache
+from remotepixel_tiler.lazy import lazy_import
+from remotepixel_tiler.utils import (
+    RAW_FORMATS,
+    _array_to_image,
+    _array_to_raw,
+    _auto_format,
+    _content_type,
+    _empty_tile,
+)
+
+profiles = lazy_import("rio_tiler.profiles")
+
+# Width, in tiles, of the blocks read at once (a power of 2, 1 to disable).
+METATILE_SIZE = int(os.environ.get("METATILE_SIZE", 1))
+
+# Maximum width, in pixels, of a metatile read.
+METATILE_MAX_PIXELS = int(os.environ.get("METATILE_MAX_PIXELS", 1024))
+
+
+def metatile_size(z: int, tilesize: int = 256) -> int:
+    """
+    Return the metatile width to use at zoom `z` for `tilesize` tiles.
+
+    Siblings are only worth rendering if they can be cached, metatiles are
+    disabled when no cache backend is configured. Metatiles are made smaller
+    (down to single tiles) to stay within METATILE_MAX_PIXELS.
+
+    """
+    if METATILE_SIZE <= 1 or not cache.CACHES:
+        return 1
+
+    size = min(2 ** int(math.log2(METATILE_SIZE)), 2 ** z)
+    while size > 1 and tilesize * size > METATILE_MAX_PIXELS:
+        size //= 2
+
+    return size
+
+
+def metatile_params(params: Dict) -> Dict:
+    """
+    Return the arguments identifying the metatile of a tile handler call.
+
+    Used to coalesce the concurrent requests of sibling tiles on a single
+    metatile render (see `cache.cached`).
+
+    """
+    z, x, y = params["z"], params["x"], params["y"]
+    size = metatile_size(z, int(params.get("scale") or 1) * 256)
+    if size == 1:
+        return params
+
+    parent = mercantile.parent(mercantile.Tile(x, y, z), zoom=z - int(math.log2(size)))
+    return dict(params, x=parent.x, y=parent.y, z=parent.z, metatile=size)
+
+
+def read_metatile(
+    read: Callable, x: int, y: int, z: int, tilesize: int, size: int = 1
+) -> Tuple[mercantile.Tile, numpy.ndarray, numpy.ndarray]:
+    """
+    Read the `size`x`size` block of tiles containing x/y/z.
+
+    The block is the ancestor tile at zoom `z - log2(size)`, read with a single
+    `read(x, y, z, tilesize=...)` call. Returns the block tile, data and mask.
+
+    """
+    metatile = mercantile.Tile(x, y, z)
+    if size > 1:
+        metatile = mercantile.parent(metatile, zoom=z - int(math.log2(size)))
+
+    tile, mask = read(metatile.x, metatile.y, metatile.z, tilesize=tilesize * size)
+    return metatile, tile, mask
+
+
+def split_metatile(
+    metatile: mercantile.Tile,
+    tile: numpy.ndarray,
+    mask: numpy.ndarray,
+    tilesize: int,
+) -> Iterator[Tuple[mercantile.Tile, numpy.ndarray, numpy.ndarray]]:
+    """Yield the tiles of a metatile with their data and mask."""
+    size = mask.shape[0] // tilesize
+    z = metatile.z + int(math.log2(size))
+    for row in range(size):
+        for col in range(size):
+            window = (
+                slice(row * tilesize, (row + 1) * tilesize),
+                slice(col * tilesize, (col + 1) * tilesize),
+            )
+            yield (
+                mercantile.Tile(metatile.x * size + col, metatile.y * size + row, z),
+                tile[(slice(None),) + window],
+                mask[window],
+            )
+
+
+def render_metatile(
+    metatile: mercantile.Tile,
+    tile: numpy.ndarray,
+    mask: numpy.ndarray,
+    x: int,
+    y: int,
+    tilesize: int,
+    ext: str,
+    color_map: numpy.ndarray = None,
+    webp: bool = False,
+    **raw_options: Any,
+) -> cache.Response:
+    """
+    Encode the x/y tile of a post-processed metatile.
+
+    The other tiles of the metatile are encoded too and stored in the caches
+    with `cache.cache_sibling`. `auto` tiles are encoded as JPEG when fully
+    valid, as WebP (if `webp`) or PNG otherwise. Raw formats are encoded with
+    `raw_options`.
+
+    """
+    driver = "jpeg" if ext == "jpg" else ext
+
+    response = None
+    for child, child_tile, child_mask in split_metatile(metatile, tile, mask, tilesize):
+        content_type = _content_type(ext, raw_options.get("compress"))
+        img_format = driver
+        if driver == "auto":
+            img_format = _auto_format(child_tile, child_mask, color_map, webp)
+            content_type = _content_type(img_format)
+
+        if img_format in RAW_FORMATS:
+            content = _array_to_raw(child_tile, child_mask, img_format, **raw_options)
+        elif child_mask.any():
+            content = _array_to_image(
+                child_tile,
+                child_mask,
+                img_format=img_format,
+                color_map=color_map,
+                **profiles.img_profiles.get(img_format, {}),
+            )
+        else:
+            content = _empty_tile(tilesize, img_format)
+
+        if (child.x, child.y) == (x, y):
+            response = ("OK", content_type, content)
+        else:
+            cache.cache_sibling(("OK", content_type, content), x=child.x, y=child.y)
+
+    return response
@@ -0,0 +1,291 @@
+"""remotepixel_tiler.proxy: lambda-proxy API with conditional requests and compression."""
+
+from typing import Any, Dict, Optional, Tuple, Union
+
+import os
+import json
+import hashlib
+import threading
+from functools import lru_cache
+
+from lambda_proxy import proxy
+
+from remotepixel_tiler import version
+
+# Entropy coded payloads, compressing them again only costs CPU.
+PRECOMPRESSED_TYPES = (
+    "image/png",
+    "image/jpeg",
+    "image/jpg",
+    "image/webp",
+    "image/jp2",
+    "application/x-npy; compression=deflate",
+    "application/x-npy; compression=zstd",
+    "application/octet-stream; compression=deflate",
+    "application/octet-stream; compression=zstd",
+)
+
+
+@lru_cache(maxsize=1)
+def _etag_version() -> str:
+    """
+    Return the versions ETags depend on.
+
+    Responses change with the code and data versions, ETAG_SALT allows to
+    invalidate all ETags (e.g. after a configuration change).
+
+    """
+    try:
+        from importlib.metadata import version as dist_version
+    except ImportError:  # pragma: nocover
+        # Python < 3.8, rio_tiler reads its version with pkg_resources
+        from rio_tiler import version as rio_tiler_version
+    else:
+        rio_tiler_version = dist_version("rio-tiler")
+
+    return f"{version}:{rio_tiler_version}:{os.environ.get('ETAG_SALT', '')}"
+
+
+class API(proxy.API):
+    """
+    lambda-proxy API with deterministic ETags and selective compression.
+
+    GET responses of cacheable routes (with a `ttl` or `cache_control`) get an
+    ETag hashed from the request path, parameters, host (as in `API.host`),
+    WebP support and accepted content encoding, and requests matching it with
+    `If-None-Match` are answered with `304 Not Modified` without calling the
+    handler.
+
+    Routes keep declaring `payload_compression_method`, it is only applied to
+    compressible responses (JSON, raw tiles...), the `Content-Encoding` header
+    reporting when it was.
+
+    Setting `b64encode` to False disables the base64 encoding of binary bodies
+    for servers able to send bytes (e.g. `remotepixel_tiler.scripts.server`).
+
+    The event, context and request path are kept per thread so an API can
+    answer concurrent requests from several threads (e.g.
+    `remotepixel_tiler.scripts.server`): `host` and handlers decorated with
+    `pass_event` see their own request. `auto` tile responses of handlers negotiating
+    their format on request headers (with a `vary` attribute, see
+    `utils._negotiate_webp`) get a `Vary` header.
+
+    """
+
+    b64encode = True
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        """Initialize API."""
+        self._local = threading.local()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def event(self) -> Dict:
+        """Return the event of the request handled by the current thread."""
+        return getattr(self._local, "event", {})
+
+    @event.setter
+    def event(self, value: Dict) -> None:
+        self._local.event = value
+
+    @property
+    def context(self) -> Any:
+        """Return the context of the request handled by the current thread."""
+        return getattr(self._local, "context", None)
+
+    @context.setter
+    def context(self, value: Any) -> None:
+        self._local.context = value
+
+    @property
+    def request_path(self) -> Optional[proxy.ApigwPath]:
+        """Return the path of the request handled by the current thread."""
+        return getattr(self._local, "request_path", None)
+
+    @request_path.setter
+    def request_path(self, value: proxy.ApigwPath) -> None:
+        self._local.request_path = value
+
+    def _vary(self, route_entry: Any, path: str) -> Optional[str]:
+        """Return the request headers an `auto` tile response depends on."""
+        vary = getattr(route_entry.endpoint, "vary", None) if route_entry else None
+        if vary and self._get_matching_args(route_entry, path).get("ext") == "auto":
+            return vary
+        return None
+
+    def _etag(
+        self,
+        event: Dict,
+        headers: Dict,
+        request_path: proxy.ApigwPath,
+        route_entry: Any,
+    ) -> Optional[str]:
+        """Return the ETag of a GET request to a cacheable route."""
+        if event.get("httpMethod") != "GET":
+            return None
+
+        if not route_entry or not (route_entry.ttl or route_entry.cache_control):
+            return None
+
+        params = event.get("queryStringParameters") or {}
+        query = "&".join(
+            f"{k}={v}" for k, v in sorted(params.items()) if k != "access_token"
+        )
+        webp = "image/webp" in headers.get("accept", "")
+        # gzip and identity bodies differ, so must their (strong) ETags
+        encoding = route_entry.compression
+        if not encoding or encoding not in headers.get("accept-encoding", ""):
+            encoding = "identity"
+        # Responses embed `host` (e.g. tilejson URLs), built from these
+        host = headers.get("x-forwarded-host", headers.get("host", ""))
+        host += f"|{request_path.apigw_stage or ''}|{request_path.path_mapping}"
+        key = f"{_etag_version()}|{host}|{webp}|{encoding}|{request_path.path}?{query}"
+        return '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
+
+    def _not_modified(self, route_entry: Any, etag: str, vary: Optional[str]) -> Dict:
+        """Return a 304 response."""
+        headers = {"ETag": etag}
+        if vary:
+            headers["Vary"] = vary
+
+        if route_entry.cors:
+            headers["Access-Control-Allow-Origin"] = "*"
+            headers["Access-Control-Allow-Methods"] = ",".join(route_entry.methods)
+            headers["Access-Control-Allow-Credentials"] = "true"
+
+        if route_entry.ttl:
+            headers["Cache-Control"] = f"max-age={route_entry.ttl}"
+        elif route_entry.cache_control:
+            headers["Cache-Control"] = route_entry.cache_control
+
+        return {"statusCode": 304, "headers": headers, "body": ""}
+
+    def __call__(self, event: Dict, context: Any) -> Dict:
+        """Answer conditional requests, then initialize route and handlers."""
+        headers = dict(
+            (key.lower(), value) for key, value in (event.get("headers") or {}).items()
+        )
+        # Route once, for the ETag and Vary headers
+        request_path = proxy.ApigwPath(dict(event, headers=headers))
+        path, method = request_path.path, event.get("httpMethod")
+        route_entry = self._url_matching(path, method) if path and method else None
+        vary = self._vary(route_entry, path)
+
+        etag = self._etag(event, headers, request_path, route_entry)
+        if etag is not None:
+            params = event.get("queryStringParameters") or {}
+            authorized = not route_entry.token or self._validate_token(
+                params.get("access_token")
+            )
+            if_none_match = [
+                tag.strip().replace("W/", "", 1)
+                for tag in headers.get("if-none-match", "").split(",")
+            ]
+            if authorized and (etag in if_none_match or "*" in if_none_match):
+                return self._not_modified(route_entry, etag, vary)
+
+        response = super().__call__(event, context)
+        if etag is not None and response["statusCode"] == 200:
+            response["headers"]["ETag"] = etag
+
+        if vary:
+            response["headers"]["Vary"] = vary
+
+        return response
+
+    def response(
+        self,
+        status: Union[int, str],
+        content_type: str,
+        response_body: Any,
+        compression: str = "",
+        b64encode: bool = False,
+        **kwargs: Any,
+    ):
+        """Return HTTP response."""
+        if content_type in PRECOMPRESSED_TYPES:
+            compression = ""
+
+        return super().response(
+            status,
+            content_type,
+            response_body,
+            compression=compression,
+            b64encode=b64encode and self.b64encode,
+            **kwargs,
+        )
+
+
+class MultiAPI(object):
+    """
+    lambda-proxy app dispatching requests to APIs mounted under path prefixes.
+
+    Mounted APIs see the request path without their prefix, the prefix being
+    presented as an API Gateway path mapping (or stage) so their `host`,
+    tilejson and docs URLs include it.
+
+    """
+
+    def __init__(self, name: str, mounts: Dict[str, proxy.API]):
+        """Initialize app."""
+        self.name = name
+        self.mounts = mounts
+
+    @property
+    def https(self) -> bool:
+        """Return the URL scheme of the mounted APIs."""
+        return all(app.https for app in self.mounts.values())
+
+    @https.setter
+    def https(self, value: bool) -> None:
+        for app in self.mounts.values():
+            app.https = value
+
+    @property
+    def b64encode(self) -> bool:
+        """Return the base64 encoding mode of the mounted APIs."""
+        return all(getattr(app, "b64encode", True) for app in self.mounts.values())
+
+    @b64encode.setter
+    def b64encode(self, value: bool) -> None:
+        for app in self.mounts.values():
+            app.b64encode = value
+
+    def _match(self, path: str) -> Optional[Tuple[str, proxy.API, str]]:
+        """Return the prefix, API and sub-path of a request path."""
+        for prefix, app in self.mounts.items():
+            if path == prefix or path.startswith(f"{prefix}/"):
+                return prefix, app, path[len(prefix):] or "/"
+        return None
+
+    def __call__(self, event: Dict, context: Any) -> Dict:
+        """Call the API mounted at the request path prefix."""
+        headers = event.get("headers") or {}
+        event = dict(event, headers={k.lower(): v for k, v in headers.items()})
+        request_path = proxy.ApigwPath(event)
+        path = request_path.path or "/"
+        match = self._match(path)
+        if match is None:
+            if path == "/favicon.ico":
+                return {"statusCode": 204, "headers": {}, "body": ""}
+
+            method = event.get("httpMethod")
+            body = {"errorMessage": f"No view function for: {method} - {path}"}
+            return {
+                "statusCode": 400,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps(body),
+            }
+
+        prefix, app, sub_path = match
+        event["resource"] = "/{proxy+}"
+        event["pathParameters"] = {"proxy": sub_path[1:]}
+        if request_path.apigw_stage:
+            stage = request_path.apigw_stage
+            stage = prefix[1:] if stage == "$default" else f"{stage}{prefix}"
+            event["requestContext"] = dict(event["requestContext"], stage=stage)
+        else:
+            mapping = request_path.path_mapping + request_path.api_prefix
+            event["path"] = f"{mapping}{path}"
+
+        return app(event, context)
@@ -0,0 +1,609 @@
+"""remotepixel_tiler.reader: read tiles through a pool of open datasets."""
+
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import os
+import re
+import threading
+import multiprocessing
+from functools import lru_cache, partial
+from concurrent import futures
+from contextlib import contextmanager
+from collections import OrderedDict
+
+import numpy
+import mercantile
+
+from remotepixel_tiler.lazy import lazy_import
+
+if TYPE_CHECKING:  # pragma: nocover
+    from rasterio.io import DatasetReader
+
+# rasterio, rio-toa and rio-tiler are imported on first use
+numexpr = lazy_import("numexpr")
+rasterio = lazy_import("rasterio")
+vrt = lazy_import("rasterio.vrt")
+enums = lazy_import("rasterio.enums")
+warp = lazy_import("rasterio.warp")
+reflectance = lazy_import("rio_toa.reflectance")
+brightness_temp = lazy_import("rio_toa.brightness_temp")
+toa_utils = lazy_import("rio_toa.toa_utils")
+utils = lazy_import("rio_tiler.utils")
+mercator = lazy_import("rio_tiler.mercator")
+errors = lazy_import("rio_tiler.errors")
+landsat8 = lazy_import("rio_tiler.landsat8")
+cbers = lazy_import("rio_tiler.cbers")
+sentinel2 = lazy_import("rio_tiler.sentinel2")
+
+MAX_THREADS = int(os.environ.get("MAX_THREADS", multiprocessing.cpu_count() * 5))
+
+
+class DatasetPool(object):
+    """
+    Thread-safe LRU pool of open rasterio datasets.
+
+    Datasets are keyed by address and GDAL configuration, and checked out for
+    the exclusive use of one thread at a time: concurrent reads of the same
+    address get their own handle. At most `maxsize` idle handles are kept
+    open, the least recently used are closed first.
+
+    """
+
+    def __init__(self, maxsize: int = 64):
+        """Initialize pool."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._idle: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of idle datasets."""
+        with self._lock:
+            return sum(len(handles) for handles in self._idle.values())
+
+    @staticmethod
+    def _key(address: str) -> Tuple:
+        options = rasterio.env.getenv() if rasterio.env.hasenv() else {}
+        return (address, tuple(sorted((k, str(v)) for k, v in options.items())))
+
+    def _checkout(self, key: Tuple) -> "DatasetReader":
+        with self._lock:
+            handles = self._idle.get(key)
+            if handles:
+                self.hits += 1
+                src_dst = handles.pop()
+                if not handles:
+                    del self._idle[key]
+                return src_dst
+
+            self.misses += 1
+
+        return rasterio.open(key[0])
+
+    def _checkin(self, key: Tuple, src_dst: "DatasetReader") -> None:
+        evicted = []
+        with self._lock:
+            self._idle.setdefault(key, []).append(src_dst)
+            self._idle.move_to_end(key)
+
+            count = sum(len(handles) for handles in self._idle.values())
+            while count > self.maxsize:
+                oldest, handles = next(iter(self._idle.items()))
+                evicted.append(handles.pop(0))
+                if not handles:
+                    del self._idle[oldest]
+                count -= 1
+
+        for dataset in evicted:
+            dataset.close()
+
+    @contextmanager
+    def open(self, address: str) -> Iterator["DatasetReader"]:
+        """Check out an open dataset for the duration of the block."""
+        if not self.maxsize:
+            with rasterio.open(address) as src_dst:
+                yield src_dst
+            return
+
+        key = self._key(address)
+        src_dst = self._checkout(key)
+        try:
+            yield src_dst
+        except Exception:
+            # The handle state is unknown, don't give it back.
+            src_dst.close()
+            raise
+        else:
+            self._checkin(key, src_dst)
+
+    def clear(self) -> None:
+        """Close all idle datasets."""
+        with self._lock:
+            handles = [h for handles in self._idle.values() for h in handles]
+            self._idle.clear()
+
+        for src_dst in handles:
+            src_dst.close()
+
+    def stats(self) -> Dict:
+        """Return pool statistics."""
+        return dict(
+            hits=self.hits, misses=self.misses, count=len(self), max_size=self.maxsize
+        )
+
+
+POOL = DatasetPool(maxsize=int(os.environ.get("DATASET_POOL_SIZE", 64)))
+
+
+def tile_read(
+    address: str, bounds: Sequence[float], tilesize: int, **kwargs: Any
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Read data and mask from a pooled dataset."""
+    with POOL.open(address) as src_dst:
+        return utils._tile_read(src_dst, bounds, tilesize, **kwargs)
+
+
+def _tile_bounds(
+    address: str, tile_x: int, tile_y: int, tile_z: int
+) -> mercantile.Bbox:
+    """Return mercator tile bounds, raise if the tile is outside the dataset."""
+    with POOL.open(address) as src_dst:
+        bounds = warp.transform_bounds(
+            src_dst.crs, "epsg:4326", *src_dst.bounds, densify_pts=21
+        )
+
+    if not utils.tile_exists(bounds, tile_z, tile_x, tile_y):
+        raise errors.TileOutsideBounds(
+            f"Tile {tile_z}/{tile_x}/{tile_y} is outside image bounds"
+        )
+
+    return mercantile.xy_bounds(mercantile.Tile(x=tile_x, y=tile_y, z=tile_z))
+
+
+def _read_bands(
+    addresses: Sequence[str], tile_bounds: mercantile.Bbox, tilesize: int, **kwargs: Any
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Read one band per address in parallel and merge their masks."""
+    _tiler = partial(tile_read, bounds=tile_bounds, tilesize=tilesize, **kwargs)
+    with futures.ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
+        data, masks = zip(*list(executor.map(_tiler, addresses)))
+        mask = numpy.all(masks, axis=0).astype(numpy.uint8) * 255
+
+    return numpy.concatenate(data), mask
+
+
+@lru_cache(maxsize=512)
+def _landsat_mtl(sceneid: str) -> Dict:
+    """Return Landsat-8 MTL metadata, fetched once per scene."""
+    return landsat8._landsat_get_mtl(sceneid).get("L1_METADATA_FILE")
+
+
+def _landsat_toa(arr: numpy.ndarray, band: str, meta_data: Dict) -> numpy.ndarray:
+    """Convert Landsat-8 DN to TOA reflectance (x10000) or brightness temperature."""
+    rescaling = meta_data["RADIOMETRIC_RESCALING"]
+    if band in ["1", "2", "3", "4", "5", "6", "7", "8", "9"]:  # OLI
+        multi_reflect = rescaling.get(f"REFLECTANCE_MULT_BAND_{band}")
+        add_reflect = rescaling.get(f"REFLECTANCE_ADD_BAND_{band}")
+        sun_elev = meta_data["IMAGE_ATTRIBUTES"]["SUN_ELEVATION"]
+        return 10000 * reflectance.reflectance(
+            arr, multi_reflect, add_reflect, sun_elev
+        )
+
+    elif band in ["10", "11"]:  # TIRS
+        multi_rad = rescaling.get(f"RADIANCE_MULT_BAND_{band}")
+        add_rad = rescaling.get(f"RADIANCE_ADD_BAND_{band}")
+        k1 = meta_data["TIRS_THERMAL_CONSTANTS"].get(f"K1_CONSTANT_BAND_{band}")
+        k2 = meta_data["TIRS_THERMAL_CONSTANTS"].get(f"K2_CONSTANT_BAND_{band}")
+        return brightness_temp.brightness_temp(arr, multi_rad, add_rad, k1, k2)
+
+    return arr
+
+
+def main_tile(
+    address: str, tile_x: int, tile_y: int, tile_z: int, tilesize: int = 256, **kwargs
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Create mercator tile from any image, see `rio_tiler.main.tile`."""
+    tile_bounds = _tile_bounds(address, tile_x, tile_y, tile_z)
+    return tile_read(address, tile_bounds, tilesize, **kwargs)
+
+
+def landsat8_tile(
+    sceneid: str,
+    tile_x: int,
+    tile_y: int,
+    tile_z: int,
+    bands: Tuple[str, ...] = ("4", "3", "2"),
+    tilesize: int = 256,
+    pan: bool = False,
+    **kwargs: Any,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Create mercator tile from Landsat-8 data, see `rio_tiler.landsat8.tile`."""
+    if not isinstance(bands, tuple):
+        bands = tuple((bands,))
+
+    for band in bands:
+        if band not in landsat8.LANDSAT_BANDS:
+            raise errors.InvalidBandName(f"{band} is not a valid Landsat band name")
+
+    scene_params = landsat8._landsat_parse_scene_id(sceneid)
+    meta_data = _landsat_mtl(sceneid)
+    landsat_address = f"{landsat8.LANDSAT_BUCKET}/{scene_params['key']}"
+
+    wgs_bounds = toa_utils._get_bounds_from_metadata(meta_data["PRODUCT_METADATA"])
+    if not utils.tile_exists(wgs_bounds, tile_z, tile_x, tile_y):
+        raise errors.TileOutsideBounds(
+            f"Tile {tile_z}/{tile_x}/{tile_y} is outside image bounds"
+        )
+
+    tile_bounds = mercantile.xy_bounds(mercantile.Tile(x=tile_x, y=tile_y, z=tile_z))
+
+    def _tiler(band):
+        address = f"{landsat_address}_B{band}.TIF"
+        nodata = 1 if band == "QA" else 0
+        return tile_read(address, tile_bounds, tilesize, nodata=nodata, **kwargs)
+
+    with futures.ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
+        data, masks = zip(*list(executor.map(_tiler, bands)))
+        data = numpy.concatenate(data)
+        mask = numpy.all(masks, axis=0).astype(numpy.uint8) * 255
+
+    if pan:
+        pan_address = f"{landsat_address}_B8.TIF"
+        matrix_pan, mask = tile_read(pan_address, tile_bounds, tilesize, nodata=0)
+        data = utils.pansharpening_brovey(data, matrix_pan, 0.2, matrix_pan.dtype)
+
+    for bdx, band in enumerate(bands):
+        data[bdx] = _landsat_toa(data[bdx], band, meta_data)
+
+    return data, mask
+
+
+def cbers_tile(
+    sceneid: str,
+    tile_x: int,
+    tile_y: int,
+    tile_z: int,
+    bands: Tuple[str, ...] = None,
+    tilesize: int = 256,
+    **kwargs: Any,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Create mercator tile from CBERS data, see `rio_tiler.cbers.tile`."""
+    scene_params = cbers._cbers_parse_scene_id(sceneid)
+
+    if not bands:
+        bands = scene_params["rgb"]
+
+    if not isinstance(bands, tuple):
+        bands = tuple((bands,))
+
+    for band in bands:
+        if band not in scene_params["bands"]:
+            raise errors.InvalidBandName(
+                f"{band} is not a valid band name for "
+                f"{scene_params['instrument']} CBERS instrument"
+            )
+
+    cbers_address = f"{cbers.CBERS_BUCKET}/{scene_params['key']}"
+    reference = f"{cbers_address}/{sceneid}_BAND{scene_params['reference_band']}.tif"
+    tile_bounds = _tile_bounds(reference, tile_x, tile_y, tile_z)
+
+    addresses = [f"{cbers_address}/{sceneid}_BAND{band}.tif" for band in bands]
+    return _read_bands(addresses, tile_bounds, tilesize, nodata=0, **kwargs)
+
+
+def sentinel2_tile(
+    sceneid: str,
+    tile_x: int,
+    tile_y: int,
+    tile_z: int,
+    bands: Tuple[str, ...] = ("04", "03", "02"),
+    tilesize: int = 256,
+    **kwargs: Any,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Create mercator tile from Sentinel-2 data, see `rio_tiler.sentinel2.tile`."""
+    scene_params = sentinel2._sentinel_parse_scene_id(sceneid)
+
+    if not isinstance(bands, tuple):
+        bands = tuple((bands,))
+
+    for band in bands:
+        if band not in scene_params["valid_bands"]:
+            raise errors.InvalidBandName(f"{band} is not a valid Sentinel band name")
+
+    path_prefix = os.path.join(scene_params["aws_bucket"], scene_params["aws_prefix"])
+    preview_file = os.path.join(path_prefix, scene_params["preview_file"])
+    tile_bounds = _tile_bounds(preview_file, tile_x, tile_y, tile_z)
+
+    if scene_params["processingLevel"] == "L2A":
+        bands = [sentinel2._l2_prefixed_band(b) for b in bands]
+    else:
+        bands = [f"B{b}" for b in bands]
+
+    addresses = [f"{path_prefix}/{band}.jp2" for band in bands]
+    return _read_bands(addresses, tile_bounds, tilesize, nodata=0, **kwargs)
+
+
+def expression(
+    sceneid: str, tile_x: int, tile_y: int, tile_z: int, expr: str = None, **kwargs
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Apply expression on data, see `rio_tiler.utils.expression`."""
+    if not expr:
+        raise Exception("Missing expression")
+
+    bands_names = tuple(set(re.findall(r"b(?P<bands>[0-9A]{1,2})", expr)))
+    rgb = expr.split(",")
+
+    if sceneid.startswith("L"):
+        arr, mask = landsat8_tile(
+            sceneid, tile_x, tile_y, tile_z, bands=bands_names, **kwargs
+        )
+    elif sceneid.startswith("S2"):
+        arr, mask = sentinel2_tile(
+            sceneid, tile_x, tile_y, tile_z, bands=bands_names, **kwargs
+        )
+    elif sceneid.startswith("CBERS"):
+        arr, mask = cbers_tile(
+            sceneid, tile_x, tile_y, tile_z, bands=bands_names, **kwargs
+        )
+    else:
+        bands = tuple(map(int, bands_names))
+        arr, mask = main_tile(sceneid, tile_x, tile_y, tile_z, indexes=bands, **kwargs)
+
+    arr = dict(zip([f"b{b}" for b in bands_names], arr))
+    return (
+        numpy.array(
+            [
+                numpy.nan_to_num(numexpr.evaluate(bloc.strip(), local_dict=arr))
+                for bloc in rgb
+            ]
+        ),
+        mask,
+    )
+
+
+def _overview_shape(
+    src_dst: "DatasetReader", max_size: int
+) -> Tuple[Optional[int], int, int]:
+    """
+    Return the overview level and (height, width) to read under `max_size`.
+
+    The finest of full resolution (level None) and overviews fitting in
+    `max_size` pixels is used. When even the coarsest overview is too large it
+    is decimated down to `max_size`.
+
+    """
+    levels = [None] + list(range(len(src_dst.overviews(1))))
+    decimations = [1] + src_dst.overviews(1)
+    for level, decim in zip(levels, decimations):
+        height = utils._div_round_up(src_dst.height, decim)
+        width = utils._div_round_up(src_dst.width, decim)
+        if max(height, width) <= max_size:
+            break
+
+    if max(height, width) > max_size:
+        ratio = max_size / max(height, width)
+        height, width = max(1, int(height * ratio)), max(1, int(width * ratio))
+
+    return level, height, width
+
+
+def read_overview(
+    address: str,
+    max_size: int = 1024,
+    indexes: Sequence[int] = None,
+    nodata: Union[int, float] = None,
+    resampling_method: str = "bilinear",
+    **vrt_options: Any,
+) -> Tuple[numpy.ma.MaskedArray, Dict]:
+    """
+    Read a decimated masked array, at most `max_size` pixels wide or high.
+
+    Returns the data and a dict describing the read: geographic `bounds`,
+    `overview_level` (None for full resolution) and `shape`.
+
+    """
+    with POOL.open(address) as src_dst:
+        level, height, width = _overview_shape(src_dst, max_size)
+        indexes = list(indexes) if indexes else list(src_dst.indexes)
+        nodata = nodata if nodata is not None else src_dst.nodata
+
+        vrt_params = dict(add_alpha=not utils.has_alpha_band(src_dst))
+        if nodata is not None:
+            vrt_params.update(dict(nodata=nodata, add_alpha=False, src_nodata=nodata))
+        vrt_params.update(vrt_options)
+
+        with vrt.WarpedVRT(src_dst, **vrt_params) as vrt_dst:
+            arr = vrt_dst.read(
+                out_shape=(len(indexes), height, width),
+                indexes=indexes,
+                resampling=enums.Resampling[resampling_method],
+                masked=True,
+            )
+
+        bounds = warp.transform_bounds(
+            src_dst.crs, "epsg:4326", *src_dst.bounds, densify_pts=21
+        )
+        info = dict(
+            bounds=dict(value=bounds, crs="EPSG:4326"),
+            overview_level=level,
+            shape=[height, width],
+            indexes=indexes,
+        )
+
+    return arr, info
+
+
+def _band_stats(
+    arr: numpy.ma.MaskedArray,
+    info: Dict,
+    percentiles: Tuple[float, float] = (2, 98),
+    histogram_bins: int = 10,
+) -> Dict:
+    """Return `rio_tiler.utils._stats` band statistics with the level read."""
+    stats = utils._stats(arr, percentiles=percentiles, bins=histogram_bins)
+    stats.update(overview_level=info["overview_level"], shape=info["shape"])
+    return stats
+
+
+def main_metadata(
+    address: str,
+    pmin: float = 2,
+    pmax: float = 98,
+    max_size: int = 1024,
+    histogram_bins: int = 10,
+    **kwargs: Any,
+) -> Dict:
+    """Return bounded-read statistics, see `rio_tiler.main.metadata`."""
+    arr, info = read_overview(address, max_size=max_size, **kwargs)
+    with POOL.open(address) as src_dst:
+        minzoom, maxzoom = mercator.get_zooms(src_dst)
+        descriptions = src_dst.descriptions
+
+    return {
+        "address": address,
+        "bounds": info["bounds"],
+        "minzoom": minzoom,
+        "maxzoom": maxzoom,
+        "band_descriptions": [
+            (idx, descriptions[idx - 1] or f"band{idx}") for idx in info["indexes"]
+        ],
+        "statistics": {
+            idx: _band_stats(arr[bdx], info, (pmin, pmax), histogram_bins)
+            for bdx, idx in enumerate(info["indexes"])
+        },
+    }
+
+
+def _bands_metadata(
+    addresses: Dict[str, str],
+    pmin: float,
+    pmax: float,
+    max_size: int,
+    histogram_bins: int,
+    convert: Callable = None,
+    **kwargs: Any,
+) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """Return per band bounded-read statistics and read info."""
+
+    def _worker(band):
+        arr, info = read_overview(
+            addresses[band], max_size=max_size, indexes=[1], **kwargs
+        )
+        arr = arr[0]
+        if convert is not None:
+            arr = convert(arr, band)
+        return _band_stats(arr, info, (pmin, pmax), histogram_bins), info
+
+    with futures.ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
+        responses = list(executor.map(_worker, addresses))
+
+    statistics = {band: stats for band, (stats, _) in zip(addresses, responses)}
+    infos = {band: info for band, (_, info) in zip(addresses, responses)}
+    return statistics, infos
+
+
+def landsat8_metadata(
+    sceneid: str,
+    pmin: float = 2,
+    pmax: float = 98,
+    max_size: int = 1024,
+    histogram_bins: int = 10,
+) -> Dict:
+    """Return bounded-read statistics, see `rio_tiler.landsat8.metadata`."""
+    scene_params = landsat8._landsat_parse_scene_id(sceneid)
+    meta_data = _landsat_mtl(sceneid)
+    path_prefix = f"{landsat8.LANDSAT_BUCKET}/{scene_params['key']}"
+
+    def _convert(arr, band):
+        return _landsat_toa(arr, band, meta_data)
+
+    statistics = {}
+    infos = {}
+    landsat_bands = landsat8.LANDSAT_BANDS
+    for nodata, bands in ((0, [b for b in landsat_bands if b != "QA"]), (1, ["QA"])):
+        addresses = OrderedDict((b, f"{path_prefix}_B{b}.TIF") for b in bands)
+        band_stats, band_infos = _bands_metadata(
+            addresses,
+            pmin,
+            pmax,
+            max_size,
+            histogram_bins,
+            convert=_convert,
+            nodata=nodata,
+            resampling_method="nearest",
+            init_dest_nodata=False,
+        )
+        statistics.update(band_stats)
+        infos.update(band_infos)
+
+    return {
+        "sceneid": sceneid,
+        "bounds": infos["8"]["bounds"],
+        "statistics": {b: statistics[b] for b in landsat_bands},
+    }
+
+
+def cbers_metadata(
+    sceneid: str,
+    pmin: float = 2,
+    pmax: float = 98,
+    max_size: int = 1024,
+    histogram_bins: int = 10,
+) -> Dict:
+    """Return bounded-read statistics, see `rio_tiler.cbers.metadata`."""
+    scene_params = cbers._cbers_parse_scene_id(sceneid)
+    cbers_address = f"{cbers.CBERS_BUCKET}/{scene_params['key']}"
+    addresses = OrderedDict(
+        (band, f"{cbers_address}/{sceneid}_BAND{band}.tif")
+        for band in scene_params["bands"]
+    )
+    statistics, infos = _bands_metadata(
+        addresses, pmin, pmax, max_size, histogram_bins, nodata=0
+    )
+    return {
+        "sceneid": sceneid,
+        "bounds": infos[scene_params["reference_band"]]["bounds"],
+        "statistics": statistics,
+    }
+
+
+def sentinel2_metadata(
+    sceneid: str,
+    pmin: float = 2,
+    pmax: float = 98,
+    max_size: int = 1024,
+    histogram_bins: int = 10,
+) -> Dict:
+    """Return bounded-read statistics, see `rio_tiler.sentinel2.metadata`."""
+    scene_params = sentinel2._sentinel_parse_scene_id(sceneid)
+    path_prefix = os.path.join(scene_params["aws_bucket"], scene_params["aws_prefix"])
+    preview_file = os.path.join(path_prefix, scene_params["preview_file"])
+
+    with POOL.open(preview_file) as src_dst:
+        bounds = warp.transform_bounds(
+            src_dst.crs, "epsg:4326", *src_dst.bounds, densify_pts=21
+        )
+
+    preview_prefix = f"{path_prefix}/{scene_params['preview_prefix']}"
+    addresses = OrderedDict(
+        (band, f"{preview_prefix}/B{band}.jp2") for band in scene_params["bands"]
+    )
+    statistics, _ = _bands_metadata(
+        addresses, pmin, pmax, max_size, histogram_bins, nodata=0
+    )
+    return {
+        "sceneid": sceneid,
+        "bounds": dict(value=bounds, crs="EPSG:4326"),
+        "statistics": statistics,
+    }
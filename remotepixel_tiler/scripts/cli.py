@@ -11,12 +11,16 @@ from remotepixel_tiler.landsat import APP as landsat_app
 from remotepixel_tiler.sentinel import APP as sentinel_app
 from remotepixel_tiler.cbers import APP as cbers_app
 from remotepixel_tiler.cogeo import APP as cogeo_app
+from remotepixel_tiler.combined import APP as combined_app
+from remotepixel_tiler.scripts import server
+from remotepixel_tiler.scripts.prefork import PreforkServer
 
 
 landsat_app.https = False
 sentinel_app.https = False
 cbers_app.https = False
 cogeo_app.https = False
+combined_app.https = False
 
 
 class ThreadingSimpleServer(ThreadingMixIn, HTTPServer):
@@ -37,6 +41,9 @@ class LandsatHandler(BaseHTTPRequestHandler):
             "queryStringParameters": dict(parse_qsl(q.query)),
             "httpMethod": self.command,
         }
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            request["body"] = self.rfile.read(length).decode()
         response = landsat_app(request, None)
 
         self.send_response(int(response["statusCode"]))
@@ -52,6 +59,10 @@ class LandsatHandler(BaseHTTPRequestHandler):
         else:
             self.wfile.write(response["body"])
 
+    def do_POST(self):
+        """Post requests."""
+        self.do_GET()
+
 
 class CogeoHandler(BaseHTTPRequestHandler):
     """Requests handler."""
@@ -65,6 +76,9 @@ class CogeoHandler(BaseHTTPRequestHandler):
             "queryStringParameters": dict(parse_qsl(q.query)),
             "httpMethod": self.command,
         }
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            request["body"] = self.rfile.read(length).decode()
         response = cogeo_app(request, None)
 
         self.send_response(int(response["statusCode"]))
@@ -80,6 +94,10 @@ class CogeoHandler(BaseHTTPRequestHandler):
         else:
             self.wfile.write(response["body"])
 
+    def do_POST(self):
+        """Post requests."""
+        self.do_GET()
+
 
 class CbersHandler(BaseHTTPRequestHandler):
     """Requests handler."""
@@ -93,6 +111,9 @@ class CbersHandler(BaseHTTPRequestHandler):
             "queryStringParameters": dict(parse_qsl(q.query)),
             "httpMethod": self.command,
         }
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            request["body"] = self.rfile.read(length).decode()
         response = cbers_app(request, None)
 
         self.send_response(int(response["statusCode"]))
@@ -108,6 +129,10 @@ class CbersHandler(BaseHTTPRequestHandler):
         else:
             self.wfile.write(response["body"])
 
+    def do_POST(self):
+        """Post requests."""
+        self.do_GET()
+
 
 class SentinelHandler(BaseHTTPRequestHandler):
     """Requests handler."""
@@ -121,6 +146,9 @@ class SentinelHandler(BaseHTTPRequestHandler):
             "queryStringParameters": dict(parse_qsl(q.query)),
             "httpMethod": self.command,
         }
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            request["body"] = self.rfile.read(length).decode()
         response = sentinel_app(request, None)
 
         self.send_response(int(response["statusCode"]))
@@ -136,6 +164,87 @@ class SentinelHandler(BaseHTTPRequestHandler):
         else:
             self.wfile.write(response["body"])
 
+    def do_POST(self):
+        """Post requests."""
+        self.do_GET()
+
+
+class CombinedHandler(BaseHTTPRequestHandler):
+    """Requests handler."""
+
+    def do_GET(self):
+        """Get requests."""
+        q = urlparse(self.path)
+        request = {
+            "headers": dict(self.headers),
+            "path": q.path,
+            "queryStringParameters": dict(parse_qsl(q.query)),
+            "httpMethod": self.command,
+        }
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            request["body"] = self.rfile.read(length).decode()
+        response = combined_app(request, None)
+
+        self.send_response(int(response["statusCode"]))
+        for r in response["headers"]:
+            self.send_header(r, response["headers"][r])
+        self.end_headers()
+
+        if response.get("isBase64Encoded"):
+            response["body"] = base64.b64decode(response["body"])
+
+        if isinstance(response["body"], str):
+            self.wfile.write(bytes(response["body"], "utf-8"))
+        else:
+            self.wfile.write(response["body"])
+
+    def do_POST(self):
+        """Post requests."""
+        self.do_GET()
+
+
+def _serve(app, handler, port, use_async, threads, workers, max_requests):
+    """Launch the threaded, asyncio or pre-forking server."""
+    click.echo(f"Starting local server at http://127.0.0.1:{port}", err=True)
+    if workers:
+        PreforkServer(
+            app, workers=workers, max_requests=max_requests, threads=threads
+        ).run(port=port)
+    elif use_async:
+        server.serve(app, port=port, threads=threads)
+    else:
+        httpd = ThreadingSimpleServer(("", port), handler)
+        httpd.serve_forever()
+
+
+def server_options(func):
+    """Add server options."""
+    options = [
+        click.option("--port", type=int, default=8000, help="port"),
+        click.option(
+            "--async", "use_async", is_flag=True, help="asyncio keep-alive server"
+        ),
+        click.option(
+            "--threads", type=int, default=8, help="render threads per process"
+        ),
+        click.option(
+            "--workers",
+            type=int,
+            default=0,
+            help="pre-fork N asyncio server processes (SO_REUSEPORT)",
+        ),
+        click.option(
+            "--max-requests",
+            type=int,
+            default=0,
+            help="restart a server process after N requests (0: never)",
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
 
 @click.group("remotepixel_tiler")
 def cli():
@@ -144,40 +253,35 @@ def cli():
 
 
 @cli.command(short_help="landsat")
-@click.option("--port", type=int, default=8000, help="port")
-def landsat(port):
+@server_options
+def landsat(**options):
     """Launch server."""
-    server_address = ("", port)
-    httpd = ThreadingSimpleServer(server_address, LandsatHandler)
-    click.echo(f"Starting local server at http://127.0.0.1:{port}", err=True)
-    httpd.serve_forever()
+    _serve(landsat_app, LandsatHandler, **options)
 
 
 @cli.command(short_help="sentinel")
-@click.option("--port", type=int, default=8000, help="port")
-def sentinel(port):
+@server_options
+def sentinel(**options):
     """Launch server."""
-    server_address = ("", port)
-    httpd = ThreadingSimpleServer(server_address, SentinelHandler)
-    click.echo(f"Starting local server at http://127.0.0.1:{port}", err=True)
-    httpd.serve_forever()
+    _serve(sentinel_app, SentinelHandler, **options)
 
 
 @cli.command(short_help="cbers")
-@click.option("--port", type=int, default=8000, help="port")
-def cbers(port):
+@server_options
+def cbers(**options):
     """Launch server."""
-    server_address = ("", port)
-    httpd = ThreadingSimpleServer(server_address, CbersHandler)
-    click.echo(f"Starting local server at http://127.0.0.1:{port}", err=True)
-    httpd.serve_forever()
+    _serve(cbers_app, CbersHandler, **options)
 
 
 @cli.command(short_help="cogeo")
-@click.option("--port", type=int, default=8000, help="port")
-def cogeo(port):
+@server_options
+def cogeo(**options):
     """Launch server."""
-    server_address = ("", port)
-    httpd = ThreadingSimpleServer(server_address, CogeoHandler)
-    click.echo(f"Starting local server at http://127.0.0.1:{port}", err=True)
-    httpd.serve_forever()
+    _serve(cogeo_app, CogeoHandler, **options)
+
+
+@cli.command(short_help="landsat, sentinel, cbers and cogeo")
+@server_options
+def combined(**options):
+    """Launch server."""
+    _serve(combined_app, CombinedHandler, **options)
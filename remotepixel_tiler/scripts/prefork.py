@@ -0,0 +1,231 @@
+"""remotepixel_tiler.scripts.prefork: pre-forking multi-process server."""
+
+from typing import Any, Dict, List, Tuple
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import multiprocessing
+
+import click
+
+from remotepixel_tiler.footprint import FOOTPRINTS
+from remotepixel_tiler.scripts.server import AsyncServer
+
+# Per worker shared counters
+STATS_FIELDS = ("requests", "errors", "bytes_sent")
+
+
+class WorkerServer(AsyncServer):
+    """AsyncServer publishing its counters in a shared memory slot."""
+
+    def __init__(self, app: Any, stats: Any, slot: int, **kwargs: Any):
+        """Initialize server."""
+        super().__init__(app, **kwargs)
+        self._stats = stats
+        self._offset = slot * len(STATS_FIELDS)
+
+    def record(self, status: int, size: int) -> None:
+        """Count a response."""
+        super().record(status, size)
+        for idx, field in enumerate(STATS_FIELDS):
+            self._stats[self._offset + idx] = getattr(self, field)
+
+
+class PreforkServer(object):
+    """
+    Pre-fork `workers` processes each running an `AsyncServer`.
+
+    Workers bind their own listening socket with SO_REUSEPORT, the kernel
+    balancing connections between them, so the GIL-bound parts of requests
+    (routing, post-processing, encoding) use every core.
+
+    Signals sent to the master process:
+
+    - SIGHUP: graceful restart, new workers are started then the old ones stop
+      accepting and exit once their in-flight requests are answered.
+    - SIGUSR1: print aggregated stats.
+    - SIGTERM/SIGINT: graceful shutdown.
+
+    Workers exit after `max_requests` requests (0: never) and are replaced,
+    bounding the memory held by GDAL caches. They share the on-disk tile cache
+    directory and its TILE_CACHE_DISK_MAX_SIZE quota (see `cache.DiskCache`),
+    while each keeps its own in-memory cache of TILE_CACHE_MAX_SIZE bytes.
+
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        workers: int = 2,
+        max_requests: int = 0,
+        graceful_timeout: float = 30,
+        **server_options: Any,
+    ):
+        """Initialize server."""
+        self.app = app
+        self.workers = workers
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.server_options = server_options
+
+        # Two generations of workers can run during a restart
+        self._stats = multiprocessing.RawArray("Q", 2 * workers * len(STATS_FIELDS))
+        self._free_slots: List[int] = list(range(2 * workers))
+        self._children: Dict[int, Tuple[int, int]] = {}
+        self._totals = dict.fromkeys(STATS_FIELDS, 0)
+        self._counters = {"spawned": 0, "recycled": 0, "crashed": 0, "restarts": 0}
+        self._generation = 0
+        self._running = False
+        self._reload = False
+        self._report = False
+
+    def _spawn(self, host: str, port: int) -> None:
+        """Fork a worker."""
+        if not self._free_slots:
+            # Previous generations are still draining
+            return
+
+        slot = self._free_slots.pop(0)
+        pid = os.fork()
+        if pid:
+            self._children[pid] = (slot, self._generation)
+            self._counters["spawned"] += 1
+            return
+
+        # Worker process
+        status = 0
+        try:
+            for sig in (signal.SIGHUP, signal.SIGUSR1, signal.SIGTERM):
+                signal.signal(sig, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+            server = WorkerServer(
+                self.app,
+                self._stats,
+                slot,
+                max_requests=self.max_requests,
+                graceful_timeout=self.graceful_timeout,
+                **self.server_options,
+            )
+            asyncio.run(server.serve(host, port, reuse_port=True))
+        except Exception as err:
+            click.echo(f"Worker {os.getpid()} failed: {err}", err=True)
+            status = 1
+        finally:
+            try:
+                # The loop is closed, its SIGTERM handler with it: don't let the
+                # master interrupt the shutdown. os._exit skips atexit hooks.
+                signal.signal(signal.SIGTERM, signal.SIG_IGN)
+                FOOTPRINTS.flush()
+            finally:
+                sys.stderr.flush()
+                os._exit(status)
+
+    def _reap(self) -> None:
+        """Collect exited workers and release their slots."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+
+            if not pid:
+                return
+
+            slot, generation = self._children.pop(pid)
+            offset = slot * len(STATS_FIELDS)
+            for idx, field in enumerate(STATS_FIELDS):
+                self._totals[field] += self._stats[offset + idx]
+                self._stats[offset + idx] = 0
+            self._free_slots.append(slot)
+
+            if not self._running or generation != self._generation:
+                continue
+
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                self._counters["recycled"] += 1
+            else:
+                self._counters["crashed"] += 1
+
+    def _stop_workers(self, generation: int = None) -> None:
+        """Ask workers (of a generation) to stop."""
+        for pid, (_, gen) in list(self._children.items()):
+            if generation is None or gen == generation:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def stats(self) -> Dict:
+        """Return stats aggregated over current and past workers."""
+        stats: Dict[str, int] = dict(self._totals)
+        for slot, _ in self._children.values():
+            offset = slot * len(STATS_FIELDS)
+            for idx, field in enumerate(STATS_FIELDS):
+                stats[field] += self._stats[offset + idx]
+
+        stats["workers"] = len(self._children)
+        stats.update(self._counters)
+        return stats
+
+    def _on_signal(self, signum: int, frame: Any) -> None:
+        """Handle master signals."""
+        if signum == signal.SIGHUP:
+            self._reload = True
+        elif signum == signal.SIGUSR1:
+            self._report = True
+        else:
+            self._running = False
+
+    def run(self, host: str = "", port: int = 8000) -> None:
+        """Run workers until SIGTERM/SIGINT."""
+        # Fail early if the address can't be bound.
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((host, port))
+
+        for sig in (signal.SIGHUP, signal.SIGUSR1, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._on_signal)
+
+        self._running = True
+        while self._running:
+            self._reap()
+
+            reload, self._reload = self._reload, False
+            if reload:
+                self._counters["restarts"] += 1
+                self._generation += 1
+
+            current = sum(
+                1 for _, gen in self._children.values() if gen == self._generation
+            )
+            for _ in range(self.workers - current):
+                self._spawn(host, port)
+
+            if reload:
+                self._stop_workers(self._generation - 1)
+
+            if self._report:
+                self._report = False
+                click.echo(json.dumps(self.stats()), err=True)
+
+            time.sleep(0.1)
+
+        self._stop_workers()
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+
+        for pid in list(self._children):
+            os.kill(pid, signal.SIGKILL)
+        while self._children:
+            self._reap()
+            time.sleep(0.01)
+
+        click.echo(json.dumps(self.stats()), err=True)
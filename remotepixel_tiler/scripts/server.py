@@ -0,0 +1,282 @@
+"""remotepixel_tiler.scripts.server: asyncio HTTP/1.1 server for lambda-proxy apps."""
+
+from typing import Any, Dict, Optional, Tuple
+
+import base64
+import signal
+import asyncio
+from http import HTTPStatus
+from concurrent import futures
+from urllib.parse import urlparse, parse_qs, parse_qsl
+
+MAX_HEADERS = 100
+
+
+class HTTPError(Exception):
+    """Invalid HTTP request."""
+
+    def __init__(self, status: int, message: str = ""):
+        """Initialize error."""
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncServer(object):
+    """
+    Asyncio HTTP/1.1 server calling a lambda-proxy `API` on a thread pool.
+
+    Connections are kept alive between requests (up to `keepalive_timeout`
+    seconds idle). At most `threads` requests run at once and at most
+    `max_pending` are accepted: when the pool is saturated, connections stop
+    being read until a slot frees up, pushing back on clients through TCP.
+
+    Binary bodies are sent as is, the app base64 encoding being disabled. The
+    app must keep its per-request state by thread (as `proxy.API` does).
+    Request bodies need a `Content-Length`, chunked ones are refused (411).
+
+    `stop()` (or SIGTERM) stops accepting connections, closes idle ones and
+    lets in-flight requests complete for up to `graceful_timeout` seconds. The
+    server also stops by itself after `max_requests` requests (0: unlimited).
+
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        threads: int = 8,
+        max_pending: int = None,
+        keepalive_timeout: float = 5,
+        max_body_size: int = 1024 * 1024,
+        max_requests: int = 0,
+        graceful_timeout: float = 30,
+    ):
+        """Initialize server."""
+        self.app = app
+        self.app.b64encode = False
+        self.threads = threads
+        self.max_pending = max_pending or threads * 4
+        self.keepalive_timeout = keepalive_timeout
+        self.max_body_size = max_body_size
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._executor: Optional[futures.ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._connections: Dict[asyncio.StreamWriter, bool] = {}
+
+    def record(self, status: int, size: int) -> None:
+        """Count a response."""
+        self.requests += 1
+        self.errors += status >= 500
+        self.bytes_sent += size
+        if self.max_requests and self.requests >= self.max_requests:
+            self.stop()
+
+    def stop(self) -> None:
+        """Stop accepting requests and close idle connections."""
+        if self._stopping is None or self._stopping.is_set():
+            return
+
+        self._stopping.set()
+        for writer, idle in self._connections.items():
+            if idle:
+                writer.close()
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> Optional[Tuple[str, str, str, Dict[str, str], bytes]]:
+        """Read a request, return None when the client closed the connection."""
+        try:
+            line = await asyncio.wait_for(reader.readline(), self.keepalive_timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        if not line.strip():
+            return None
+
+        try:
+            method, target, protocol = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid request line")
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+
+            if len(headers) >= MAX_HEADERS:
+                raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+            name, sep, value = line.decode("latin-1").partition(":")
+            if not sep or not name.strip():
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid header line")
+            headers[name.strip()] = value.strip()
+
+        length = self._content_length(headers)
+        body = await reader.readexactly(length) if length else b""
+        return method, target, protocol, headers, body
+
+    def _content_length(self, headers: Dict[str, str]) -> int:
+        """Return the length of the request body."""
+        fields = {k.lower(): v for k, v in headers.items()}
+        if fields.get("transfer-encoding", "identity").lower() != "identity":
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Chunked bodies not supported")
+
+        try:
+            length = int(fields.get("content-length", 0))
+        except ValueError:
+            length = -1
+
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+
+        if length > self.max_body_size:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+        return length
+
+    def _event(
+        self, method: str, target: str, headers: Dict[str, str], body: bytes
+    ) -> Dict:
+        """Return the API Gateway event of a request."""
+        url = urlparse(target)
+        event = {
+            "headers": headers,
+            "path": url.path,
+            "queryStringParameters": dict(parse_qsl(url.query)),
+            "multiValueQueryStringParameters": parse_qs(url.query),
+            "httpMethod": method,
+        }
+        if body:
+            event["body"] = body.decode()
+        return event
+
+    @staticmethod
+    def _keep_alive(protocol: str, headers: Dict[str, str]) -> bool:
+        """Check if the connection should be kept open after the response."""
+        connection = next(
+            (v.lower() for k, v in headers.items() if k.lower() == "connection"), ""
+        )
+        if protocol == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    @staticmethod
+    def _write_response(
+        writer: asyncio.StreamWriter,
+        status: int,
+        headers: Dict[str, str],
+        body: Any,
+        keep_alive: bool,
+        head: bool = False,
+    ) -> None:
+        """Write a response."""
+        if isinstance(body, str):
+            body = body.encode()
+
+        reason = HTTPStatus(status).phrase
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        lines.append(f"Content-Length: {len(body)}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if not head:
+            writer.write(body)
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the requests of a connection."""
+        loop = asyncio.get_running_loop()
+        try:
+            while not self._stopping.is_set():
+                self._connections[writer] = True
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as err:
+                    self._write_response(writer, err.status, {}, str(err), False)
+                    break
+                finally:
+                    self._connections[writer] = False
+
+                if request is None:
+                    break
+
+                method, target, protocol, headers, body = request
+                keep_alive = self._keep_alive(protocol, headers)
+                event = self._event(method, target, headers, body)
+
+                async with self._slots:
+                    response = await loop.run_in_executor(
+                        self._executor, self.app, event, None
+                    )
+
+                body = response.get("body", "")
+                if response.get("isBase64Encoded"):
+                    body = base64.b64decode(body)
+                if isinstance(body, str):
+                    body = body.encode()
+
+                status = int(response["statusCode"])
+                self.record(status, len(body))
+                keep_alive = keep_alive and not self._stopping.is_set()
+                self._write_response(
+                    writer,
+                    status,
+                    response.get("headers", {}),
+                    body,
+                    keep_alive,
+                    head=method == "HEAD",
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def start(
+        self, host: str = "", port: int = 8000, reuse_port: bool = False
+    ) -> asyncio.AbstractServer:
+        """Start listening."""
+        self._executor = futures.ThreadPoolExecutor(max_workers=self.threads)
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._stopping = asyncio.Event()
+        return await asyncio.start_server(
+            self.handle,
+            host or None,
+            port,
+            backlog=self.max_pending,
+            reuse_port=reuse_port or None,
+        )
+
+    async def serve(
+        self, host: str = "", port: int = 8000, reuse_port: bool = False
+    ) -> None:
+        """Serve until stopped, then drain in-flight requests."""
+        server = await self.start(host, port, reuse_port)
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self.stop)
+
+        await self._stopping.wait()
+        server.close()
+        await server.wait_closed()
+
+        deadline = loop.time() + self.graceful_timeout
+        while self._connections and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        self._executor.shutdown(wait=False)
+
+
+def serve(app: Any, host: str = "", port: int = 8000, **kwargs: Any) -> None:
+    """Serve a lambda-proxy app with `AsyncServer`."""
+    asyncio.run(AsyncServer(app, **kwargs).serve(host, port))
@@ -0,0 +1,148 @@
+"""remotepixel_tiler.stats: histogram based dataset statistics cache."""
+
+from typing import Callable, Dict, Hashable, Optional, Sequence
+
+import os
+import copy
+import threading
+from collections import OrderedDict
+
+import numpy
+
+# Histograms are computed with HISTOGRAM_BINS bins and served with
+# RESPONSE_BINS bins (rio-tiler default), each made of consecutive fine bins.
+HISTOGRAM_BINS = 10000
+RESPONSE_BINS = 10
+
+
+def _histogram_value(
+    counts: numpy.ndarray,
+    edges: numpy.ndarray,
+    cumulative: numpy.ndarray,
+    rank: int,
+    integer: bool,
+) -> float:
+    """Return the value of the `rank`-th sorted sample of a histogram."""
+    if rank == 0:
+        return edges[0]
+
+    if rank >= cumulative[-1] - 1:
+        return edges[-1]
+
+    idx = int(numpy.searchsorted(cumulative, rank, side="right"))
+    idx = min(idx, len(counts) - 1)
+    low, high = edges[idx], edges[idx + 1]
+    if integer and high - low <= 1:
+        # Narrow bins hold a single integer value
+        return float(numpy.ceil(low))
+
+    before = cumulative[idx] - counts[idx]
+    return low + (rank - before + 0.5) / counts[idx] * (high - low)
+
+
+def histogram_percentiles(
+    counts: Sequence[int],
+    edges: Sequence[float],
+    percentiles: Sequence[float],
+    integer: bool = False,
+) -> list:
+    """
+    Compute percentiles from a histogram.
+
+    Mirror `numpy.percentile` linear interpolation between the closest ranks,
+    sample values being estimated from their position within their bin (exact
+    for integer data with bins narrower than 1).
+
+    """
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    edges = numpy.asarray(edges, dtype=numpy.float64)
+    cumulative = numpy.cumsum(counts)
+    total = int(cumulative[-1])
+
+    values = []
+    for percentile in percentiles:
+        rank = percentile / 100 * (total - 1)
+        low = int(numpy.floor(rank))
+        value = _histogram_value(counts, edges, cumulative, low, integer)
+        if rank > low:
+            upper = _histogram_value(counts, edges, cumulative, low + 1, integer)
+            value += (rank - low) * (upper - value)
+        values.append(int(value) if integer else float(value))
+
+    return values
+
+
+def band_statistics(stats: Dict, pmin: float = 2, pmax: float = 98) -> Dict:
+    """Return band statistics for `pmin`/`pmax` from fine histogram statistics."""
+    counts, edges = stats["histogram"]
+    integer = isinstance(stats["min"], int)
+
+    out = dict(stats)
+    out["pc"] = histogram_percentiles(counts, edges, (pmin, pmax), integer=integer)
+
+    if len(counts) > RESPONSE_BINS and len(counts) % RESPONSE_BINS == 0:
+        counts = numpy.asarray(counts).reshape(RESPONSE_BINS, -1).sum(axis=1)
+        edges = numpy.linspace(edges[0], edges[-1], RESPONSE_BINS + 1)
+        out["histogram"] = [counts.tolist(), edges.tolist()]
+
+    return out
+
+
+class StatisticsCache(object):
+    """Thread-safe LRU cache of dataset metadata with fine histograms."""
+
+    def __init__(self, maxsize: int = 128):
+        """Initialize cache."""
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        """Return cached metadata."""
+        with self._lock:
+            info = self._items.get(key)
+            if info is not None:
+                self._items.move_to_end(key)
+            return info
+
+    def set(self, key: Hashable, info: Dict) -> Dict:
+        """Cache metadata."""
+        with self._lock:
+            self._items[key] = info
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return info
+
+    def clear(self) -> None:
+        """Remove all cached metadata."""
+        with self._lock:
+            self._items.clear()
+
+
+STATISTICS = StatisticsCache(maxsize=int(os.environ.get("STATS_CACHE_SIZE", 128)))
+
+
+def get_metadata(
+    func: Callable, key: str, pmin: float = 2, pmax: float = 98, **kwargs
+) -> Dict:
+    """
+    Return `func(key)` metadata for pmin/pmax percentiles.
+
+    `func` is a rio-tiler metadata function (e.g. `rio_tiler.main.metadata`).
+    It is called once per key with fine histograms; percentiles are then
+    derived from the cached histograms for any pmin/pmax.
+
+    """
+    cache_key = (key, tuple(sorted(kwargs.items())))
+    info = STATISTICS.get(cache_key)
+    if info is None:
+        info = func(key, histogram_bins=HISTOGRAM_BINS, **kwargs)
+        STATISTICS.set(cache_key, info)
+
+    info = copy.copy(info)
+    info["statistics"] = {
+        band: band_statistics(stats, pmin, pmax)
+        for band, stats in info["statistics"].items()
+    }
+    return info
@@ -1,13 +1,327 @@
 """Utility functions."""
 
-from typing import Tuple
+from typing import Any, Callable, Dict, Tuple, Union
+
+import io
+import json
+import zlib
+import struct
+from functools import lru_cache, partial, wraps
 
 import numpy
 
-from rio_color.operations import parse_operations
-from rio_color.utils import scale_dtype, to_math_type
+from remotepixel_tiler.lazy import lazy_import
+
+color_operations = lazy_import("rio_color.operations")
+color_utils = lazy_import("rio_color.utils")
+profiles = lazy_import("rio_tiler.profiles")
+tiler_utils = lazy_import("rio_tiler.utils")
+rasterio_io = lazy_import("rasterio.io")
+
+try:
+    import zstandard
+except ImportError:  # pragma: nocover
+    zstandard = None
+
+# Tile extensions returning data and mask as is, without post-processing.
+RAW_FORMATS = ("npy", "bin")
+RAW_MAGIC = b"RPXT"
+
+
+@lru_cache(maxsize=None)
+def _get_colormap(name: str) -> numpy.ndarray:
+    """Return a GDAL compatible (256, 3) colormap, loaded once per name."""
+    color_map = tiler_utils.get_colormap(name, format="gdal").astype(numpy.uint8)
+    color_map.setflags(write=False)
+    return color_map
+
+
+def _content_type(ext: str, compress: str = None) -> str:
+    """Return the Content-Type of a tile extension (and raw tile compression)."""
+    if ext in RAW_FORMATS:
+        content_type = "application/x-npy" if ext == "npy" else "application/octet-stream"
+        return f"{content_type}; compression={compress}" if compress else content_type
+
+    return f"image/{ext}"
+
+
+def _negotiate_webp(func: Callable) -> Callable:
+    """
+    Decorator: set `webp=True` on `auto` tile requests accepting WebP.
+
+    The decorated handler gets the API Gateway event of the request as first
+    argument (see `lambda_proxy.proxy.API.pass_event`), which is not passed
+    on. The wrapper `vary` attribute makes `proxy.API` add `Vary: Accept` to
+    `auto` tile responses.
+
+    """
+
+    @wraps(func)
+    def wrapper(event: Dict, *args, **kwargs) -> Any:
+        headers = (event or {}).get("headers") or {}
+        if kwargs.get("ext") == "auto" and "image/webp" in headers.get("accept", ""):
+            kwargs.setdefault("webp", True)
+        return func(*args, **kwargs)
+
+    wrapper.vary = "Accept"  # type: ignore
+    return wrapper
+
+
+def _auto_format(
+    tile: numpy.ndarray,
+    mask: numpy.ndarray,
+    color_map: numpy.ndarray = None,
+    webp: bool = False,
+) -> str:
+    """Return the `auto` tile format: JPEG if opaque, PNG or WebP otherwise."""
+    jpeg_compatible = tile.dtype == numpy.uint8 and (
+        tile.shape[0] == 3 or (tile.shape[0] == 1 and color_map is None)
+    )
+    if jpeg_compatible and mask.all():
+        return "jpeg"
+
+    return "webp" if webp else "png"
+
+
+def _empty_response(
+    tilesize: int, ext: str, webp: bool = False
+) -> Tuple[str, str, bytes]:
+    """Return a fully masked tile response."""
+    if ext == "auto":
+        ext = "webp" if webp else "png"
+
+    driver = "jpeg" if ext == "jpg" else ext
+    return ("OK", _content_type(ext), _empty_tile(tilesize, driver))
+
+
+def _compress(content: bytes, compress: str = None) -> bytes:
+    """Compress raw tile content with `deflate` (zlib) or `zstd`."""
+    if not compress:
+        return content
+
+    if compress == "deflate":
+        return zlib.compress(content)
+
+    if compress == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdCompressor().compress(content)
+
+    raise ValueError(f"Invalid compression: {compress}")
+
+
+def _array_to_raw(
+    tile: numpy.ndarray,
+    mask: numpy.ndarray,
+    img_format: str = "bin",
+    compress: str = None,
+    nodata: Union[int, float] = None,
+) -> bytes:
+    """
+    Translate data and mask to a raw tile buffer.
+
+    `npy`: NumPy `.npy` (bands, height, width) array, the 0/255 mask being
+    appended as last band (int8 or bool data being promoted to int16 or uint8
+    to hold it), compressed as a whole if `compress` is set.
+
+    `bin`: `RPXT` magic, little-endian uint32 header length, JSON header
+    (dtype, shape, nodata, compression) and the C-ordered data followed by the
+    uint8 mask, compressed if `compress` is set.
+
+    """
+    if img_format == "npy":
+        data = numpy.concatenate([tile, mask[numpy.newaxis].astype(numpy.uint8)])
+        buffer = io.BytesIO()
+        numpy.save(buffer, data)
+        return _compress(buffer.getvalue(), compress)
+
+    if nodata is not None and numpy.isnan(nodata):
+        nodata = "nan"
+
+    header = json.dumps(
+        dict(
+            dtype=tile.dtype.name,
+            shape=list(tile.shape),
+            nodata=nodata,
+            compression=compress,
+        )
+    ).encode()
+    content = numpy.ascontiguousarray(tile).tobytes() + mask.astype(numpy.uint8).tobytes()
+    return b"".join(
+        [RAW_MAGIC, struct.pack("<I", len(header)), header, _compress(content, compress)]
+    )
+
+
+@lru_cache(maxsize=32)
+def _empty_tile(tilesize: int, img_format: str = "png") -> bytes:
+    """Return a pre-encoded fully masked tile (transparent, or black for JPEG)."""
+    tile = numpy.zeros((1, tilesize, tilesize), dtype=numpy.uint8)
+    mask = numpy.zeros((tilesize, tilesize), dtype=numpy.uint8)
+    if img_format in RAW_FORMATS:
+        return _array_to_raw(tile, mask, img_format)
+
+    options = profiles.img_profiles.get(img_format, {})
+    return tiler_utils.array_to_image(tile, mask, img_format=img_format, **options)
+
+
+def _rescale_ranges(rescale: str, count: int) -> numpy.ndarray:
+    """Parse a rescale string into a (count, 2) array of in_range values."""
+    rescale_arr = list(map(float, rescale.split(",")))
+    rescale_arr = list(tiler_utils._chunks(rescale_arr, 2))
+    if len(rescale_arr) != count:
+        rescale_arr = ((rescale_arr[0]),) * count
+    return numpy.array(rescale_arr, dtype=numpy.float64)
+
+
+@lru_cache(maxsize=128)
+def _rescale_lut(in_min: float, in_max: float, dtype: str) -> numpy.ndarray:
+    """Return a uint8 lookup table linearly rescaling `dtype` values to 0-255."""
+    values = numpy.arange(numpy.iinfo(dtype).max + 1, dtype=numpy.float64)
+    numpy.clip(values, in_min, in_max, out=values)
+    values -= in_min
+    values /= in_max - in_min
+    values *= 255.0
+    return values.astype(numpy.uint8)
 
-from rio_tiler.utils import linear_rescale, _chunks
+
+def _rescale(
+    tile: numpy.ndarray, mask: numpy.ndarray, ranges: numpy.ndarray
+) -> numpy.ndarray:
+    """Linearly rescale each band of `tile` to uint8, zeroing masked pixels."""
+    out = numpy.empty(tile.shape, dtype=numpy.uint8)
+
+    if tile.dtype in (numpy.uint8, numpy.uint16):
+        for bdx in range(tile.shape[0]):
+            lut = _rescale_lut(*ranges[bdx], tile.dtype.name)
+            numpy.take(lut, tile[bdx], out=out[bdx])
+    else:
+        in_min = ranges[:, 0].astype(numpy.float32).reshape(-1, 1, 1)
+        in_max = ranges[:, 1].astype(numpy.float32).reshape(-1, 1, 1)
+        # New array, the caller's tile is left unchanged
+        data = numpy.clip(tile, in_min, in_max, dtype=numpy.float32)
+        data -= in_min
+        data /= in_max - in_min
+        data *= 255.0
+        numpy.copyto(out, data, casting="unsafe")
+
+    out[:, mask == 0] = 0
+    return out
+
+
+# `rio_color.operations` function and parameter names
+COLOR_OPERATIONS: Dict[str, Tuple[str, ...]] = {
+    "gamma": ("g",),
+    "sigmoidal": ("contrast", "bias"),
+    "saturation": ("proportion",),
+}
+RGB_OPERATIONS = ("saturation",)
+
+
+@lru_cache(maxsize=64)
+def _parse_color_formula(color_formula: str) -> Tuple[Tuple[Callable, Tuple], ...]:
+    """
+    Parse a rio-color formula into (operation, bands) pairs.
+
+    Mirror `rio_color.operations.parse_operations` but keep the operation
+    parameters visible so per-band operations can be compiled to lookup tables.
+    `bands` is None for operations working on the RGB bands together.
+
+    """
+    band_lookup = {"r": 1, "g": 2, "b": 3}
+
+    tokens = [x.strip() for x in color_formula.replace(",", "").split(" ")]
+    operations = []
+    for token in tokens:
+        if token.lower() in COLOR_OPERATIONS:
+            operations.append([])
+        if not operations:
+            raise ValueError("{} is not a valid operation".format(token))
+        operations[-1].append(token.lower())
+
+    result = []
+    for opname, *args in operations:
+        func = getattr(color_operations, opname)
+        kwnames = COLOR_OPERATIONS[opname]
+        if opname in RGB_OPERATIONS:
+            bands = None
+        else:
+            bands = set()
+            for bs in args.pop(0):
+                band = int(bs) if bs.isdigit() else band_lookup[bs]
+                if band < 1 or band > len(band_lookup):
+                    raise ValueError(
+                        "{} BAND must be between 1 and {}".format(
+                            opname, len(band_lookup)
+                        )
+                    )
+                bands.add(band)
+            bands = tuple(sorted(bands))
+
+        kwargs = dict(zip(kwnames, [float(arg) for arg in args]))
+        result.append((partial(func, **kwargs), bands))
+
+    return tuple(result)
+
+
+def _apply_operation(
+    arr: numpy.ndarray, operation: Callable, bands: Tuple[int, ...] = None
+) -> numpy.ndarray:
+    """Apply one color operation on a 0-1 float array and scale it to uint8."""
+    arr = color_utils.to_math_type(arr)
+    out = arr.copy()
+    if bands is None:
+        out[0:3] = operation(out[0:3])
+    else:
+        for b in bands:
+            out[b - 1] = operation(arr[b - 1])
+    return color_utils.scale_dtype(out, numpy.uint8)
+
+
+@lru_cache(maxsize=256)
+def _color_lut(
+    color_formula: str, start: int, stop: int, count: int, dtype: str
+) -> numpy.ndarray:
+    """
+    Compile a run of per-band color operations into a lookup table.
+
+    The operations `start:stop` of the formula are applied, exactly as they
+    would be on the data, to every possible `dtype` value so the run can be
+    replaced by one `numpy.take` per band. Returns a (count, N) uint8 array.
+
+    """
+    operations = _parse_color_formula(color_formula)[start:stop]
+    values = numpy.arange(numpy.iinfo(dtype).max + 1, dtype=dtype)
+    lut = numpy.repeat(values[numpy.newaxis], count, axis=0)
+    for operation, bands in operations:
+        lut = _apply_operation(lut, operation, bands)
+    return lut
+
+
+def _apply_color_formula(tile: numpy.ndarray, color_formula: str) -> numpy.ndarray:
+    """Apply a rio-color formula, using lookup tables for per-band operations."""
+    operations = _parse_color_formula(color_formula)
+
+    idx = 0
+    while idx < len(operations):
+        operation, bands = operations[idx]
+        if bands is None or tile.dtype not in (numpy.uint8, numpy.uint16):
+            tile = _apply_operation(tile, operation, bands)
+            idx += 1
+            continue
+
+        # Collapse the consecutive per-band operations into one lookup table
+        stop = idx + 1
+        while stop < len(operations) and operations[stop][1] is not None:
+            stop += 1
+
+        lut = _color_lut(color_formula, idx, stop, tile.shape[0], tile.dtype.name)
+        out = numpy.empty(tile.shape, dtype=numpy.uint8)
+        for bdx in range(tile.shape[0]):
+            numpy.take(lut[bdx], tile[bdx], out=out[bdx])
+        tile = out
+        idx = stop
+
+    return tile
 
 
 def _postprocess(
@@ -17,25 +331,88 @@ def _postprocess(
     color_formula: str = None,
 ) -> Tuple[numpy.ndarray, numpy.ndarray]:
     if rescale:
-        rescale_arr = list(map(float, rescale.split(",")))
-        rescale_arr = list(_chunks(rescale_arr, 2))
-        if len(rescale_arr) != tile.shape[0]:
-            rescale_arr = ((rescale_arr[0]),) * tile.shape[0]
-        for bdx in range(tile.shape[0]):
-            tile[bdx] = numpy.where(
-                mask,
-                linear_rescale(
-                    tile[bdx], in_range=rescale_arr[bdx], out_range=[0, 255]
-                ),
-                0,
-            )
-        tile = tile.astype(numpy.uint8)
+        tile = _rescale(tile, mask, _rescale_ranges(rescale, tile.shape[0]))
 
     if color_formula:
         # make sure one last time we don't have
         # negative value before applying color formula
-        tile[tile < 0] = 0
-        for ops in parse_operations(color_formula):
-            tile = scale_dtype(ops(to_math_type(tile)), numpy.uint8)
+        if not numpy.issubdtype(tile.dtype, numpy.unsignedinteger):
+            tile[tile < 0] = 0
+        tile = _apply_color_formula(tile, color_formula)
 
     return tile, mask
+
+
+def _paletted_png(
+    tile: numpy.ndarray,
+    mask: numpy.ndarray,
+    color_map: numpy.ndarray,
+    **creation_options,
+) -> bytes:
+    """
+    Encode a single band uint8 tile as an 8-bit paletted PNG.
+
+    Masked pixels are written with a palette index unused by the valid pixels,
+    made transparent through the tRNS chunk. Returns None when every index is
+    used and the tile can't be represented with a palette.
+
+    """
+    data = tile[0]
+    palette = {
+        idx: (int(r), int(g), int(b), 255) for idx, (r, g, b) in enumerate(color_map)
+    }
+
+    if mask is not None:
+        invalid = mask == 0
+        if invalid.any():
+            used = numpy.bincount(data[~invalid], minlength=256)
+            unused = numpy.flatnonzero(used == 0)
+            if not len(unused):
+                return None
+
+            data = data.copy()
+            data[invalid] = unused[0]
+            palette[int(unused[0])] = (0, 0, 0, 0)
+
+    output_profile = dict(
+        driver="PNG",
+        dtype=numpy.uint8,
+        count=1,
+        height=data.shape[0],
+        width=data.shape[1],
+    )
+    output_profile.update(creation_options)
+    with rasterio_io.MemoryFile() as memfile:
+        with memfile.open(**output_profile) as dst:
+            dst.write(data, indexes=1)
+            dst.write_colormap(1, palette)
+        return memfile.read()
+
+
+def _array_to_image(
+    tile: numpy.ndarray,
+    mask: numpy.ndarray = None,
+    img_format: str = "png",
+    color_map: numpy.ndarray = None,
+    **creation_options,
+) -> bytes:
+    """
+    Translate numpy ndarray to image buffer.
+
+    Single band uint8 PNG tiles with a colormap are written as paletted PNG,
+    everything else is delegated to `rio_tiler.utils.array_to_image`.
+
+    """
+    if (
+        color_map is not None
+        and img_format == "png"
+        and tile.shape[0] == 1
+        and tile.dtype == numpy.uint8
+    ):
+        content = _paletted_png(tile, mask, color_map, **creation_options)
+        if content is not None:
+            return content
+
+    return tiler_utils.array_to_image(
+        tile, mask, img_format=img_format, color_map=color_map, **creation_options
+    )
@@ -0,0 +1,144 @@
+"""remotepixel_tiler.warmup: pay first-request initialization costs ahead of time."""
+
+from typing import Any, Callable, Dict, Sequence
+
+import os
+import re
+import time
+
+import numpy
+import mercantile
+
+from remotepixel_tiler.lazy import lazy_import
+from remotepixel_tiler.reader import POOL
+from remotepixel_tiler.utils import _array_to_image, _get_colormap
+
+rasterio_io = lazy_import("rasterio.io")
+transform = lazy_import("rasterio.transform")
+warp = lazy_import("rasterio.warp")
+numexpr = lazy_import("numexpr")
+tiler_utils = lazy_import("rio_tiler.utils")
+
+# Optional small dataset (e.g. a COG on S3) opened to set up the HTTP/TLS
+# session, it is kept in the dataset pool.
+WARMUP_DATASET = os.environ.get("WARMUP_DATASET")
+WARMUP_COLORMAPS = tuple(
+    filter(None, os.environ.get("WARMUP_COLORMAPS", "cfastie,rplumbo").split(","))
+)
+
+
+def _gdal() -> None:
+    """Register GDAL drivers and run a reprojected read of an in-memory dataset."""
+    data = numpy.arange(64 * 64, dtype=numpy.uint16).reshape(1, 64, 64)
+    profile = dict(
+        driver="GTiff",
+        dtype="uint16",
+        count=1,
+        height=64,
+        width=64,
+        crs="EPSG:4326",
+        transform=transform.from_bounds(0, 0, 10, 10, 64, 64),
+        nodata=0,
+    )
+    bounds = mercantile.xy_bounds(mercantile.Tile(x=8, y=7, z=4))
+    with rasterio_io.MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(data)
+
+        with memfile.open() as src_dst:
+            tiler_utils._tile_read(src_dst, bounds, 64)
+
+
+def _proj() -> None:
+    """Load the PROJ database for UTM and web mercator transformations."""
+    warp.transform_bounds("EPSG:32633", "EPSG:4326", 300000, 0, 400000, 100000)
+    warp.transform_bounds("EPSG:4326", "EPSG:3857", 0, 0, 10, 10)
+
+
+def _dataset(address: str) -> None:
+    """Open a dataset through the pool."""
+    with POOL.open(address) as src_dst:
+        src_dst.profile
+
+
+def _colormaps(names: Sequence[str]) -> None:
+    """Load and cache colormaps."""
+    for name in names:
+        _get_colormap(name)
+
+
+def _expressions(expressions: Sequence[str], dtype: str) -> None:
+    """Compile band math expressions as `reader.expression` evaluates them."""
+    for expr in expressions:
+        bands = set(re.findall(r"b(?P<bands>[0-9A]{1,2})", expr))
+        arr = {f"b{b}": numpy.ones((16, 16), dtype=dtype) for b in bands}
+        for bloc in expr.split(","):
+            numexpr.evaluate(bloc.strip(), local_dict=arr)
+
+
+def _encoders() -> None:
+    """Encode a dummy tile in every image format."""
+    tile = numpy.zeros((3, 16, 16), dtype=numpy.uint8)
+    mask = numpy.full((16, 16), 255, dtype=numpy.uint8)
+    for img_format in ("png", "jpeg", "webp"):
+        _array_to_image(tile, mask, img_format=img_format)
+
+
+def warmup(
+    expressions: Sequence[str] = (),
+    dtype: str = "uint16",
+    dataset: str = None,
+    colormaps: Sequence[str] = None,
+) -> Dict[str, float]:
+    """
+    Run the code paths a first tile request initializes, without serving one.
+
+    Returns the duration (ms) of each step: GDAL drivers and warper, PROJ
+    database, optional `dataset` (or WARMUP_DATASET) opening, colormaps,
+    `expressions` compilation (for `dtype` bands) and image encoders.
+
+    """
+    dataset = dataset or WARMUP_DATASET
+    colormaps = WARMUP_COLORMAPS if colormaps is None else colormaps
+
+    steps = [("gdal", _gdal, ()), ("proj", _proj, ())]
+    if dataset:
+        steps.append(("dataset", _dataset, (dataset,)))
+    steps += [
+        ("colormaps", _colormaps, (colormaps,)),
+        ("expressions", _expressions, (expressions, dtype)),
+        ("encoders", _encoders, ()),
+    ]
+
+    timings = {}
+    for name, func, args in steps:
+        start = time.perf_counter()
+        func(*args)
+        timings[name] = round((time.perf_counter() - start) * 1000, 3)
+
+    return timings
+
+
+def is_ping(event: Dict) -> bool:
+    """Check if a Lambda event is a scheduled (CloudWatch) or warm-up ping."""
+    return event.get("source") == "aws.events" or bool(event.get("warmup"))
+
+
+def lambda_handler(app: Callable, **options: Any) -> Callable:
+    """
+    Return a Lambda handler answering ping events with `warmup(**options)`.
+
+    Other events are passed to `app`. With WARMUP_ON_INIT set, the warm-up also
+    runs when the handler is created, during the container initialization.
+
+    """
+
+    def handler(event: Dict, context: Any) -> Any:
+        if is_ping(event):
+            return warmup(**options)
+        return app(event, context)
+
+    if os.environ.get("WARMUP_ON_INIT") in ("true", "1"):
+        warmup(**options)
+
+    return handler
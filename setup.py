@@ -1,7 +1,12 @@
 """Setup remotepixel-tiler"""
 
+import re
+
 from setuptools import setup, find_packages
 
+with open("remotepixel_tiler/__init__.py") as f:
+    version = re.search(r'^version = "(.+)"$', f.read(), re.M).group(1)
+
 # Runtime requirements.
 inst_reqs = [
     "aws-sat-api~=2.0",
@@ -14,11 +19,12 @@ inst_reqs = [
 extra_reqs = {
     "test": ["mock", "pytest", "pytest-cov"],
     "dev": ["mock", "pytest", "pytest-cov", "pre-commit"],
+    "zstd": ["zstandard"],
 }
 
 setup(
     name="remotepixel-tiler",
-    version="5.0.1",
+    version=version,
     description=u"""""",
     long_description=u"",
     python_requires=">=3",
@@ -0,0 +1,63 @@
+"""tests remotepixel_tiler.batch."""
+
+import pytest
+
+from remotepixel_tiler.batch import (
+    BatchError,
+    pack_tiles,
+    parse_tiles,
+    render_batch,
+    unpack_tiles,
+)
+
+
+def test_parse_tiles():
+    """Should accept lists and z/x/y strings."""
+    assert parse_tiles("[[2, 1, 3], [4, 5, 6]]") == [(2, 1, 3), (4, 5, 6)]
+    assert parse_tiles('{"tiles": ["2/1/3"]}') == [(2, 1, 3)]
+
+    with pytest.raises(BatchError):
+        parse_tiles("[[1, 2]]")
+
+    with pytest.raises(BatchError):
+        parse_tiles("[]")
+
+    with pytest.raises(BatchError):
+        parse_tiles("2/1/3")
+
+    with pytest.raises(BatchError):
+        parse_tiles('["1/2/a"]')
+
+    with pytest.raises(BatchError):
+        parse_tiles("[[-1, 0, 0]]")
+
+    with pytest.raises(BatchError):
+        parse_tiles('["2/4/0"]')
+
+    with pytest.raises(BatchError):
+        parse_tiles('["256/0/0"]')
+
+    with pytest.raises(BatchError):
+        parse_tiles('["40/4294967296/0"]')
+
+
+def test_pack_tiles():
+    """Should round trip length-prefixed tiles."""
+    tiles = [((1, 2, 3), b"png"), ((4, 5, 6), b"")]
+    assert unpack_tiles(pack_tiles(tiles)) == tiles
+
+
+def test_render_batch():
+    """Should render every tile, failing tiles being empty."""
+
+    def handler(z, x, y, ext="png"):
+        if z == 0:
+            raise ValueError("Invalid tile")
+        return ("OK", f"image/{ext}", f"{z}/{x}/{y}".encode())
+
+    payload = render_batch(handler, '["2/1/3", "0/0/0", [4, 5, 6]]', ext="jpg")
+    assert unpack_tiles(payload) == [
+        ((2, 1, 3), b"2/1/3"),
+        ((0, 0, 0), b""),
+        ((4, 5, 6), b"4/5/6"),
+    ]
@@ -0,0 +1,394 @@
+"""tests remotepixel_tiler.cache."""
+
+import os
+import socket
+import threading
+import socketserver
+
+import pytest
+from mock import patch
+
+from remotepixel_tiler import cache
+from remotepixel_tiler.cache import (
+    DiskCache,
+    MemcachedCache,
+    MemoryCache,
+    SingleFlight,
+    cache_key,
+    cached,
+    get_caches,
+)
+
+
+def test_cache_key():
+    """Should normalize parameters."""
+    assert cache_key("tile", z=1, x=2, y=3) == cache_key("tile", y=3, x=2, z=1)
+    assert cache_key("tile", z=1, x=2, y=3, expr=None) == cache_key(
+        "tile", z=1, x=2, y=3
+    )
+    assert cache_key("tile", z=1, x=2, y=3) != cache_key("tiles", z=1, x=2, y=3)
+
+
+def test_memory_cache():
+    """Should evict least recently used responses over the byte budget."""
+    tiles = MemoryCache(max_size=10)
+    tiles.set("a", ("OK", "image/png", b"1234"))
+    tiles.set("b", ("OK", "image/png", b"1234"))
+    assert tiles.get("a")
+    tiles.set("c", ("OK", "image/png", b"1234"))
+    assert tiles.size == 8
+    assert tiles.get("b") is None
+    assert tiles.get("c")
+    assert tiles.stats()["hits"] == 2
+    assert tiles.stats()["misses"] == 1
+
+    # too big to be cached
+    tiles.set("d", ("OK", "image/png", b"12345678901"))
+    assert tiles.get("d") is None
+    assert len(tiles) == 2
+
+
+def test_cached():
+    """Should cache successful responses only."""
+    calls = []
+
+    def tile(z: int, x: int, y: int, scale: int = 1, ext: str = "png"):
+        calls.append((z, x, y))
+        status = "OK" if z else "ERROR"
+        return (status, f"image/{ext}", b"tile")
+
+    with patch.object(cache, "CACHES", [MemoryCache(max_size=1024)]):
+        handler = cached(tile)
+        assert handler(z=1, x=1, y=1) == ("OK", "image/png", b"tile")
+        assert handler(z=1, x=1, y=1, scale=1)
+        assert len(calls) == 1
+        handler(z=1, x=1, y=1, ext="jpg")
+        assert len(calls) == 2
+
+        handler(z=0, x=0, y=0)
+        handler(z=0, x=0, y=0)
+        assert len(calls) == 4
+
+    handler(z=1, x=1, y=1)
+    assert len(calls) == 5
+
+
+def test_cached_coalesce():
+    """Should coalesce concurrent sibling calls on a single group render."""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def tile(z: int, x: int, y: int):
+        calls.append((z, x, y))
+        started.set()
+        release.wait(5)
+        for sibling in range(4):
+            cache.cache_sibling(("OK", "image/png", b"%d" % sibling), x=sibling)
+        return ("OK", "image/png", b"%d" % x)
+
+    def parent(arguments):
+        return dict(arguments, x=arguments["x"] // 4, metatile=4)
+
+    flights = SingleFlight(timeout=5)
+    with patch.object(cache, "CACHES", [MemoryCache(max_size=1024)]), patch.object(
+        cache, "FLIGHTS", flights
+    ):
+        handler = cached(coalesce=parent)(tile)
+        results = {}
+
+        def request(x):
+            results[x] = handler(z=2, x=x, y=0)
+
+        threads = [threading.Thread(target=request, args=(x,)) for x in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while flights.coalesced < 3:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert calls == [(2, 0, 0)]
+        assert results == {x: ("OK", "image/png", b"%d" % x) for x in range(4)}
+
+        # Siblings missing from the caches are rendered
+        assert handler(z=2, x=4, y=0) == ("OK", "image/png", b"4")
+        assert handler(z=2, x=5, y=0) == ("OK", "image/png", b"5")
+        assert len(calls) == 3
+
+
+def test_single_flight():
+    """Should share one call between concurrent identical calls."""
+    flights = SingleFlight(timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def render(z):
+        calls.append(z)
+        started.set()
+        release.wait(5)
+        return ("OK", "image/png", b"tile")
+
+    results = []
+
+    def request():
+        results.append(flights.do("key", render, 1))
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while flights.coalesced < 3:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == [("OK", "image/png", b"tile")] * 4
+    assert flights.stats() == dict(calls=1, coalesced=3, timeouts=0, in_flight=0)
+
+    assert flights.do("key", render, 2)
+    assert calls == [1, 2]
+
+
+def test_single_flight_errors():
+    """Should share errors and stop waiting after the timeout."""
+    flights = SingleFlight(timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def render():
+        started.set()
+        release.wait(5)
+        raise ValueError()
+
+    def request():
+        try:
+            flights.do("key", render)
+        except ValueError as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=request) for _ in range(2)]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+    while flights.coalesced < 1:
+        pass
+
+    impatient = SingleFlight(timeout=0.01)
+    leader = threading.Thread(target=impatient.do, args=("key", release.wait, 5))
+    leader.start()
+    while not len(impatient):
+        pass
+    assert impatient.do("key", lambda: "again") == "again"
+    assert impatient.timeouts == 1
+
+    release.set()
+    for thread in threads + [leader]:
+        thread.join()
+    assert len(errors) == 2
+    assert not len(flights)
+
+
+def test_disk_cache(tmpdir):
+    """Should store responses on disk and evict least recently used ones."""
+    directory = str(tmpdir)
+    tiles = DiskCache(directory=directory, max_size=40)
+    key_a = cache_key("tile", z=1)
+    key_b = cache_key("tile", z=2)
+    key_c = cache_key("tile", z=3)
+
+    tiles.set(key_a, ("OK", "image/png", b"1234"))
+    tiles.set(key_b, ("OK", "application/json", '{"a": 1}'))
+    assert tiles.get(key_a) == ("OK", "image/png", b"1234")
+    assert tiles.get(key_b) == ("OK", "application/json", '{"a": 1}')
+    assert tiles.get(key_c) is None
+    assert tiles.stats()["hits"] == 2
+    assert tiles.stats()["misses"] == 1
+
+    # index is rebuilt from the files on disk, ignoring other files
+    tmpdir.join("footprints.json").write("{}")
+    tmpdir.join("other", "file").write("data", ensure=True)
+    tiles = DiskCache(directory=directory, max_size=40)
+    assert len(tiles) == 2
+    assert tiles.size == 14 + 25
+
+    tiles = DiskCache(directory=directory, max_size=40)
+    tiles.get(key_a)
+    tiles.set(key_c, ("OK", "image/png", b"5678"))
+    assert tiles.get(key_b) is None
+    assert tiles.get(key_a)
+    assert tiles.get(key_c)
+    assert not [f for f in tmpdir.visit() if f.basename.startswith(".")]
+
+    tiles.clear()
+    assert len(tiles) == 0
+    assert tiles.get(key_a) is None
+
+
+def test_disk_cache_shared(tmpdir):
+    """Should bound the files written by several processes."""
+    directory = str(tmpdir)
+    first = DiskCache(directory=directory, max_size=40, rescan_interval=0)
+    second = DiskCache(directory=directory, max_size=40, rescan_interval=0)
+    keys = [cache_key("tile", z=z) for z in range(4)]
+
+    first.set(keys[0], ("OK", "image/png", b"1234"))
+    second.set(keys[1], ("OK", "image/png", b"5678"))
+    first.set(keys[2], ("OK", "image/png", b"9012"))
+    second.set(keys[3], ("OK", "image/png", b"3456"))
+
+    files = [f for f in tmpdir.visit() if f.isfile()]
+    assert sum(f.size() for f in files) <= 40
+    assert len(files) == 2
+    assert first.get(keys[3]) == ("OK", "image/png", b"3456")
+    assert second.get(keys[0]) is None
+
+
+def test_disk_cache_corrupt(tmpdir):
+    """Should treat corrupt files as misses and remove them."""
+    tiles = DiskCache(directory=str(tmpdir), max_size=40)
+    key = cache_key("tile", z=1)
+    tiles.set(key, ("OK", "image/png", b"1234"))
+
+    path = tiles._path(key)
+    with open(path, "wb") as f:
+        f.write(b"garbage")
+
+    assert tiles.get(key) is None
+    assert tiles.stats()["misses"] == 1
+    assert not os.path.exists(path)
+    assert len(tiles) == 0
+    assert tiles.size == 0
+
+
+def test_cached_disk(tmpdir):
+    """Should serve responses from disk when not in memory."""
+    calls = []
+
+    def metadata(scene: str):
+        calls.append(scene)
+        return ("OK", "application/json", '{"scene": "%s"}' % scene)
+
+    memory = MemoryCache(max_size=1024)
+    disk = DiskCache(directory=str(tmpdir), max_size=1024)
+    with patch.object(cache, "CACHES", [memory, disk]):
+        handler = cached(metadata)
+        assert handler("LC8") == ("OK", "application/json", '{"scene": "LC8"}')
+        memory.clear()
+        assert handler(scene="LC8") == ("OK", "application/json", '{"scene": "LC8"}')
+        assert len(calls) == 1
+        assert disk.stats()["hits"] == 1
+
+        # disk hits are copied to memory
+        assert handler(scene="LC8") == ("OK", "application/json", '{"scene": "LC8"}')
+        assert memory.stats()["hits"] == 1
+        assert disk.stats()["hits"] == 1
+
+
+class MemcachedHandler(socketserver.StreamRequestHandler):
+    """Minimal memcached text protocol server."""
+
+    def handle(self):
+        """Handle get/set/flush_all commands."""
+        store = self.server.store
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            command = line.split()
+            if command[0] == b"get":
+                key = command[1]
+                if key in store:
+                    value = store[key]
+                    self.wfile.write(b"VALUE %s 0 %d\r\n" % (key, len(value)))
+                    self.wfile.write(value + b"\r\n")
+                self.wfile.write(b"END\r\n")
+            elif command[0] == b"set":
+                value = self.rfile.read(int(command[4]) + 2)[:-2]
+                store[command[1]] = value
+                self.wfile.write(b"STORED\r\n")
+            elif command[0] == b"flush_all":
+                store.clear()
+                self.wfile.write(b"OK\r\n")
+            else:
+                self.wfile.write(b"ERROR\r\n")
+
+
+@pytest.fixture()
+def memcached():
+    """Run a local memcached stand-in server."""
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), MemcachedHandler)
+    server.daemon_threads = True
+    server.store = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_memcached_cache(memcached):
+    """Should store and fetch responses from memcached."""
+    host, port = memcached.server_address
+    tiles = MemcachedCache([f"{host}:{port}"], ttl=60)
+    key = cache_key("tile", z=1)
+
+    assert tiles.get(key) is None
+    tiles.set(key, ("OK", "image/png", b"\x89PNG\r\n"))
+    assert tiles.get(key) == ("OK", "image/png", b"\x89PNG\r\n")
+    tiles.set(key, ("OK", "application/json", "{}"))
+    assert tiles.get(key) == ("OK", "application/json", "{}")
+    assert tiles.stats() == dict(hits=2, misses=1, errors=0, down=0)
+
+    tiles.clear()
+    assert tiles.get(key) is None
+
+    # too big items are not sent
+    tiles = MemcachedCache([f"{host}:{port}"], max_item_size=10)
+    tiles.set(key, ("OK", "image/png", b"0123456789"))
+    assert not memcached.store
+
+
+def test_memcached_cache_unavailable():
+    """Should treat connection errors as cache misses."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    tiles = MemcachedCache([f"127.0.0.1:{port}"], timeout=0.1)
+    key = cache_key("tile", z=1)
+    tiles.set(key, ("OK", "image/png", b"tile"))
+    assert tiles.get(key) is None
+    assert tiles.stats() == dict(hits=0, misses=1, errors=1, down=1)
+
+    # Down servers are retried after `retry_interval`
+    tiles = MemcachedCache([f"127.0.0.1:{port}"], timeout=0.1, retry_interval=0)
+    tiles.set(key, ("OK", "image/png", b"tile"))
+    assert tiles.get(key) is None
+    assert tiles.stats() == dict(hits=0, misses=1, errors=2, down=0)
+
+
+def test_get_caches(monkeypatch, tmpdir):
+    """Should create cache backends from the environment."""
+    monkeypatch.delenv("TILE_CACHE_MAX_SIZE", raising=False)
+    monkeypatch.delenv("TILE_CACHE_DIR", raising=False)
+    monkeypatch.delenv("MEMCACHED_SERVERS", raising=False)
+    assert get_caches() == []
+
+    monkeypatch.setenv("TILE_CACHE_MAX_SIZE", "1024")
+    monkeypatch.setenv("TILE_CACHE_DIR", str(tmpdir))
+    monkeypatch.setenv("TILE_CACHE_DISK_MAX_SIZE", "1024")
+    monkeypatch.setenv("MEMCACHED_SERVERS", "127.0.0.1:11211,127.0.0.2:11211")
+    caches = get_caches()
+    assert [type(c) for c in caches] == [MemoryCache, DiskCache, MemcachedCache]
+    assert caches[2].servers == [("127.0.0.1", 11211), ("127.0.0.2", 11211)]
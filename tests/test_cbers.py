@@ -5,7 +5,7 @@ import json
 import numpy
 
 import pytest
-from mock import patch
+from mock import ANY, patch
 
 from remotepixel_tiler.cbers import APP
 
@@ -103,6 +103,7 @@ def test_bounds(cbers, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "application/json",
     }
     statusCode = 200
@@ -128,6 +129,7 @@ def test_metadata(cbers, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "application/json",
     }
     statusCode = 200
@@ -222,6 +224,7 @@ def test_tiles_expr(expression, cbers, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -248,7 +251,7 @@ def test_tiles_expr(expression, cbers, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
-        "Content-Encoding": "gzip",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -261,15 +264,15 @@ def test_tiles_expr(expression, cbers, event):
     cbers.assert_not_called()
 
 
-@patch("remotepixel_tiler.cbers.cbers")
+@patch("remotepixel_tiler.cbers.cbers_tile")
 @patch("remotepixel_tiler.cbers.expression")
-def test_tiles_bands(expression, cbers, event):
+def test_tiles_bands(expression, cbers_tile, event):
     """Should work as expected (get metadata)."""
     tilesize = 256
     tile = numpy.random.rand(3, tilesize, tilesize) * 1000
     mask = numpy.full((tilesize, tilesize), 255)
 
-    cbers.tile.return_value = (tile.astype(numpy.uint8), mask)
+    cbers_tile.return_value = (tile.astype(numpy.uint8), mask)
 
     event["path"] = "/tiles/CBERS_4_MUX_20171121_057_094_L2/10/664/495.png"
     event["httpMethod"] = "GET"
@@ -285,7 +288,7 @@ def test_tiles_bands(expression, cbers, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
-        "Content-Encoding": "gzip",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
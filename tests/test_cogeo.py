@@ -1,14 +1,21 @@
 """tests remotepixel_tiler.landsat."""
 
+import io
 import os
 import json
+import zlib
+import base64
 
 import numpy
 
 import pytest
-from mock import patch
+from mock import ANY, patch
 
+from rio_tiler.errors import TileOutsideBounds
+
+from remotepixel_tiler.batch import unpack_tiles
 from remotepixel_tiler.cogeo import APP
+from remotepixel_tiler.utils import _empty_tile
 
 metadata_results = os.path.join(
     os.path.dirname(__file__), "fixtures", "metadata_cogeo.json"
@@ -60,6 +67,7 @@ def test_bounds(cogeo, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "application/json",
     }
     statusCode = 200
@@ -107,6 +115,7 @@ def test_metadata(cogeo, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "application/json",
     }
     statusCode = 200
@@ -120,6 +129,26 @@ def test_metadata(cogeo, event):
     assert len(result["statistics"].keys()) == 3
 
 
+@patch("remotepixel_tiler.cogeo.main_metadata")
+@patch("remotepixel_tiler.cogeo.main")
+def test_metadata_approx(cogeo, main_metadata, event):
+    """Should compute metadata from a bounded overview read."""
+    main_metadata.return_value = metadata_results
+
+    event["path"] = "/metadata"
+    event["httpMethod"] = "GET"
+    event["queryStringParameters"] = {
+        "url": "https://a-totally-fake-url.fake/my.tif",
+        "max_size": "512",
+    }
+
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    assert len(json.loads(res["body"])["statistics"].keys()) == 3
+    assert main_metadata.call_args[1]["max_size"] == 512
+    cogeo.metadata.assert_not_called()
+
+
 @patch("remotepixel_tiler.cogeo.main")
 def test_tiles_error(cogeo, event):
     """Should work as expected (raise errors)."""
@@ -192,6 +221,7 @@ def test_tiles_expr(expression, cogeo, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -217,8 +247,8 @@ def test_tiles_expr(expression, cogeo, event):
         "Access-Control-Allow-Credentials": "true",
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
-        "Content-Encoding": "gzip",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -231,15 +261,15 @@ def test_tiles_expr(expression, cogeo, event):
     cogeo.assert_not_called()
 
 
-@patch("remotepixel_tiler.cogeo.main")
+@patch("remotepixel_tiler.cogeo.main_tile")
 @patch("remotepixel_tiler.cogeo.expression")
-def test_tiles_bands(expression, cogeo, event):
+def test_tiles_bands(expression, main_tile, event):
     """Should work as expected (get tile)."""
     tilesize = 256
     tile = numpy.random.rand(3, tilesize, tilesize) * 1000
     mask = numpy.full((tilesize, tilesize), 255)
 
-    cogeo.tile.return_value = (tile.astype(numpy.uint8), mask)
+    main_tile.return_value = (tile.astype(numpy.uint8), mask)
 
     event["path"] = "/tiles/19/319379/270522.png"
     event["httpMethod"] = "GET"
@@ -253,8 +283,8 @@ def test_tiles_bands(expression, cogeo, event):
         "Access-Control-Allow-Credentials": "true",
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
-        "Content-Encoding": "gzip",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -265,3 +295,117 @@ def test_tiles_bands(expression, cogeo, event):
     assert res["isBase64Encoded"]
     assert res["body"]
     expression.assert_not_called()
+
+
+@patch("remotepixel_tiler.cogeo.main_tile")
+def test_tiles_outside_bounds(main_tile, event):
+    """Should return a transparent tile when the tile is outside the bounds."""
+    main_tile.side_effect = TileOutsideBounds("Tile 19/319379/270522 is outside")
+
+    event["path"] = "/tiles/19/319379/270522@2x.png"
+    event["httpMethod"] = "GET"
+    event["queryStringParameters"] = {
+        "indexes": "1,2,3",
+        "url": "https://a-totally-fake-url.fake/my.tif",
+    }
+
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["Content-Type"] == "image/png"
+    assert base64.b64decode(res["body"]) == _empty_tile(512, "png")
+
+
+@patch("remotepixel_tiler.cogeo.main_tile")
+def test_tiles_batch(main_tile, event):
+    """Should return many tiles in one response."""
+    tilesize = 256
+    tile = numpy.random.rand(3, tilesize, tilesize) * 10000
+    mask = numpy.full((tilesize, tilesize), 255)
+    main_tile.return_value = (tile, mask)
+
+    event["path"] = "/tiles/batch.png"
+    event["httpMethod"] = "POST"
+    event["queryStringParameters"] = {
+        "url": "https://a-totally-fake-url.fake/my.tif",
+        "rescale": "0,10000",
+    }
+    event["body"] = json.dumps(["19/319379/270522", [19, 319380, 270522]])
+
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["Content-Type"] == "application/octet-stream"
+    assert res["isBase64Encoded"]
+    tiles = unpack_tiles(base64.b64decode(res["body"]))
+    assert [t for t, _ in tiles] == [(19, 319379, 270522), (19, 319380, 270522)]
+    assert all(content.startswith(b"\x89PNG") for _, content in tiles)
+    assert main_tile.call_count == 2
+
+    event["body"] = json.dumps([[-1, 0, 0]])
+    res = APP(event, {})
+    assert res["statusCode"] == 400
+    assert main_tile.call_count == 2
+
+
+@patch("remotepixel_tiler.cogeo._postprocess")
+@patch("remotepixel_tiler.cogeo.main_tile")
+def test_tiles_npy(main_tile, postprocess, event):
+    """Should return raw data and mask without post-processing."""
+    tile = numpy.random.rand(3, 256, 256).astype(numpy.float32)
+    mask = numpy.full((256, 256), 255, dtype=numpy.uint8)
+    main_tile.return_value = (tile, mask)
+
+    event["path"] = "/tiles/19/319379/270522.npy"
+    event["queryStringParameters"] = {"url": "https://a-totally-fake-url.fake/my.tif"}
+
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["Content-Type"] == "application/x-npy"
+    data = numpy.load(io.BytesIO(base64.b64decode(res["body"])))
+    assert data.shape == (4, 256, 256)
+    numpy.testing.assert_array_equal(data[:3], tile)
+    postprocess.assert_not_called()
+
+    # Compressed raw tiles are not gzipped again
+    event["path"] = "/tiles/19/319379/270523.npy"
+    event["queryStringParameters"]["compress"] = "deflate"
+    event["headers"]["Accept-Encoding"] = "gzip"
+    res = APP(event, {})
+    assert res["headers"]["Content-Type"] == "application/x-npy; compression=deflate"
+    assert "Content-Encoding" not in res["headers"]
+    body = zlib.decompress(base64.b64decode(res["body"]))
+    assert numpy.load(io.BytesIO(body)).shape == (4, 256, 256)
+
+
+@patch("remotepixel_tiler.cogeo.main_tile")
+def test_tiles_auto(main_tile, event):
+    """Should pick JPEG for opaque tiles, PNG or WebP otherwise."""
+    tile = numpy.random.randint(0, 255, (3, 256, 256), dtype=numpy.uint8)
+    mask = numpy.full((256, 256), 255, dtype=numpy.uint8)
+    main_tile.return_value = (tile, mask)
+
+    event["path"] = "/tiles/19/319379/270522.auto"
+    event["queryStringParameters"] = {"url": "https://a-totally-fake-url.fake/my.tif"}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["Content-Type"] == "image/jpeg"
+    assert res["headers"]["Vary"] == "Accept"
+
+    mask[0:10] = 0
+    event["path"] = "/tiles/19/319379/270523.auto"
+    res = APP(event, {})
+    assert res["headers"]["Content-Type"] == "image/png"
+
+    event["path"] = "/tiles/19/319379/270524.auto"
+    event["headers"]["Accept"] = "image/webp,image/*,*/*;q=0.8"
+    res = APP(event, {})
+    assert res["headers"]["Content-Type"] == "image/webp"
+    assert base64.b64decode(res["body"])[8:12] == b"WEBP"
+
+
+def test_warmup(event):
+    """Should warm the container up without reading any tile."""
+    event["path"] = "/warmup"
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    timings = json.loads(res["body"])
+    assert set(timings) >= {"gdal", "proj", "colormaps", "expressions", "encoders"}
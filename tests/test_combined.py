@@ -0,0 +1,91 @@
+"""tests remotepixel_tiler.combined."""
+
+import json
+
+import pytest
+from mock import patch
+
+from remotepixel_tiler.combined import APP
+
+
+@pytest.fixture(autouse=True)
+def testing_env_var(monkeypatch):
+    """Set fake env to make sure we don't hit AWS services."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "jqt")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "rde")
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    monkeypatch.setenv("AWS_CONFIG_FILE", "/tmp/noconfigheere")
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", "/tmp/noconfighereeither")
+    monkeypatch.setenv("TOKEN", "YO")
+
+
+@pytest.fixture()
+def event():
+    """Event fixture."""
+    return {
+        "path": "/",
+        "httpMethod": "GET",
+        "headers": {"Host": "tiler.remotepixel.ca"},
+        "queryStringParameters": {},
+    }
+
+
+def test_routing(event):
+    """Should route requests to the tiler mounted at the path prefix."""
+    event["path"] = "/favicon.ico"
+    res = APP(event, {})
+    assert res["statusCode"] == 204
+
+    event["path"] = "/cogeo/favicon.ico"
+    res = APP(event, {})
+    assert res["statusCode"] == 204
+
+    event["path"] = "/cogeos/favicon.ico"
+    res = APP(event, {})
+    assert res["statusCode"] == 400
+
+    event["path"] = "/landsat/metadata/LC80230312016320LGN00"
+    event["queryStringParameters"] = {"access_token": "NO"}
+    res = APP(event, {})
+    assert res["statusCode"] == 500
+
+
+def test_tilejson(event):
+    """Should build tile URLs with the mount prefix."""
+    sceneid = "LC80230320016320LGN00"
+    event["path"] = "/landsat/tilejson.json"
+    event["queryStringParameters"] = {"sceneid": sceneid}
+    event["multiValueQueryStringParameters"] = {"sceneid": [sceneid]}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    tile_url = json.loads(res["body"])["tiles"][0]
+    assert tile_url.startswith(f"https://tiler.remotepixel.ca/landsat/tiles/{sceneid}/")
+
+    # API Gateway proxy resource and custom domain path mapping
+    event["path"] = "/v1/landsat/tilejson.json"
+    event["resource"] = "/{proxy+}"
+    event["pathParameters"] = {"proxy": "landsat/tilejson.json"}
+    res = APP(event, {})
+    tile_url = json.loads(res["body"])["tiles"][0]
+    assert tile_url.startswith("https://tiler.remotepixel.ca/v1/landsat/tiles/")
+
+    # API Gateway stage
+    event["path"] = "/landsat/tilejson.json"
+    event["headers"] = {"Host": "abc.execute-api.us-west-2.amazonaws.com"}
+    event["requestContext"] = {"stage": "production"}
+    res = APP(event, {})
+    tile_url = json.loads(res["body"])["tiles"][0]
+    assert tile_url.startswith(
+        "https://abc.execute-api.us-west-2.amazonaws.com/production/landsat/tiles/"
+    )
+
+
+@patch("remotepixel_tiler.cogeo.main")
+def test_cogeo_bounds(cogeo, event):
+    """Should answer mounted tilers requests."""
+    cogeo.bounds.return_value = {"url": "my.tif", "bounds": [0, 0, 1, 1]}
+    event["path"] = "/cogeo/bounds"
+    event["queryStringParameters"] = {"url": "my.tif"}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    assert json.loads(res["body"])["bounds"] == [0, 0, 1, 1]
@@ -0,0 +1,117 @@
+"""tests remotepixel_tiler.footprint."""
+
+import time
+
+from mock import patch
+
+from remotepixel_tiler.footprint import FootprintCache
+
+
+def test_footprint_intersects():
+    """Should reject tiles outside known footprints only."""
+    cache = FootprintCache()
+    assert cache.intersects("LC80230312016320LGN00", 8, 65, 94)
+
+    cache.set("LC80230312016320LGN00", [-89.79, 40.65, -86.91, 42.84], 7, 12)
+    assert cache.intersects("LC80230312016320LGN00", 8, 65, 94)
+    assert not cache.intersects("LC80230312016320LGN00", 8, 10, 10)
+    assert not cache.intersects("LC80230312016320LGN00", 6, 32, 47)
+    assert not cache.intersects("LC80230312016320LGN00", 13, 8336, 12110)
+
+    # bounds requests do not erase known zooms
+    cache.set("LC80230312016320LGN00", [-89.79, 40.65, -86.91, 42.84])
+    assert cache.get("LC80230312016320LGN00").maxzoom == 12
+
+
+def test_footprint_lru():
+    """Should evict least recently used footprints."""
+    cache = FootprintCache(maxsize=2)
+    cache.set("a", [0, 0, 1, 1])
+    cache.set("b", [0, 0, 1, 1])
+    cache.get("a")
+    cache.set("c", [0, 0, 1, 1])
+    assert cache.get("a")
+    assert cache.get("b") is None
+    assert cache.get("c")
+
+
+def test_footprint_center():
+    """Should return TileJSON center."""
+    cache = FootprintCache()
+    footprint = cache.set("a", [0, 0, 2, 4], 7, 12, "EPSG:32616")
+    assert footprint.center == [1, 2, 7]
+    assert footprint.crs == "EPSG:32616"
+
+    # bounds requests do not erase known CRS
+    assert cache.set("a", [0, 0, 2, 4]).crs == "EPSG:32616"
+
+
+def test_footprint_ttl():
+    """Should drop expired footprints."""
+    cache = FootprintCache(ttl=60)
+    cache.set("a", [0, 0, 1, 1])
+    assert cache.get("a")
+
+    with patch("remotepixel_tiler.footprint.time.time", return_value=time.time() + 61):
+        assert cache.get("a") is None
+        assert cache.intersects("a", 8, 10, 10)
+
+
+def test_footprint_persistence(tmpdir):
+    """Should share footprints through the registry file."""
+    path = str(tmpdir.join("footprints.json"))
+    cache = FootprintCache(path=path)
+    cache.set("a", [0, 0, 1, 1], 7, 12, "EPSG:32616")
+    # Writes are batched
+    assert FootprintCache(path=path).get("a") is None
+    cache.flush()
+
+    cache = FootprintCache(path=path)
+    assert cache.get("a") == ([0, 0, 1, 1], 7, 12, "EPSG:32616")
+
+    cache.clear()
+    assert FootprintCache(path=path).get("a") is None
+
+    with open(path, "w") as f:
+        f.write("not json")
+    assert FootprintCache(path=path).get("a") is None
+
+
+def test_footprint_persistence_merge(tmpdir):
+    """Should merge the footprints written by other processes."""
+    path = str(tmpdir.join("footprints.json"))
+    first = FootprintCache(path=path, save_interval=0)
+    second = FootprintCache(path=path, save_interval=60)
+    first.get("a")
+    second.get("a")
+
+    first.set("a", [0, 0, 1, 1])
+    second.set("b", [1, 1, 2, 2])
+    first.set("c", [2, 2, 3, 3])
+    second.flush()
+
+    cache = FootprintCache(path=path)
+    assert cache.get("a").bounds == [0, 0, 1, 1]
+    assert cache.get("b").bounds == [1, 1, 2, 2]
+    assert cache.get("c").bounds == [2, 2, 3, 3]
+
+
+def test_footprint_persistence_retry(tmpdir):
+    """Should create the registry directory and retry failed writes."""
+    path = str(tmpdir.join("registry", "footprints.json"))
+    blocker = tmpdir.join("registry")
+    blocker.write("not a directory")
+
+    cache = FootprintCache(path=path, save_interval=60)
+    cache.set("a", [0, 0, 1, 1])
+    cache.flush()
+    assert cache._dirty
+
+    blocker.remove()
+    cache.set("b", [1, 1, 2, 2])
+    cache.flush()
+    assert not cache._dirty
+
+    cache = FootprintCache(path=path)
+    assert cache.get("a").bounds == [0, 0, 1, 1]
+    assert cache.get("b").bounds == [1, 1, 2, 2]
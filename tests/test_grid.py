@@ -0,0 +1,83 @@
+"""tests remotepixel_tiler.grid."""
+
+import pytest
+
+from remotepixel_tiler.grid import (
+    landsat_footprint,
+    mgrs_footprint,
+    sentinel2_footprint,
+    wrs2_footprint,
+)
+
+
+def _contains(outer, inner):
+    return (
+        outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and outer[2] >= inner[2]
+        and outer[3] >= inner[3]
+    )
+
+
+def test_landsat_footprint():
+    """Should return a conservative envelope of the WRS-2 scene."""
+    footprint = landsat_footprint("LC80230312016320LGN00")
+    assert _contains(footprint.bounds, [-89.79093, 40.65436, -86.91425, 42.83963])
+    assert footprint.bounds[2] - footprint.bounds[0] < 4.5
+    assert footprint.bounds[3] - footprint.bounds[1] < 3.0
+    assert footprint.minzoom < footprint.maxzoom
+
+
+@pytest.mark.parametrize(
+    "path,row,bounds",
+    [
+        # LT04_L1TP_143021_19890818_20200916_02_T1 (Siberia)
+        (143, 21, [90.07952, 54.88218, 94.11108, 56.94129]),
+        # LC08_L2SP_224078_20200127_20200823_02_T1 (Brazil/Argentina)
+        (224, 78, [-56.07486, -27.07056, -53.70922, -24.91213]),
+    ],
+)
+def test_wrs2_footprint_scene(path, row, bounds):
+    """Should contain the scene bounds (MTL product corners)."""
+    footprint = wrs2_footprint(path, row)
+    assert _contains(footprint.bounds, bounds)
+    center = (bounds[1] + bounds[3]) / 2
+    assert footprint.center[1] == pytest.approx(center, abs=0.05)
+
+
+def test_wrs2_footprint_invalid():
+    """Should raise on invalid path/row."""
+    with pytest.raises(ValueError):
+        wrs2_footprint(234, 31)
+
+    with pytest.raises(ValueError):
+        wrs2_footprint(23, 0)
+
+
+def test_wrs2_footprint_antimeridian():
+    """Should return all longitudes for scenes crossing the antimeridian."""
+    bounds = wrs2_footprint(75, 60).bounds
+    assert bounds[0] == -180 and bounds[2] == 180
+
+
+def test_sentinel2_footprint():
+    """Should return the MGRS tile bounds."""
+    footprint = sentinel2_footprint("S2A_tile_20161202_16SDG_0")
+    expected = [-88.13852, 36.95292, -86.88936, 37.94758]
+    assert _contains(footprint.bounds, expected)
+    assert footprint.bounds == pytest.approx(expected, abs=0.01)
+    assert footprint.crs == "EPSG:32616"
+    assert footprint.maxzoom == 13
+
+    footprint = sentinel2_footprint("S2A_L1C_20170729_55HBD_0")
+    assert footprint.crs == "EPSG:32755"
+    assert footprint.bounds[1] < -32.5 < footprint.bounds[3]
+
+
+def test_mgrs_footprint_invalid():
+    """Should raise on invalid MGRS squares."""
+    with pytest.raises(ValueError):
+        mgrs_footprint(16, "S", "SG")
+
+    with pytest.raises(ValueError):
+        mgrs_footprint(16, "Z", "DG")
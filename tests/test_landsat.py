@@ -1,11 +1,13 @@
 """tests remotepixel_tiler.landsat."""
 
 import os
+import sys
 import json
 import numpy
+import subprocess
 
 import pytest
-from mock import patch
+from mock import ANY, patch
 
 from remotepixel_tiler.landsat import APP
 
@@ -16,6 +18,17 @@ metadata_results = os.path.join(
 with open(metadata_results, "r") as f:
     metadata_results = json.loads(f.read())
 
+# Cold start budget (seconds) for `import remotepixel_tiler.landsat`
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", 1.0))
+HEAVY_MODULES = ("rasterio", "rio_tiler", "rio_toa", "rio_color", "boto3", "numexpr")
+
+IMPORT_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import remotepixel_tiler.landsat
+print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))
+"""
+
 
 @pytest.fixture(autouse=True)
 def testing_env_var(monkeypatch):
@@ -56,6 +69,7 @@ def test_bounds(landsat8, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "application/json",
     }
     statusCode = 200
@@ -67,6 +81,50 @@ def test_bounds(landsat8, event):
     assert result["bounds"]
 
 
+@patch("remotepixel_tiler.landsat.landsat8")
+def test_bounds_precise(landsat8, event):
+    """Should read scene metadata only in precise mode."""
+    landsat8.bounds.return_value = {
+        "sceneid": "LC80230312016320LGN00",
+        "bounds": [-89.79084, 40.65443, -86.91434, 42.83954],
+    }
+
+    event["path"] = "/bounds/LC80230312016320LGN00"
+    event["queryStringParameters"] = {"access_token": "YO"}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    landsat8.bounds.assert_not_called()
+
+    event["queryStringParameters"] = {"precise": "true", "access_token": "YO"}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    result = json.loads(res["body"])
+    assert result["bounds"] == [-89.79084, 40.65443, -86.91434, 42.83954]
+    landsat8.bounds.assert_called_once()
+
+
+@patch("remotepixel_tiler.landsat.dataset_footprint")
+def test_tilejson(dataset_footprint, event):
+    """Should answer tilejson requests from the WRS-2 grid."""
+    event["path"] = "/tilejson.json"
+    event["headers"] = {"Host": "landsat.remotepixel.ca"}
+    event["queryStringParameters"] = {
+        "sceneid": "LC80230320016320LGN00",
+        "access_token": "YO",
+    }
+    event["multiValueQueryStringParameters"] = {
+        "sceneid": ["LC80230320016320LGN00"],
+        "access_token": ["YO"],
+    }
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    result = json.loads(res["body"])
+    assert len(result["bounds"]) == 4
+    assert result["minzoom"] < result["maxzoom"]
+    assert result["center"][2] == result["minzoom"]
+    dataset_footprint.assert_not_called()
+
+
 @patch("remotepixel_tiler.landsat.landsat8")
 def test_metadata(landsat8, event):
     """Should work as expected (get metadata)."""
@@ -81,6 +139,7 @@ def test_metadata(landsat8, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "application/json",
     }
     statusCode = 200
@@ -175,6 +234,7 @@ def test_tiles_expr(expression, landsat8, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -204,7 +264,7 @@ def test_tiles_expr(expression, landsat8, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
-        "Content-Encoding": "gzip",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -217,15 +277,15 @@ def test_tiles_expr(expression, landsat8, event):
     landsat8.assert_not_called()
 
 
-@patch("remotepixel_tiler.landsat.landsat8")
+@patch("remotepixel_tiler.landsat.landsat8_tile")
 @patch("remotepixel_tiler.landsat.expression")
-def test_tiles_bands(expression, landsat8, event):
+def test_tiles_bands(expression, landsat8_tile, event):
     """Should work as expected (get tile)."""
     tilesize = 256
     tile = (numpy.random.rand(3, tilesize, tilesize) * 10000).astype(numpy.uint16)
     mask = numpy.full((tilesize, tilesize), 255)
 
-    landsat8.tile.return_value = (tile, mask)
+    landsat8_tile.return_value = (tile, mask)
 
     event["path"] = "/tiles/LC80230312016320LGN00/8/65/94.png"
     event["httpMethod"] = "GET"
@@ -240,7 +300,7 @@ def test_tiles_bands(expression, landsat8, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
-        "Content-Encoding": "gzip",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -251,7 +311,7 @@ def test_tiles_bands(expression, landsat8, event):
     assert res["isBase64Encoded"]
     assert res["body"]
     expression.assert_not_called()
-    landsat8.call_with(
+    landsat8_tile.call_with(
         "LC80230312016320LGN00",
         8,
         65,
@@ -265,7 +325,7 @@ def test_tiles_bands(expression, landsat8, event):
     tile = (numpy.random.rand(3, tilesize, tilesize) * 10000).astype(numpy.uint16)
     mask = numpy.full((tilesize, tilesize), 255)
 
-    landsat8.tile.return_value = (tile, mask)
+    landsat8_tile.return_value = (tile, mask)
 
     event["path"] = "/tiles/LC80230312016320LGN00/8/65/94@2x.png"
     event["httpMethod"] = "GET"
@@ -281,7 +341,7 @@ def test_tiles_bands(expression, landsat8, event):
     assert res["isBase64Encoded"]
     assert res["body"]
     expression.assert_not_called()
-    landsat8.call_with(
+    landsat8_tile.call_with(
         "LC80230312016320LGN00",
         8,
         65,
@@ -290,3 +350,47 @@ def test_tiles_bands(expression, landsat8, event):
         tilesize=512,
         pan=False,
     )
+
+
+@patch("remotepixel_tiler.landsat.landsat8_tile")
+@patch("remotepixel_tiler.landsat._postprocess")
+def test_tiles_empty(postprocess, landsat8_tile, event):
+    """Should return a transparent tile without post-processing."""
+    tile = numpy.zeros((3, 256, 256), dtype=numpy.uint16)
+    mask = numpy.zeros((256, 256), dtype=numpy.uint8)
+    landsat8_tile.return_value = (tile, mask)
+
+    event["path"] = "/tiles/LC80230312016320LGN00/8/65/94.png"
+    event["httpMethod"] = "GET"
+    event["queryStringParameters"] = {"bands": "5,3,2", "access_token": "YO"}
+
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["Content-Type"] == "image/png"
+    assert res["isBase64Encoded"]
+    assert res["body"]
+    postprocess.assert_not_called()
+
+
+@patch("remotepixel_tiler.landsat.landsat8_tile")
+def test_tiles_outside_footprint(landsat8_tile, event):
+    """Should not read tiles outside a known scene footprint."""
+    event["path"] = "/bounds/LC80230312016320LGN00"
+    event["queryStringParameters"] = {"access_token": "YO"}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+
+    event["path"] = "/tiles/LC80230312016320LGN00/8/10/10.png"
+    event["queryStringParameters"] = {"bands": "5,3,2", "access_token": "YO"}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["Content-Type"] == "image/png"
+    landsat8_tile.assert_not_called()
+
+
+def test_import_time():
+    """Should import without heavy modules and within the cold start budget."""
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SCRIPT])
+    duration, modules = json.loads(output)
+    assert not [m for m in modules if m.split(".")[0] in HEAVY_MODULES]
+    assert duration < IMPORT_TIME_BUDGET
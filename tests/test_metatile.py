@@ -0,0 +1,103 @@
+"""tests remotepixel_tiler.metatile."""
+
+import base64
+from functools import partial
+
+import numpy
+import pytest
+from mock import patch
+
+import rasterio
+from affine import Affine
+
+from remotepixel_tiler import cache, metatile, reader
+from remotepixel_tiler.cache import MemoryCache
+from remotepixel_tiler.cogeo import APP
+from remotepixel_tiler.metatile import (
+    metatile_params,
+    metatile_size,
+    read_metatile,
+    split_metatile,
+)
+
+
+@pytest.fixture()
+def cog(tmpdir):
+    """Create a small mercator GeoTIFF."""
+    path = str(tmpdir.join("cog.tif"))
+    data = numpy.arange(512 * 512, dtype=numpy.uint16).reshape(1, 512, 512)
+    profile = dict(
+        driver="GTiff",
+        dtype="uint16",
+        count=1,
+        width=512,
+        height=512,
+        crs="epsg:3857",
+        transform=Affine(1953.125, 0.0, 0.0, 0.0, -1953.125, 1000000.0),
+        nodata=0,
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data)
+    return path
+
+
+def test_metatile_size():
+    """Should use power of 2 metatiles, only when tiles are cached."""
+    with patch.object(metatile, "METATILE_SIZE", 6):
+        assert metatile_size(10) == 1
+        with patch.object(cache, "CACHES", [MemoryCache(max_size=1024)]):
+            assert metatile_size(10) == 4
+            assert metatile_size(1) == 2
+            # Bounded by METATILE_MAX_PIXELS
+            assert metatile_size(10, 512) == 2
+            assert metatile_size(10, 1024) == 1
+
+            params = dict(z=4, x=9, y=7, scale=1, ext="png")
+            assert metatile_params(params) == dict(params, z=2, x=2, y=1, metatile=4)
+            params["scale"] = 4
+            assert metatile_params(params) == params
+
+
+def test_read_metatile(cog):
+    """Should read a block of tiles matching the individual tiles."""
+    read = partial(reader.main_tile, cog)
+    block, tile, mask = read_metatile(read, 8, 7, 4, 64, size=4)
+    assert (block.x, block.y, block.z) == (2, 1, 2)
+    assert tile.shape == (1, 256, 256)
+
+    tiles = list(split_metatile(block, tile, mask, 64))
+    assert len(tiles) == 16
+    for child, child_tile, child_mask in tiles:
+        if (child.x, child.y) == (8, 7):
+            expected, expected_mask = read(8, 7, 4, tilesize=64)
+            # The warper approximates the transform differently for each size
+            numpy.testing.assert_array_equal(child_mask, expected_mask)
+            assert numpy.abs(child_tile.astype(int) - expected).mean() < 10
+            break
+    else:
+        raise AssertionError("Tile missing from the metatile")
+
+
+def test_tile_siblings(cog):
+    """Should cache the other tiles of the metatile."""
+    event = {
+        "path": "/tiles/4/8/7.png",
+        "httpMethod": "GET",
+        "headers": {},
+        "queryStringParameters": {"url": cog, "rescale": "0,262144"},
+    }
+    tiles = MemoryCache(max_size=10 * 1024 * 1024)
+    with patch.object(metatile, "METATILE_SIZE", 4), patch.object(
+        cache, "CACHES", [tiles]
+    ):
+        res = APP(event, {})
+        assert res["statusCode"] == 200
+        assert len(tiles) == 16
+
+        with patch("remotepixel_tiler.cogeo.main_tile") as main_tile:
+            event["path"] = "/tiles/4/9/7.png"
+            res = APP(event, {})
+            main_tile.assert_not_called()
+
+        assert res["statusCode"] == 200
+        assert base64.b64decode(res["body"]).startswith(b"\x89PNG")
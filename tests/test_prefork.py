@@ -0,0 +1,112 @@
+"""tests remotepixel_tiler.scripts.prefork."""
+
+from typing import Tuple
+
+import os
+import json
+import time
+import signal
+import socket
+from http.client import HTTPConnection
+
+from remotepixel_tiler.footprint import FootprintCache
+from remotepixel_tiler.proxy import API
+from remotepixel_tiler.scripts import prefork
+from remotepixel_tiler.scripts.prefork import PreforkServer
+
+
+APP = API(name="test")
+
+
+@APP.route("/pid", methods=["GET"])
+def pid_handler():
+    """Worker pid."""
+    return ("OK", "application/json", json.dumps({"pid": os.getpid()}))
+
+
+@APP.route("/footprint", methods=["GET"])
+def footprint_handler():
+    """Record a footprint, return the worker pid."""
+    prefork.FOOTPRINTS.set(str(os.getpid()), [0, 0, 1, 1])
+    return ("OK", "application/json", json.dumps({"pid": os.getpid()}))
+
+
+def _request(port: int, path: str = "/pid") -> int:
+    """Return the pid of the worker answering a request."""
+    for _ in range(50):
+        try:
+            conn = HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", path, headers={"Connection": "close"})
+            return json.loads(conn.getresponse().read())["pid"]
+        except (ConnectionError, OSError):
+            time.sleep(0.1)
+        finally:
+            conn.close()
+
+    raise RuntimeError("Server not responding")
+
+
+def test_prefork_stats():
+    """Should aggregate stats of current and past workers."""
+    server = PreforkServer(APP, workers=2)
+    server._children = {100: (0, 0)}
+    server._stats[0:3] = [10, 1, 1000]
+    server._totals.update(requests=5, errors=0, bytes_sent=500)
+    stats = server.stats()
+    assert stats["requests"] == 15
+    assert stats["errors"] == 1
+    assert stats["bytes_sent"] == 1500
+    assert stats["workers"] == 1
+
+
+def _serve(**kwargs) -> Tuple[int, int]:
+    """Fork a PreforkServer, return its pid and port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    pid = os.fork()
+    if not pid:
+        try:
+            PreforkServer(APP, **kwargs).run("127.0.0.1", port)
+        finally:
+            os._exit(0)
+
+    return pid, port
+
+
+def test_prefork_recycle(capfd):
+    """Should serve with several workers and replace recycled ones."""
+    pid, port = _serve(workers=2, max_requests=2)
+
+    try:
+        pids = [_request(port) for _ in range(8)]
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        _, status = os.waitpid(pid, 0)
+
+    assert os.WEXITSTATUS(status) == 0
+    assert pid not in pids
+    # Each worker answers at most 2 requests
+    assert len(set(pids)) >= 4
+
+    stats = json.loads(capfd.readouterr().err.strip().splitlines()[-1])
+    assert stats["requests"] == 8
+    assert stats["workers"] == 0
+    assert stats["spawned"] >= 4
+
+
+def test_prefork_flush_footprints(monkeypatch, tmpdir):
+    """Should write the footprints recorded by recycled workers."""
+    path = str(tmpdir.join("footprints.json"))
+    footprints = FootprintCache(path=path, save_interval=60)
+    monkeypatch.setattr(prefork, "FOOTPRINTS", footprints)
+    pid, port = _serve(workers=1, max_requests=1)
+    try:
+        pids = [_request(port, "/footprint") for _ in range(2)]
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+    cache = FootprintCache(path=path)
+    assert all(cache.get(str(worker)) for worker in pids)
@@ -0,0 +1,184 @@
+"""tests remotepixel_tiler.proxy."""
+
+import gzip
+import json
+import base64
+import threading
+
+from remotepixel_tiler.proxy import API
+from remotepixel_tiler.utils import _negotiate_webp
+
+
+APP = API(name="test")
+
+
+@APP.route("/json", methods=["GET"], payload_compression_method="gzip")
+def json_handler():
+    """JSON response."""
+    return ("OK", "application/json", json.dumps({"value": "a" * 100}))
+
+
+@APP.route(
+    "/tile.<ext>",
+    methods=["GET"],
+    payload_compression_method="gzip",
+    binary_b64encode=True,
+)
+def tile_handler(ext: str):
+    """Binary response."""
+    content_type = "image/png" if ext == "png" else "application/x-npy"
+    return ("OK", content_type, b"\x89PNG" + b"\x00" * 100)
+
+
+CALLS = []
+
+
+@APP.route(
+    "/tiles/<int:z>.png",
+    methods=["GET"],
+    cors=True,
+    token=True,
+    ttl=3600,
+    payload_compression_method="gzip",
+)
+def cached_handler(z: int, rescale: str = None):
+    """Cacheable response."""
+    CALLS.append(z)
+    return ("OK", "image/png", b"\x89PNG")
+
+
+@APP.route("/negotiated.<ext>", methods=["GET"], ttl=3600)
+@APP.pass_event
+@_negotiate_webp
+def negotiated_handler(ext: str, webp: bool = False):
+    """Response depending on the Accept header."""
+    return ("OK", "image/png", b"webp" if webp else b"png")
+
+
+BARRIER = threading.Barrier(2)
+
+
+@APP.pass_event
+def _request_header(event):
+    return event["headers"]["x-request"]
+
+
+@APP.route("/event", methods=["GET"])
+def event_handler():
+    """Return a request header, after another request started."""
+    BARRIER.wait(5)
+    return ("OK", "text/plain", _request_header())
+
+
+def _event(path):
+    return {
+        "path": path,
+        "httpMethod": "GET",
+        "headers": {"Accept-Encoding": "gzip, deflate"},
+        "queryStringParameters": {},
+    }
+
+
+def test_compression():
+    """Should only compress compressible content types."""
+    res = APP(_event("/json"), {})
+    assert res["headers"]["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(res["body"]))
+
+    res = APP(_event("/tile.npy"), {})
+    assert res["headers"]["Content-Encoding"] == "gzip"
+
+    res = APP(_event("/tile.png"), {})
+    assert "Content-Encoding" not in res["headers"]
+    assert base64.b64decode(res["body"]).startswith(b"\x89PNG")
+
+
+def test_conditional_requests(monkeypatch):
+    """Should answer matching If-None-Match requests without calling handlers."""
+    monkeypatch.setenv("TOKEN", "YO")
+    event = _event("/tiles/1.png")
+    event["queryStringParameters"] = {"rescale": "0,1", "access_token": "YO"}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    etag = res["headers"]["ETag"]
+    assert CALLS == [1]
+
+    event["queryStringParameters"] = {"access_token": "YO", "rescale": "0,1"}
+    event["headers"]["If-None-Match"] = f"W/{etag}"
+    res = APP(event, {})
+    assert res["statusCode"] == 304
+    assert res["headers"]["ETag"] == etag
+    assert res["headers"]["Cache-Control"] == "max-age=3600"
+    assert not res["body"]
+    assert CALLS == [1]
+
+    event["queryStringParameters"] = {"access_token": "NO", "rescale": "0,1"}
+    res = APP(event, {})
+    assert res["statusCode"] == 500
+    assert CALLS == [1]
+
+    event["queryStringParameters"] = {"access_token": "YO", "rescale": "0,2"}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["ETag"] != etag
+    assert CALLS == [1, 1]
+
+    assert "ETag" not in APP(_event("/json"), {})["headers"]
+
+    # gzip and identity responses have different ETags
+    event["headers"] = {}
+    event["queryStringParameters"] = {"access_token": "YO", "rescale": "0,1"}
+    res = APP(event, {})
+    assert res["headers"]["ETag"] != etag
+
+
+def test_etag_host():
+    """Should change the ETag with the host responses are built from."""
+    etags = set()
+    for forwarded in ("tiles.example.com", "maps.example.com"):
+        event = _event("/negotiated.png")
+        event["headers"]["Host"] = "api.example.com"
+        event["headers"]["X-Forwarded-Host"] = forwarded
+        etags.add(APP(event, {})["headers"]["ETag"])
+
+    for stage in ("staging", "production"):
+        event = _event("/negotiated.png")
+        event["headers"]["Host"] = "abc.execute-api.us-east-1.amazonaws.com"
+        event["requestContext"] = {"stage": stage}
+        etags.add(APP(event, {})["headers"]["ETag"])
+
+    assert len(etags) == 4
+
+
+def test_vary():
+    """Should add Vary to negotiated responses."""
+    event = _event("/negotiated.auto")
+    event["headers"]["Accept"] = "image/webp"
+    res = APP(event, {})
+    assert res["headers"]["Vary"] == "Accept"
+    assert res["body"] == b"webp"
+
+    event["headers"]["If-None-Match"] = res["headers"]["ETag"]
+    res = APP(event, {})
+    assert res["statusCode"] == 304
+    assert res["headers"]["Vary"] == "Accept"
+
+    assert "Vary" not in APP(_event("/negotiated.png"), {})["headers"]
+
+
+def test_event_per_thread():
+    """Should pass each concurrent request its own event."""
+    results = {}
+
+    def request(name):
+        event = _event("/event")
+        event["headers"]["X-Request"] = name
+        results[name] = APP(event, {})["body"]
+
+    threads = [threading.Thread(target=request, args=(n,)) for n in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": "a", "b": "b"}
@@ -0,0 +1,143 @@
+"""tests remotepixel_tiler.reader."""
+
+import numpy
+import pytest
+
+import rasterio
+from affine import Affine
+
+from rio_tiler import main
+from rio_tiler.utils import expression as rio_expression
+from rio_tiler.errors import TileOutsideBounds
+
+from remotepixel_tiler import reader
+from remotepixel_tiler.reader import DatasetPool
+
+
+@pytest.fixture()
+def cog(tmpdir):
+    """Create a small mercator GeoTIFF."""
+    path = str(tmpdir.join("cog.tif"))
+    data = numpy.arange(3 * 512 * 512, dtype=numpy.uint16).reshape(3, 512, 512)
+    profile = dict(
+        driver="GTiff",
+        dtype="uint16",
+        count=3,
+        width=512,
+        height=512,
+        crs="epsg:3857",
+        transform=Affine(1953.125, 0.0, 0.0, 0.0, -1953.125, 1000000.0),
+        nodata=0,
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data)
+    return path
+
+
+def test_pool_reuse(cog):
+    """Should reuse idle datasets and open new ones for concurrent reads."""
+    pool = DatasetPool(maxsize=4)
+    with pool.open(cog) as src_dst:
+        first = src_dst
+        with pool.open(cog) as other:
+            assert other is not first
+
+    assert len(pool) == 2
+    with pool.open(cog) as src_dst:
+        assert src_dst in (first, other)
+
+    assert pool.stats()["misses"] == 2
+    assert pool.stats()["hits"] == 1
+
+    pool.clear()
+    assert not len(pool)
+    assert first.closed and other.closed
+
+
+def test_pool_eviction(cog, tmpdir):
+    """Should close least recently used idle datasets."""
+    pool = DatasetPool(maxsize=1)
+    with pool.open(cog) as src_dst:
+        first = src_dst
+
+    with rasterio.Env(GDAL_CACHEMAX=64):
+        with pool.open(cog) as src_dst:
+            assert src_dst is not first
+
+    assert first.closed
+    assert len(pool) == 1
+
+
+def test_pool_errors(cog):
+    """Should not give back datasets used by a failing read."""
+    pool = DatasetPool(maxsize=4)
+    with pytest.raises(ValueError):
+        with pool.open(cog) as src_dst:
+            raise ValueError()
+
+    assert src_dst.closed
+    assert not len(pool)
+
+    pool = DatasetPool(maxsize=0)
+    with pool.open(cog) as src_dst:
+        pass
+    assert src_dst.closed
+    assert not len(pool)
+
+
+def test_main_tile(cog, monkeypatch):
+    """Should read the same tiles as rio-tiler."""
+    monkeypatch.setattr(reader, "POOL", DatasetPool(maxsize=4))
+
+    tile, mask = reader.main_tile(cog, 8, 7, 4, indexes=(1, 2), tilesize=128)
+    expected, expected_mask = main.tile(cog, 8, 7, 4, indexes=(1, 2), tilesize=128)
+    numpy.testing.assert_array_equal(tile, expected)
+    numpy.testing.assert_array_equal(mask, expected_mask)
+    assert len(reader.POOL) == 1
+
+    tile, mask = reader.expression(cog, 8, 7, 4, expr="b1*2,b2", tilesize=128)
+    expected, expected_mask = rio_expression(cog, 8, 7, 4, expr="b1*2,b2", tilesize=128)
+    numpy.testing.assert_array_equal(tile, expected)
+    numpy.testing.assert_array_equal(mask, expected_mask)
+    assert reader.POOL.stats()["misses"] == 1
+
+    with pytest.raises(TileOutsideBounds):
+        reader.main_tile(cog, 0, 0, 4)
+
+
+def test_read_overview(cog, monkeypatch):
+    """Should read the finest overview fitting in max_size."""
+    monkeypatch.setattr(reader, "POOL", DatasetPool(maxsize=4))
+    with rasterio.open(cog, "r+") as dst:
+        dst.build_overviews([2, 4])
+
+    arr, info = reader.read_overview(cog, max_size=1024)
+    assert info["overview_level"] is None
+    assert arr.shape == (3, 512, 512)
+
+    arr, info = reader.read_overview(cog, max_size=200, indexes=[1])
+    assert info["overview_level"] == 1
+    assert arr.shape == (1, 128, 128)
+
+    arr, info = reader.read_overview(cog, max_size=64, indexes=[1])
+    assert info["overview_level"] == 1
+    assert info["shape"] == [64, 64]
+    assert arr.shape == (1, 64, 64)
+
+
+def test_main_metadata(cog, monkeypatch):
+    """Should compute statistics with a bounded read."""
+    monkeypatch.setattr(reader, "POOL", DatasetPool(maxsize=4))
+    with rasterio.open(cog, "r+") as dst:
+        dst.build_overviews([2, 4])
+
+    info = reader.main_metadata(cog, max_size=256)
+    expected = main.metadata(cog)
+    assert info["bounds"] == expected["bounds"]
+    assert info["band_descriptions"] == expected["band_descriptions"]
+    stats = info["statistics"][1]
+    assert stats["overview_level"] == 0
+    assert stats["shape"] == [256, 256]
+    assert stats["min"] >= expected["statistics"][1]["min"]
+    assert stats["max"] <= expected["statistics"][1]["max"]
+    assert len(stats["histogram"][0]) == 10
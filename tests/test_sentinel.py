@@ -5,7 +5,7 @@ import json
 import numpy
 
 import pytest
-from mock import patch
+from mock import ANY, patch
 
 from remotepixel_tiler.sentinel import APP
 
@@ -60,6 +60,7 @@ def test_bounds(sentinel2, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "application/json",
     }
     statusCode = 200
@@ -71,6 +72,18 @@ def test_bounds(sentinel2, event):
     assert result["bounds"]
 
 
+@patch("remotepixel_tiler.sentinel.sentinel2")
+def test_bounds_grid(sentinel2, event):
+    """Should answer bounds requests from the MGRS grid."""
+    event["path"] = "/s2/bounds/S2A_tile_20161202_16SDF_0"
+    event["queryStringParameters"] = {"access_token": "YO"}
+    res = APP(event, {})
+    assert res["statusCode"] == 200
+    result = json.loads(res["body"])
+    assert result["bounds"][0] == pytest.approx(-88.12, abs=0.05)
+    sentinel2.bounds.assert_not_called()
+
+
 @patch("remotepixel_tiler.sentinel.sentinel2")
 def test_metadata(sentinel2, event):
     """Should work as expected (get metadata)."""
@@ -85,6 +98,7 @@ def test_metadata(sentinel2, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "application/json",
     }
     statusCode = 200
@@ -179,6 +193,7 @@ def test_tiles_expr(expression, sentinel2, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -205,7 +220,7 @@ def test_tiles_expr(expression, sentinel2, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
-        "Content-Encoding": "gzip",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
@@ -218,15 +233,15 @@ def test_tiles_expr(expression, sentinel2, event):
     sentinel2.assert_not_called()
 
 
-@patch("remotepixel_tiler.sentinel.sentinel2")
+@patch("remotepixel_tiler.sentinel.sentinel2_tile")
 @patch("remotepixel_tiler.sentinel.expression")
-def test_tiles_bands(expression, sentinel2, event):
+def test_tiles_bands(expression, sentinel2_tile, event):
     """Should work as expected (get tile)."""
     tilesize = 256
     tile = numpy.random.rand(3, tilesize, tilesize) * 10000
     mask = numpy.full((tilesize, tilesize), 255)
 
-    sentinel2.tile.return_value = (tile.astype(numpy.uint16), mask)
+    sentinel2_tile.return_value = (tile.astype(numpy.uint16), mask)
 
     event["path"] = "/s2/tiles/S2A_tile_20161202_16SDG_0/10/262/397.png"
     event["httpMethod"] = "GET"
@@ -242,7 +257,7 @@ def test_tiles_bands(expression, sentinel2, event):
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "max-age=3600",
-        "Content-Encoding": "gzip",
+        "ETag": ANY,
         "Content-Type": "image/png",
     }
     statusCode = 200
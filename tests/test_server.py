@@ -0,0 +1,122 @@
+"""tests remotepixel_tiler.scripts.server."""
+
+import json
+import socket
+import asyncio
+import threading
+from http.client import HTTPConnection
+
+import pytest
+
+from remotepixel_tiler.proxy import API
+from remotepixel_tiler.scripts.server import AsyncServer
+
+
+APP = API(name="test")
+
+
+@APP.route("/tile.png", methods=["GET"], binary_b64encode=True)
+def tile_handler():
+    """Binary response."""
+    return ("OK", "image/png", b"\x89PNG" + b"\x00" * 100)
+
+
+@APP.route("/echo", methods=["POST"])
+def echo_handler(body: str, value: str = None):
+    """Echo request."""
+    return ("OK", "application/json", json.dumps({"body": body, "value": value}))
+
+
+BARRIER = threading.Barrier(2)
+
+
+@APP.pass_event
+def _request_header(event):
+    return event["headers"]["x-request"]
+
+
+@APP.route("/event", methods=["GET"])
+def event_handler():
+    """Return a request header, after another request started."""
+    BARRIER.wait(5)
+    return ("OK", "text/plain", _request_header())
+
+
+@pytest.fixture
+def server_port():
+    """Run the server in a background event loop."""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        AsyncServer(APP, threads=2).start("127.0.0.1", 0)
+    )
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    yield server.sockets[0].getsockname()[1]
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.close()
+
+
+def test_server_keep_alive(server_port):
+    """Should serve several raw requests on a single connection."""
+    conn = HTTPConnection("127.0.0.1", server_port, timeout=5)
+
+    conn.request("GET", "/tile.png")
+    res = conn.getresponse()
+    assert res.status == 200
+    assert res.getheader("Content-Type") == "image/png"
+    assert res.getheader("Connection") == "keep-alive"
+    assert res.read() == b"\x89PNG" + b"\x00" * 100
+    sock = conn.sock
+
+    conn.request("POST", "/echo?value=1", body="[[8, 1, 2]]")
+    res = conn.getresponse()
+    assert res.status == 200
+    assert json.loads(res.read()) == {"body": "[[8, 1, 2]]", "value": "1"}
+    assert conn.sock is sock
+
+    conn.request("GET", "/missing", headers={"Connection": "close"})
+    res = conn.getresponse()
+    assert res.status == 400
+    assert res.getheader("Connection") == "close"
+    res.read()
+    conn.close()
+
+
+def test_server_concurrent_events(server_port):
+    """Should pass concurrent requests their own event."""
+    results = {}
+
+    def request(name):
+        conn = HTTPConnection("127.0.0.1", server_port, timeout=5)
+        conn.request("GET", "/event", headers={"X-Request": name})
+        results[name] = conn.getresponse().read()
+        conn.close()
+
+    threads = [threading.Thread(target=request, args=(n,)) for n in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": b"a", "b": b"b"}
+
+
+@pytest.mark.parametrize(
+    "request_headers,status",
+    [
+        (b"Content-Length: abc\r\n", 400),
+        (b"Content-Length: -1\r\n", 400),
+        (b"Transfer-Encoding: chunked\r\n", 411),
+        (b"Invalid header\r\n", 400),
+    ],
+)
+def test_server_invalid_requests(server_port, request_headers, status):
+    """Should reject requests the server can't read."""
+    with socket.create_connection(("127.0.0.1", server_port), timeout=5) as sock:
+        sock.sendall(b"POST /echo HTTP/1.1\r\n" + request_headers + b"\r\n")
+        response = sock.makefile("rb").readline()
+    assert response.startswith(f"HTTP/1.1 {status} ".encode())
@@ -0,0 +1,72 @@
+"""tests remotepixel_tiler.stats."""
+
+import numpy
+import pytest
+from mock import Mock
+
+from rio_tiler.utils import _stats
+
+from remotepixel_tiler.stats import (
+    HISTOGRAM_BINS,
+    StatisticsCache,
+    band_statistics,
+    get_metadata,
+    histogram_percentiles,
+)
+
+
+@pytest.mark.parametrize("dtype", ["uint8", "uint16"])
+def test_histogram_percentiles_integer(dtype):
+    """Should match numpy percentiles for integer data."""
+    arr = numpy.random.RandomState(0).randint(0, 256, 10000).astype(dtype)
+    counts, edges = numpy.histogram(arr, bins=HISTOGRAM_BINS)
+    for percentiles in [(2, 98), (0, 100), (33.3, 66.6)]:
+        expected = numpy.percentile(arr, percentiles).astype(dtype).tolist()
+        assert histogram_percentiles(counts, edges, percentiles, True) == expected
+
+
+def test_histogram_percentiles_float():
+    """Should approximate numpy percentiles within a bin for float data."""
+    arr = numpy.random.RandomState(0).normal(1000, 300, 10000)
+    counts, edges = numpy.histogram(arr, bins=HISTOGRAM_BINS)
+    width = edges[1] - edges[0]
+    for percentiles in [(2, 98), (5, 95)]:
+        expected = numpy.percentile(arr, percentiles)
+        values = histogram_percentiles(counts, edges, percentiles)
+        assert values == pytest.approx(expected, abs=width)
+
+    assert histogram_percentiles(counts, edges, (0, 100)) == [arr.min(), arr.max()]
+
+
+def test_band_statistics():
+    """Should return rio-tiler statistics from a fine histogram."""
+    arr = numpy.ma.MaskedArray(numpy.random.RandomState(0).randint(0, 256, 10000))
+    stats = band_statistics(_stats(arr, bins=HISTOGRAM_BINS), 5, 95)
+    expected = _stats(arr, percentiles=(5, 95))
+    assert stats["pc"] == expected["pc"]
+    assert stats["min"] == expected["min"]
+    assert stats["histogram"][0] == expected["histogram"][0]
+    assert stats["histogram"][1] == pytest.approx(expected["histogram"][1])
+
+
+def test_get_metadata(monkeypatch):
+    """Should compute statistics once per dataset."""
+    monkeypatch.setattr(
+        "remotepixel_tiler.stats.STATISTICS", StatisticsCache(maxsize=1)
+    )
+    arr = numpy.ma.MaskedArray(numpy.arange(1000))
+
+    def metadata(address, pmin=2, pmax=98, **kwargs):
+        stats = _stats(arr, percentiles=(pmin, pmax), bins=kwargs["histogram_bins"])
+        return {"address": address, "statistics": {1: stats}}
+
+    func = Mock(side_effect=metadata)
+    info = get_metadata(func, "my.tif")
+    assert info["statistics"][1]["pc"] == [19, 979]
+    info = get_metadata(func, "my.tif", pmin=10, pmax=90)
+    assert info["statistics"][1]["pc"] == [99, 899]
+    func.assert_called_once_with("my.tif", histogram_bins=HISTOGRAM_BINS)
+
+    get_metadata(func, "other.tif")
+    get_metadata(func, "my.tif")
+    assert func.call_count == 3
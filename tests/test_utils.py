@@ -0,0 +1,237 @@
+"""tests remotepixel_tiler.utils."""
+
+import io
+import json
+import zlib
+import struct
+
+import numpy
+
+import pytest
+
+from rasterio.io import MemoryFile
+from rio_color.operations import parse_operations
+from rio_color.utils import scale_dtype, to_math_type
+
+from remotepixel_tiler.utils import (
+    _postprocess,
+    _array_to_image,
+    _array_to_raw,
+    _auto_format,
+    _empty_tile,
+    _get_colormap,
+)
+
+
+def _reference_rescale(arr, in_range):
+    """Linear rescale as done by rio_tiler.utils.linear_rescale."""
+    imin, imax = in_range
+    arr = numpy.clip(arr.astype(numpy.float64), imin, imax) - imin
+    return arr / (imax - imin) * 255
+
+
+def test_postprocess_rescale_integer():
+    """Should rescale uint16 data through the lookup table."""
+    tile = (numpy.random.rand(3, 64, 64) * 10000).astype(numpy.uint16)
+    mask = numpy.full((64, 64), 255, dtype=numpy.uint8)
+    mask[0:10] = 0
+
+    rtile, rmask = _postprocess(tile.copy(), mask, rescale="0,5000,0,10000,100,200")
+    assert rtile.dtype == numpy.uint8
+    assert rtile.shape == (3, 64, 64)
+    assert not rtile[:, 0:10].any()
+
+    for bdx, in_range in enumerate([(0, 5000), (0, 10000), (100, 200)]):
+        expected = _reference_rescale(tile[bdx], in_range).astype(numpy.uint8)
+        numpy.testing.assert_array_equal(rtile[bdx, 10:], expected[10:])
+
+
+def test_postprocess_rescale_float():
+    """Should rescale float data with a single range for every band."""
+    tile = numpy.random.rand(2, 64, 64) * 2 - 1
+    mask = numpy.full((64, 64), 255, dtype=numpy.uint8)
+
+    rtile, _ = _postprocess(tile.copy(), mask, rescale="-1,1")
+    assert rtile.dtype == numpy.uint8
+    for bdx in range(2):
+        expected = _reference_rescale(tile[bdx], (-1, 1))
+        assert numpy.abs(rtile[bdx] - expected).max() <= 1
+
+
+def test_postprocess_rescale_float32_input():
+    """Should not modify the input tile."""
+    tile = (numpy.random.rand(1, 16, 16) * 4 - 2).astype(numpy.float32)
+    original = tile.copy()
+    mask = numpy.full((16, 16), 255, dtype=numpy.uint8)
+
+    rtile, _ = _postprocess(tile, mask, rescale="-1,1")
+    numpy.testing.assert_array_equal(tile, original)
+    expected = _reference_rescale(original[0], (-1, 1))
+    assert numpy.abs(rtile[0] - expected).max() <= 1
+
+
+def test_postprocess_uint8_lut_bounds():
+    """Should clip values outside of the rescale range."""
+    tile = numpy.arange(256, dtype=numpy.uint8).reshape(1, 16, 16)
+    mask = numpy.full((16, 16), 255, dtype=numpy.uint8)
+
+    rtile, _ = _postprocess(tile, mask, rescale="10,20")
+    assert rtile.min() == 0
+    assert rtile.max() == 255
+    assert rtile[0, 0, 10] == 0
+    assert rtile[0, 1, 4] == 255
+
+
+def _reference_color_formula(tile, color_formula):
+    """Apply color formula operation by operation like rio-color."""
+    for ops in parse_operations(color_formula):
+        tile = scale_dtype(ops(to_math_type(tile)), numpy.uint8)
+    return tile
+
+
+def test_postprocess_color_formula():
+    """Should match rio-color results when using lookup tables."""
+    mask = numpy.full((64, 64), 255, dtype=numpy.uint8)
+    formula = "Gamma RGB 3.5 Saturation 1.7 Sigmoidal RGB 15 0.35"
+
+    tile = (numpy.random.rand(3, 64, 64) * 255).astype(numpy.uint8)
+    rtile, _ = _postprocess(tile.copy(), mask, color_formula=formula)
+    assert rtile.dtype == numpy.uint8
+    numpy.testing.assert_array_equal(rtile, _reference_color_formula(tile, formula))
+
+    tile = (numpy.random.rand(3, 64, 64) * 10000).astype(numpy.uint16)
+    rtile, _ = _postprocess(tile.copy(), mask, color_formula="gamma g 1.5 gamma b 1.2")
+    numpy.testing.assert_array_equal(
+        rtile, _reference_color_formula(tile, "gamma g 1.5 gamma b 1.2")
+    )
+
+    tile = (numpy.random.rand(3, 64, 64) * 1000).astype(numpy.int16)
+    rtile, _ = _postprocess(tile.copy(), mask, color_formula="sigmoidal rgb 10 0.2")
+    numpy.testing.assert_array_equal(
+        rtile, _reference_color_formula(tile, "sigmoidal rgb 10 0.2")
+    )
+
+
+def test_postprocess_color_formula_invalid():
+    """Should raise on invalid color formula."""
+    mask = numpy.full((16, 16), 255, dtype=numpy.uint8)
+    tile = numpy.zeros((3, 16, 16), dtype=numpy.uint8)
+    with pytest.raises(ValueError):
+        _postprocess(tile, mask, color_formula="gamma RGB 1 blur 2")
+    with pytest.raises(ValueError):
+        _postprocess(tile, mask, color_formula="gamma 4 1.5")
+
+
+def test_get_colormap():
+    """Should load colormaps once."""
+    cmap = _get_colormap("cfastie")
+    assert cmap.shape == (256, 3)
+    assert cmap.dtype == numpy.uint8
+    assert _get_colormap("cfastie") is cmap
+
+
+def test_array_to_image_paletted():
+    """Should encode single band colormap tiles as paletted PNG."""
+    cmap = _get_colormap("cfastie")
+    tile = (numpy.random.rand(1, 256, 256) * 200).astype(numpy.uint8)
+    mask = numpy.full((256, 256), 255, dtype=numpy.uint8)
+    mask[0:16] = 0
+
+    content = _array_to_image(tile, mask, img_format="png", color_map=cmap)
+    # PNG color type 3 (palette) with transparency chunk
+    assert content[25] == 3
+    assert b"tRNS" in content
+
+    with MemoryFile(content) as memfile:
+        with memfile.open() as src:
+            data = src.read(1)
+            palette = src.colormap(1)
+
+    rgba = numpy.array([palette[v] for v in data.flatten()]).reshape(256, 256, 4)
+    numpy.testing.assert_array_equal(rgba[16:, :, :3], cmap[tile[0, 16:]])
+    assert (rgba[16:, :, 3] == 255).all()
+    assert (rgba[:16, :, 3] == 0).all()
+
+    content = _array_to_image(tile, img_format="png", color_map=cmap)
+    assert content[25] == 3
+    assert b"tRNS" not in content
+
+
+def test_array_to_image_rgba_fallback():
+    """Should fall back to RGBA when every palette index is used."""
+    cmap = _get_colormap("cfastie")
+    tile = numpy.arange(256 * 256, dtype=numpy.uint16).reshape(1, 256, 256) % 256
+    tile = tile.astype(numpy.uint8)
+    mask = numpy.full((256, 256), 255, dtype=numpy.uint8)
+    mask[0, 0] = 0
+
+    content = _array_to_image(tile, mask, img_format="png", color_map=cmap)
+    assert content[25] == 6
+
+    content = _array_to_image(tile, mask, img_format="jpeg", color_map=cmap)
+    assert content[:2] == b"\xff\xd8"
+
+
+def test_empty_tile():
+    """Should return cached transparent tiles."""
+    content = _empty_tile(256, "png")
+    assert content is _empty_tile(256, "png")
+    with MemoryFile(content) as memfile:
+        with memfile.open() as src:
+            assert src.width == 256
+            assert not src.read(src.count).any()
+
+    assert _empty_tile(512, "jpeg")[:2] == b"\xff\xd8"
+
+
+def test_array_to_raw():
+    """Should encode data and mask with their dtype and shape."""
+    tile = numpy.random.rand(2, 16, 16).astype(numpy.float32)
+    mask = numpy.full((16, 16), 255, dtype=numpy.uint8)
+    mask[0] = 0
+
+    data = numpy.load(io.BytesIO(_array_to_raw(tile, mask, "npy")))
+    assert data.shape == (3, 16, 16)
+    numpy.testing.assert_array_equal(data[:2], tile)
+    numpy.testing.assert_array_equal(data[2], mask)
+
+    content = _array_to_raw(tile, mask, "bin", compress="deflate", nodata=numpy.nan)
+    assert content[:4] == b"RPXT"
+    (length,) = struct.unpack("<I", content[4:8])
+    header = json.loads(content[8:8 + length])
+    assert header == dict(
+        dtype="float32", shape=[2, 16, 16], nodata="nan", compression="deflate"
+    )
+    body = zlib.decompress(content[8 + length:])
+    data = numpy.frombuffer(body[: tile.nbytes], dtype=header["dtype"])
+    numpy.testing.assert_array_equal(data.reshape(header["shape"]), tile)
+    numpy.testing.assert_array_equal(
+        numpy.frombuffer(body[tile.nbytes:], dtype=numpy.uint8).reshape(16, 16), mask
+    )
+
+    data = numpy.load(io.BytesIO(_array_to_raw(tile.astype(numpy.int8), mask, "npy")))
+    assert data.dtype == numpy.int16
+    numpy.testing.assert_array_equal(data[2], mask)
+
+    data = numpy.load(io.BytesIO(_array_to_raw(tile.astype(numpy.uint16), mask, "npy")))
+    assert data.dtype == numpy.uint16
+
+    with pytest.raises(ValueError):
+        _array_to_raw(tile, mask, "bin", compress="lzma")
+
+    assert _empty_tile(16, "bin").startswith(b"RPXT")
+
+
+def test_auto_format():
+    """Should only use JPEG for fully valid 8-bit tiles."""
+    tile = numpy.zeros((3, 16, 16), dtype=numpy.uint8)
+    mask = numpy.full((16, 16), 255, dtype=numpy.uint8)
+    assert _auto_format(tile, mask) == "jpeg"
+    assert _auto_format(tile[:1], mask) == "jpeg"
+    assert _auto_format(tile[:1], mask, color_map=_get_colormap("cfastie")) == "png"
+    assert _auto_format(tile.astype(numpy.uint16), mask) == "png"
+    assert _auto_format(numpy.zeros((4, 16, 16), dtype=numpy.uint8), mask) == "png"
+
+    mask[0, 0] = 0
+    assert _auto_format(tile, mask) == "png"
+    assert _auto_format(tile, mask, webp=True) == "webp"
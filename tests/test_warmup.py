@@ -0,0 +1,60 @@
+"""tests remotepixel_tiler.warmup."""
+
+import numpy
+import pytest
+
+import rasterio
+from affine import Affine
+from mock import Mock
+
+from remotepixel_tiler import reader
+from remotepixel_tiler.utils import _get_colormap
+from remotepixel_tiler.warmup import is_ping, lambda_handler, warmup
+
+
+@pytest.fixture()
+def cog(tmpdir):
+    """Create a small mercator GeoTIFF."""
+    path = str(tmpdir.join("cog.tif"))
+    profile = dict(
+        driver="GTiff",
+        dtype="uint8",
+        count=1,
+        width=64,
+        height=64,
+        crs="epsg:3857",
+        transform=Affine(1000.0, 0.0, 0.0, 0.0, -1000.0, 1000000.0),
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(numpy.ones((1, 64, 64), dtype=numpy.uint8))
+    return path
+
+
+def test_warmup(cog):
+    """Should run every warm-up step."""
+    _get_colormap.cache_clear()
+    timings = warmup(expressions=("(b5-b4)/(b5+b4)", "b1,b2*2"), colormaps=["cfastie"])
+    assert list(timings) == ["gdal", "proj", "colormaps", "expressions", "encoders"]
+    assert _get_colormap.cache_info().currsize == 1
+
+    reader.POOL.clear()
+    timings = warmup(dataset=cog, colormaps=[])
+    assert "dataset" in timings
+    assert len(reader.POOL) == 1
+    reader.POOL.clear()
+
+
+def test_lambda_handler():
+    """Should warm up on ping events and pass other events to the app."""
+    app = Mock(return_value={"statusCode": 200})
+    handler = lambda_handler(app, colormaps=[])
+
+    assert is_ping({"source": "aws.events", "detail-type": "Scheduled Event"})
+    assert is_ping({"warmup": True})
+    assert not is_ping({"path": "/", "httpMethod": "GET"})
+
+    assert "gdal" in handler({"warmup": True}, None)
+    app.assert_not_called()
+
+    assert handler({"path": "/", "httpMethod": "GET"}, None) == {"statusCode": 200}
+    app.assert_called_once()